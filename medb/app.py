@@ -10,6 +10,7 @@ from celery.schedules import schedule
 from flask import Flask
 from flask import render_template
 
+import medb.mail.models  # noqa
 import medb.shiso.models  # noqa
 import medb.shiso.views
 import medb.speedtest.models  # noqa
@@ -106,6 +107,11 @@ def configure_logger(app):
 
 def register_periodic_tasks():
     celery.conf.beat_schedule = {
+        "deliver_email": {
+            "task": "medb.mail.tasks.deliver_email",
+            "schedule": schedule(run_every=timedelta(minutes=1)),
+            "args": (),
+        },
         "regular_speedtest": {
             "task": "medb.speedtest.tasks.perform_speedtest",
             "schedule": crontab(minute=3),
@@ -126,10 +132,20 @@ def register_periodic_tasks():
             "schedule": crontab(hour=9, minute=0),
             "args": (),
         },
+        "cleanup_outbox": {
+            "task": "medb.mail.tasks.cleanup_outbox",
+            "schedule": crontab(hour=9, minute=30),
+            "args": (),
+        },
         "shiso_scheduled_sync": {
             "task": "medb.shiso.tasks.run_scheduled_sync",
             # This is UTC. Would be 8am PDT, 7am PST.
             "schedule": crontab(hour=15, minute=0),
             "args": (),
         },
+        "shiso_resume_deletions": {
+            "task": "medb.shiso.tasks.resume_deletion_jobs",
+            "schedule": crontab(minute="*/15"),
+            "args": (),
+        },
     }
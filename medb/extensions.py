@@ -27,6 +27,7 @@ class CeleryExtension(Celery):
             app.import_name,
             broker=app.config["CELERY_BROKER_URL"],
             include=[
+                "medb.mail.tasks",
                 "medb.shiso.tasks",
                 "medb.speedtest.tasks",
             ],
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Database models for outbound email
+"""
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Text
+
+from medb.database import Model
+from medb.extensions import db
+from medb.model_util import TZDateTime
+from medb.model_util import utcnow
+
+
+class OutboxMessage(Model):
+    """
+    An email waiting to be sent, or which was sent (see outbox.py)
+
+    The message is rendered when it is queued, so delivery needs nothing but
+    the row. A message is pending until either sent or failed is set.
+    """
+
+    __tablename__ = "outbox_message"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    html = Column(Text, nullable=False)
+
+    created = Column(TZDateTime(), nullable=False, default=utcnow)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt = Column(TZDateTime(), nullable=False, default=utcnow)
+    last_error = Column(String, nullable=True)
+    sent = Column(TZDateTime(), nullable=True)
+    failed = Column(TZDateTime(), nullable=True)
+
+    __table_args__ = (db.Index("outbox_message__next_attempt", "next_attempt"),)
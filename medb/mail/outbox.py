@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+An outbox for email
+
+Sending email inline means a slow SMTP server holds up whatever is sending it
+(like the scheduled sync), and a failure raises straight out of it. Instead,
+messages are rendered up front and stored in the outbox table, and a periodic
+task delivers everything which is due over a single authenticated connection.
+A message which can't be sent is retried later, with exponential backoff, until
+it has failed MAX_ATTEMPTS times.
+
+A slow batch can outlast the interval between runs, so each run first claims
+its batch by moving the messages' next attempt past CLAIM_LEASE, in a single
+UPDATE. Overlapping runs therefore never pick up the same messages, and if a
+run dies, whatever it hadn't sent becomes due again once the lease is over.
+
+Sent and failed messages are kept for RETENTION_DAYS, for troubleshooting,
+and then deleted in batches by purge_outbox().
+"""
+import datetime
+import logging
+import smtplib
+import time
+import typing as t
+from email.message import EmailMessage
+
+import sqlalchemy
+
+from medb.extensions import db
+from medb.model_util import utcnow
+from medb.settings import SMTP_PASS
+from medb.settings import SMTP_PORT
+from medb.settings import SMTP_SENDER
+from medb.settings import SMTP_SERVER
+from medb.settings import SMTP_USE_SSL
+
+from .models import OutboxMessage
+
+# Messages sent per connection, and per run of the delivery task
+DELIVERY_BATCH_SIZE = 100
+# Seconds to wait on the SMTP server before giving up until the next attempt
+SMTP_TIMEOUT = 30
+
+# Longer than a whole batch can take to send, at SMTP_TIMEOUT per message
+CLAIM_LEASE = datetime.timedelta(hours=1)
+
+MAX_ATTEMPTS = 8
+RETRY_DELAY = datetime.timedelta(minutes=1)
+MAX_RETRY_DELAY = datetime.timedelta(hours=6)
+
+RETENTION_DAYS = 30
+PURGE_BATCH_SIZE = 1000
+PURGE_PAUSE = 0.1
+
+
+def queue_email(subject: str, to: str, text: str, html: str) -> OutboxMessage:
+    """
+    Add a message with text and HTML bodies to the outbox
+    """
+    message = OutboxMessage(recipient=to, subject=subject, text=text, html=html)
+    db.session.add(message)
+    db.session.commit()
+    return message
+
+
+def build_message(message: OutboxMessage) -> EmailMessage:
+    """
+    Make a MIME multipart/alternative message, with both text and HTML
+    """
+    msg = EmailMessage()
+    msg["Subject"] = message.subject
+    msg["From"] = SMTP_SENDER
+    msg["To"] = message.recipient
+    msg.set_content(message.text)
+    msg.add_alternative(message.html, subtype="html")
+    return msg
+
+
+def connect() -> smtplib.SMTP:
+    """
+    Connect to the configured SMTP server, and log in if there's a password
+    """
+    smtp: smtplib.SMTP
+    if SMTP_USE_SSL:
+        smtp = smtplib.SMTP_SSL(
+            host=SMTP_SERVER, port=int(SMTP_PORT), timeout=SMTP_TIMEOUT
+        )
+    else:
+        smtp = smtplib.SMTP(
+            host=SMTP_SERVER, port=int(SMTP_PORT), timeout=SMTP_TIMEOUT
+        )
+    try:
+        if SMTP_PASS:
+            smtp.login(SMTP_SENDER, SMTP_PASS)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+def _retry_later(message: OutboxMessage, error: str) -> None:
+    message.attempts += 1
+    message.last_error = error
+    if message.attempts >= MAX_ATTEMPTS:
+        message.failed = utcnow()
+        logging.error(
+            "Giving up on email %d to %s: %s",
+            message.id,
+            message.recipient,
+            error,
+        )
+    else:
+        delay = min(RETRY_DELAY * 2 ** (message.attempts - 1), MAX_RETRY_DELAY)
+        message.next_attempt = utcnow() + delay
+        logging.warning(
+            "Email %d to %s failed, retrying in %s: %s",
+            message.id,
+            message.recipient,
+            delay,
+            error,
+        )
+
+
+def claim_due_messages(limit: int) -> t.List[OutboxMessage]:
+    """
+    Claim up to limit messages which are due, and return them. The claim is
+    committed, so that other runs skip these messages until CLAIM_LEASE is
+    over, unless they're sent or rescheduled before then.
+    """
+    now = utcnow()
+    due = (
+        OutboxMessage.sent.is_(None),
+        OutboxMessage.failed.is_(None),
+        OutboxMessage.next_attempt <= now,
+    )
+    batch = (
+        sqlalchemy.select(OutboxMessage.id)
+        .where(*due)
+        .order_by(OutboxMessage.next_attempt, OutboxMessage.id)
+        .limit(limit)
+    )
+    # The due conditions are checked again by the UPDATE itself, which SQLite
+    # runs atomically, so a message can only be claimed by one run.
+    ids = db.session.scalars(
+        sqlalchemy.update(OutboxMessage)
+        .where(OutboxMessage.id.in_(batch), *due)
+        .values(next_attempt=now + CLAIM_LEASE)
+        .returning(OutboxMessage.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    if not ids:
+        return []
+    return (
+        OutboxMessage.query.filter(OutboxMessage.id.in_(ids))
+        .order_by(OutboxMessage.id)
+        .all()
+    )
+
+
+def _release(messages: t.Iterable[OutboxMessage]) -> None:
+    # Give up the claim on messages which weren't attempted, so the next run
+    # can send them
+    now = utcnow()
+    for message in messages:
+        message.next_attempt = now
+
+
+def deliver_outbox(batch_size: int = DELIVERY_BATCH_SIZE) -> int:
+    """
+    Send the messages which are due over one connection, returning how many
+    were sent. Each message is committed as soon as it is sent.
+    """
+    messages = claim_due_messages(batch_size)
+    if not messages:
+        return 0
+    try:
+        smtp = connect()
+    except OSError as e:
+        # Including SMTPException: nothing could be sent, so every message
+        # counts as attempted.
+        for message in messages:
+            _retry_later(message, f"Connecting: {e}")
+        db.session.commit()
+        return 0
+
+    sent = 0
+    with smtp:
+        for i, message in enumerate(messages):
+            try:
+                smtp.send_message(build_message(message))
+            except smtplib.SMTPServerDisconnected as e:
+                # The rest of the batch waits for the next run
+                _retry_later(message, str(e))
+                _release(messages[i + 1 :])
+                db.session.commit()
+                break
+            except (
+                smtplib.SMTPRecipientsRefused,
+                smtplib.SMTPResponseException,
+            ) as e:
+                # Only this message was rejected, the connection is still good
+                _retry_later(message, str(e))
+            except OSError as e:
+                _retry_later(message, str(e))
+                _release(messages[i + 1 :])
+                db.session.commit()
+                break
+            else:
+                message.attempts += 1
+                message.sent = utcnow()
+                sent += 1
+            db.session.commit()
+    logging.info("Sent %d of %d emails", sent, len(messages))
+    return sent
+
+
+def purge_outbox(
+    retention_days: int = RETENTION_DAYS,
+    batch_size: int = PURGE_BATCH_SIZE,
+    pause: float = PURGE_PAUSE,
+) -> int:
+    """
+    Delete messages which were sent, or given up on, more than retention_days
+    ago, a batch at a time like the speedtest retention engine. Returns the
+    number of messages deleted.
+    """
+    boundary = utcnow() - datetime.timedelta(days=retention_days)
+    total = 0
+    while True:
+        ids: t.Sequence[int] = db.session.scalars(
+            sqlalchemy.select(OutboxMessage.id)
+            .where(
+                sqlalchemy.or_(
+                    OutboxMessage.sent <= boundary,
+                    OutboxMessage.failed <= boundary,
+                )
+            )
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.session.execute(
+            sqlalchemy.delete(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    logging.info("Purged %d old emails from the outbox", total)
+    return total
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Celery tasks for outbound email
+"""
+from medb.extensions import celery
+
+from .outbox import deliver_outbox
+from .outbox import purge_outbox
+
+
+@celery.task
+def deliver_email():
+    deliver_outbox()
+
+
+@celery.task
+def cleanup_outbox():
+    purge_outbox()
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 import datetime
+import functools
+import typing as t
+from decimal import ROUND_HALF_EVEN
 from decimal import Decimal
 
 import sqlalchemy.types as types
@@ -27,13 +30,141 @@ class TZDateTime(types.TypeDecorator):
         return value
 
 
+@functools.total_ordering
+class Money:
+    """
+    An exact amount of money, held as an integer number of thousandths
+
+    This is the resolution of the SafeNumeric(16, 3) columns, so values from
+    the database convert without any loss, and adding them up is integer
+    arithmetic rather than Decimal arithmetic. Money only combines with other
+    Money: mixing in a float or Decimal is a TypeError, rather than a silent
+    loss of exactness.
+    """
+
+    __slots__ = ("millis",)
+
+    SCALE = 3
+
+    def __init__(self, millis: int = 0):
+        self.millis = millis
+
+    @classmethod
+    def of(cls, value: t.Union["Money", Decimal, int, str]) -> "Money":
+        """
+        Convert an amount in whole units (e.g. "12.34") to Money, rounding
+        any digits past the thousandths
+        """
+        if isinstance(value, Money):
+            return value
+        millis = Decimal(value).scaleb(cls.SCALE)
+        return cls(int(millis.quantize(Decimal(1), ROUND_HALF_EVEN)))
+
+    @classmethod
+    def total(cls, values: t.Iterable["Money"]) -> "Money":
+        """
+        Add up many amounts. This is quicker than sum(), which creates a Money
+        for every partial sum along the way.
+        """
+        return cls(sum(value.millis for value in values))
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.millis).scaleb(-self.SCALE)
+
+    def halve(self) -> "Money":
+        """
+        Return half of this amount, rounded toward zero like storing
+        amount / 2 in a SafeNumeric column always was
+        """
+        half = abs(self.millis) // 2
+        return Money(half if self.millis >= 0 else -half)
+
+    # Arithmetic is on the hot path of reports, so other is assumed to be
+    # Money, and checked only when that fails.
+
+    def __add__(self, other: t.Any) -> "Money":
+        try:
+            return Money(self.millis + other.millis)
+        except AttributeError:
+            if isinstance(other, int) and not other:
+                # For sum(), which starts from 0
+                return self
+            return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other: t.Any) -> "Money":
+        try:
+            return Money(self.millis - other.millis)
+        except AttributeError:
+            return NotImplemented
+
+    def __neg__(self) -> "Money":
+        return Money(-self.millis)
+
+    def __abs__(self) -> "Money":
+        return Money(abs(self.millis))
+
+    def __bool__(self) -> bool:
+        return bool(self.millis)
+
+    def __eq__(self, other: t.Any) -> bool:
+        if isinstance(other, Money):
+            return self.millis == other.millis
+        return NotImplemented
+
+    def __lt__(self, other: t.Any) -> bool:
+        if isinstance(other, Money):
+            return self.millis < other.millis
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.millis)
+
+    def __float__(self) -> float:
+        return self.millis / 10**self.SCALE
+
+    def __str__(self) -> str:
+        sign = "-" if self.millis < 0 else ""
+        units, millis = divmod(abs(self.millis), 10**self.SCALE)
+        return f"{sign}{units}.{millis:03d}"
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def __format__(self, spec: str) -> str:
+        if spec == ".2f":
+            # The usual way to show an amount, so it's done with integers.
+            # Rounding matches Decimal's: half to even.
+            millis = abs(self.millis)
+            cents = (millis + 5) // 10
+            if millis % 20 == 5:
+                cents -= 1
+            sign = "-" if self.millis < 0 else ""
+            return "%s%d.%02d" % (sign, cents // 100, cents % 100)
+        if not spec:
+            return str(self)
+        return format(self.to_decimal(), spec)
+
+
 class SafeNumeric(types.TypeDecorator):
 
     impl = types.Numeric
+    cache_ok = True
 
-    def __init__(self, precision, scale, *args, **kwargs):
-        super().__init__(self, precision, scale, *args, **kwargs)
-        self._scale = scale
+    def __init__(self, precision, scale, as_money=False, **kwargs):
+        """
+        With as_money=True, values are returned as Money rather than Decimal.
+        Either can be stored.
+        """
+        super().__init__(precision, scale, **kwargs)
+        if as_money and scale != Money.SCALE:
+            raise ValueError(f"Money columns must have scale {Money.SCALE}")
+        # Part of the statement cache key, see cache_ok. Only named arguments
+        # of __init__ are included, so as_money can't be keyword-only.
+        self.precision = precision
+        self.scale = scale
+        self.as_money = as_money
 
     def load_dialect_impl(self, dialect):
         if isinstance(dialect, SQLiteDialect):
@@ -44,17 +175,35 @@ class SafeNumeric(types.TypeDecorator):
     def process_bind_param(self, value, dialect):
         if value is None:
             return None
+        if isinstance(value, Money):
+            if isinstance(dialect, SQLiteDialect) and self.scale == Money.SCALE:
+                return value.millis
+            value = value.to_decimal()
         if not isinstance(value, Decimal):
             raise TypeError("Numeric literals should be decimal")
         if isinstance(dialect, SQLiteDialect):
-            return int(value.shift(self._scale))
+            return int(value.shift(self.scale))
         else:
             return value
 
+    def result_processor(self, dialect, coltype):
+        if self.as_money and isinstance(dialect, SQLiteDialect):
+            # Every money value loaded goes through here, so skip the generic
+            # TypeDecorator processing for the common case.
+            def process(value):
+                return None if value is None else Money(value)
+
+            return process
+        return super().result_processor(dialect, coltype)
+
     def process_result_value(self, value, dialect):
         if value is None:
             return None
         if isinstance(dialect, SQLiteDialect):
-            return Decimal(value) / (10**self._scale)
+            if self.as_money:
+                return Money(value)
+            return Decimal(value) / (10**self.scale)
+        elif self.as_money:
+            return Money.of(value)
         else:
             return Decimal(value)
@@ -26,9 +26,13 @@ PLAID_CLIENT_ID = env.str("PLAID_CLIENT_ID")
 PLAID_SECRET = env.str("PLAID_SECRET")
 PLAID_ENV = env.str("PLAID_ENV")
 
+SPEEDTEST_ARCHIVE_DIR = env.path("SPEEDTEST_ARCHIVE_DIR", default=None)
+
 SMTP_PASS = env.str("SMTP_PASS")
 SMTP_PORT = env.str("SMTP_PORT")
 SMTP_SENDER = env.str("SMTP_SENDER")
 SMTP_SERVER = env.str("SMTP_SERVER")
+# Connect with SSL from the start, otherwise plain SMTP (e.g. a local relay)
+SMTP_USE_SSL = env.bool("SMTP_USE_SSL", default=True)
 
 DEPLOY = env.str("MEDB_DEPLOY", default="(development, no deploy info)")
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Delete linked accounts, or all of a user's linked data, in the background
+
+This is tricky because we have several tables which have foreign key
+constraints. Transactions have reviews, and the review object may lead or be a
+member of a transaction group, along with reviews from other accounts. Then,
+transactions may also be part of a subscription, or matched by a category rule
+for the account. Graphically:
+
+    User <- Item <- Account <- Transaction <- Review <-> Group
+                     ^-- Subscription <-|
+                     ^-- CategoryRule <-|
+
+Doing each table with one big statement holds the SQLite write lock for the
+whole deletion, which blocks the ping task and web requests. Instead, a
+DeletionJob goes through the stages below in order, each a batch of rows at a
+time in its own short transaction, with a pause in between so other writers get
+a turn (like the speedtest retention engine). Each batch only selects rows which
+still need to be handled, so an interrupted job just picks up its stage again.
+"""
+import datetime
+import logging
+import time
+import typing as t
+
+import sqlalchemy
+
+from medb.database import Model
+from medb.extensions import db
+from medb.model_util import utcnow
+from medb.user.models import User
+
+from .models import CategoryRule
+from .models import CategorySummary
+from .models import DeletionJob
+from .models import Subscription
+from .models import Transaction
+from .models import TransactionGroup
+from .models import TransactionReview
+from .models import UserPlaidAccount
+from .models import UserPlaidItem
+from .summary import refresh_group_totals
+
+DELETE_BATCH_SIZE = 1000
+BATCH_PAUSE = 0.1
+
+# Unfinished jobs which haven't made progress for this long are resumed by
+# resume_stalled_jobs(), since whatever was running them must have died.
+STALLED_AFTER = datetime.timedelta(minutes=10)
+
+DONE = "done"
+
+# Handles a batch of an account's rows, returning how many there were
+Stage = t.Callable[[int, int], int]
+
+
+def _delete_batch(
+    model: t.Type[Model],
+    batch_size: int,
+    *where: sqlalchemy.ColumnElement[bool],
+) -> int:
+    table = model.__table__
+    ids = db.session.scalars(
+        sqlalchemy.select(table.c.id).where(*where).limit(batch_size)
+    ).all()
+    if ids:
+        db.session.execute(sqlalchemy.delete(table).where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+def _account_transactions(
+    account_id: int,
+) -> sqlalchemy.Select[t.Tuple[int]]:
+    return sqlalchemy.select(Transaction.id).where(
+        Transaction.account_id == account_id
+    )
+
+
+def _delete_led_groups(account_id: int, batch_size: int) -> int:
+    """
+    Delete the groups led by the account's reviews. Their members from other
+    accounts just aren't grouped anymore.
+    """
+    group_ids: t.Sequence[int] = db.session.scalars(
+        sqlalchemy.select(TransactionGroup.id)
+        .join(
+            TransactionReview,
+            TransactionGroup.leader_id == TransactionReview.id,
+        )
+        .join(Transaction)
+        .where(Transaction.account_id == account_id)
+        .limit(batch_size)
+    ).all()
+    if group_ids:
+        db.session.execute(
+            sqlalchemy.update(TransactionReview)
+            .where(TransactionReview.group_id.in_(group_ids))
+            .values(group_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            sqlalchemy.delete(TransactionGroup)
+            .where(TransactionGroup.id.in_(group_ids))
+            .execution_options(synchronize_session=False)
+        )
+    return len(group_ids)
+
+
+def _leave_groups(account_id: int, batch_size: int) -> int:
+    """
+    Take the account's reviews out of groups led by other accounts
+    """
+    rows: t.Sequence[t.Tuple[int, int]] = (
+        db.session.execute(
+            sqlalchemy.select(TransactionReview.id, TransactionReview.group_id)
+            .join(Transaction)
+            .where(
+                Transaction.account_id == account_id,
+                TransactionReview.group_id.isnot(None),
+            )
+            .limit(batch_size)
+        )
+        .tuples()
+        .all()
+    )
+    if rows:
+        db.session.execute(
+            sqlalchemy.update(TransactionReview)
+            .where(TransactionReview.id.in_([rev_id for rev_id, _ in rows]))
+            .values(group_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        refresh_group_totals({group_id for _, group_id in rows})
+    return len(rows)
+
+
+def _unlink_subscriptions(account_id: int, batch_size: int) -> int:
+    subscriptions: sqlalchemy.Select[t.Tuple[int]] = sqlalchemy.select(
+        Subscription.id
+    ).where(Subscription.account_id == account_id)
+    txn_ids: t.Sequence[int] = db.session.scalars(
+        sqlalchemy.select(Transaction.id)
+        .where(Transaction.subscription_id.in_(subscriptions))
+        .limit(batch_size)
+    ).all()
+    if txn_ids:
+        db.session.execute(
+            sqlalchemy.update(Transaction)
+            .where(Transaction.id.in_(txn_ids))
+            .values(subscription_id=None)
+            .execution_options(synchronize_session=False)
+        )
+    return len(txn_ids)
+
+
+def _unlink_rules(account_id: int, batch_size: int) -> int:
+    # Transactions from other accounts can still refer to the account's rules,
+    # if they were matched before the rule was limited to the account.
+    rules: sqlalchemy.Select[t.Tuple[int]] = sqlalchemy.select(
+        CategoryRule.id
+    ).where(CategoryRule.account_id == account_id)
+    txn_ids: t.Sequence[int] = db.session.scalars(
+        sqlalchemy.select(Transaction.id)
+        .where(Transaction.rule_id.in_(rules))
+        .limit(batch_size)
+    ).all()
+    if txn_ids:
+        db.session.execute(
+            sqlalchemy.update(Transaction)
+            .where(Transaction.id.in_(txn_ids))
+            .values(rule_id=None)
+            .execution_options(synchronize_session=False)
+        )
+    return len(txn_ids)
+
+
+STAGES: t.List[t.Tuple[str, Stage]] = [
+    ("groups", _delete_led_groups),
+    ("group_members", _leave_groups),
+    ("subscription_refs", _unlink_subscriptions),
+    (
+        "subscriptions",
+        lambda account_id, n: _delete_batch(
+            Subscription, n, Subscription.account_id == account_id
+        ),
+    ),
+    (
+        "reviews",
+        lambda account_id, n: _delete_batch(
+            TransactionReview,
+            n,
+            TransactionReview.transaction_id.in_(
+                _account_transactions(account_id)
+            ),
+        ),
+    ),
+    (
+        "summaries",
+        lambda account_id, n: _delete_batch(
+            CategorySummary, n, CategorySummary.account_id == account_id
+        ),
+    ),
+    ("rule_refs", _unlink_rules),
+    (
+        "rules",
+        lambda account_id, n: _delete_batch(
+            CategoryRule, n, CategoryRule.account_id == account_id
+        ),
+    ),
+    (
+        "transactions",
+        lambda account_id, n: _delete_batch(
+            Transaction, n, Transaction.account_id == account_id
+        ),
+    ),
+    (
+        "account",
+        lambda account_id, n: _delete_batch(
+            UserPlaidAccount, n, UserPlaidAccount.id == account_id
+        ),
+    ),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+
+
+def start_deletion(
+    user: User, account: t.Optional[UserPlaidAccount] = None
+) -> DeletionJob:
+    """
+    Create a job to delete an account of the user, or all of their items and
+    accounts. The job still needs to be run, see tasks.run_deletion_job.
+    """
+    job = DeletionJob(
+        user_id=user.id,
+        account_id=account.id if account else None,
+        stage=STAGE_NAMES[0],
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _delete_account(
+    job: DeletionJob, account_id: int, batch_size: int, pause: float
+) -> None:
+    """
+    Run the stages for an account, starting at the job's stage. The job moves
+    on to the next stage in the same transaction as the last batch of the
+    current one, and after the last stage, back to the first one for the next
+    account.
+    """
+    start = STAGE_NAMES.index(job.stage)
+    for i, (name, stage) in enumerate(STAGES[start:], start):
+        while True:
+            count = stage(account_id, batch_size)
+            job.rows_processed += count
+            job.updated = utcnow()
+            if count < batch_size:
+                job.stage = STAGE_NAMES[(i + 1) % len(STAGES)]
+                db.session.commit()
+                break
+            db.session.commit()
+            time.sleep(pause)
+    logging.info(
+        "Deletion job %d: deleted account %d, %d rows so far",
+        job.id,
+        account_id,
+        job.rows_processed,
+    )
+
+
+def _next_account(user_id: int) -> t.Optional[int]:
+    return db.session.scalars(
+        sqlalchemy.select(UserPlaidAccount.id)
+        .join(UserPlaidItem)
+        .where(UserPlaidItem.user_id == user_id)
+        .order_by(UserPlaidAccount.id)
+        .limit(1)
+    ).first()
+
+
+def run_job(
+    job: DeletionJob,
+    batch_size: int = DELETE_BATCH_SIZE,
+    pause: float = BATCH_PAUSE,
+) -> None:
+    """
+    Run a deletion job to the end, from wherever it got to
+    """
+    if job.finished:
+        return
+    if job.account_id is not None:
+        _delete_account(job, job.account_id, batch_size, pause)
+    else:
+        # Accounts are deleted in order, so the first one left is the one the
+        # job's stage refers to.
+        account_id = _next_account(job.user_id)
+        while account_id is not None:
+            _delete_account(job, account_id, batch_size, pause)
+            account_id = _next_account(job.user_id)
+        job.rows_processed += _delete_batch(
+            UserPlaidItem, batch_size, UserPlaidItem.user_id == job.user_id
+        )
+    job.stage = DONE
+    job.updated = job.finished = utcnow()
+    db.session.commit()
+    logging.info(
+        "Deletion job %d: finished, %d rows", job.id, job.rows_processed
+    )
+
+
+def get_unfinished_jobs() -> t.List[DeletionJob]:
+    return (
+        DeletionJob.query.filter(DeletionJob.finished.is_(None))
+        .order_by(DeletionJob.id)
+        .all()
+    )
+
+
+def resume_stalled_jobs() -> None:
+    stalled_before = utcnow() - STALLED_AFTER
+    for job in get_unfinished_jobs():
+        if job.updated < stalled_before:
+            logging.warning(
+                "Deletion job %d stalled in stage %s, resuming",
+                job.id,
+                job.stage,
+            )
+            run_job(job)
+
+
+def accounts_being_deleted(user: User) -> t.Set[int]:
+    """
+    Return the IDs of the user's accounts which unfinished jobs are deleting
+    """
+    jobs = DeletionJob.query.filter(
+        DeletionJob.user_id == user.id,
+        DeletionJob.finished.is_(None),
+    ).all()
+    if any(job.account_id is None for job in jobs):
+        return set(
+            db.session.scalars(
+                sqlalchemy.select(UserPlaidAccount.id)
+                .join(UserPlaidItem)
+                .where(UserPlaidItem.user_id == user.id)
+            )
+        )
+    return {job.account_id for job in jobs}
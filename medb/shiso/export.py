@@ -0,0 +1,232 @@
+"""
+Exports of reviewed transactions for analysis elsewhere
+
+An export takes the same filters as the transaction listing, and produces one
+row per transaction with its review, category parent and group. Rows are read
+from the database in fixed-size batches and written out as they arrive, so an
+export of any size runs in constant memory and can be streamed straight into
+an HTTP response or a file.
+
+CSV and JSON Lines are always available. Parquet needs pyarrow, which is an
+optional dependency: without it, the format is reported as unavailable.
+"""
+
+import csv
+import datetime
+import io
+import json
+import typing as t
+
+from sqlalchemy.sql import ColumnElement
+from toolz import partition_all
+
+from medb.model_util import Money
+from medb.user.models import User
+
+from .logic import user_transactions_query
+from .models import CATEGORY_PARENT_V2
+from .models import Transaction
+from .models import TransactionReview
+from .models import UserPlaidAccount
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows fetched from the database at a time, and written per Parquet row group
+EXPORT_BATCH_SIZE = 1000
+
+Row = t.Dict[str, t.Any]
+
+# Exported columns which come straight from the database
+_COLUMNS: t.List[t.Tuple[str, ColumnElement[t.Any]]] = [
+    ("id", Transaction.id),
+    ("account_id", Transaction.account_id),
+    ("account", UserPlaidAccount.name),
+    ("original_date", Transaction.original_date),
+    ("date", Transaction.date),
+    ("posted", Transaction.posted),
+    ("name", Transaction.name),
+    ("merchant", Transaction.plaid_merchant_name),
+    ("plaid_category_id", Transaction.plaid_category_id),
+    ("subscription_id", Transaction.subscription_id),
+    ("amount", Transaction.amount),
+    ("reimbursement_amount", TransactionReview.reimbursement_amount),
+    ("other_reimbursement", TransactionReview.other_reimbursement),
+    ("category", TransactionReview.category),
+    ("group_id", TransactionReview.group_id),
+    ("notes", TransactionReview.notes),
+]
+
+# Every exported column, including those computed in export_rows()
+FIELDS = [name for name, _ in _COLUMNS] + ["share", "category_parent"]
+
+
+def export_rows(
+    user: User,
+    start_date: t.Optional[datetime.date] = None,
+    end_date: t.Optional[datetime.date] = None,
+    categories: t.Optional[t.Iterable[str]] = None,
+    accounts: t.Optional[t.Container[int]] = None,
+    merchant: t.Optional[str] = None,
+    name: t.Optional[str] = None,
+    search: t.Optional[str] = None,
+) -> t.Iterator[t.List[Row]]:
+    """
+    Yield batches of export rows, oldest transaction first
+
+    The filters are the same as get_all_user_transactions(). Only columns are
+    selected, not ORM objects, so nothing accumulates in the session.
+    """
+    query = (
+        user_transactions_query(
+            user,
+            start_date,
+            end_date,
+            categories,
+            accounts,
+            merchant,
+            name,
+            search,
+        )
+        .with_entities(*(column for _, column in _COLUMNS))
+        .order_by(Transaction.original_date, Transaction.id)
+    )
+    names = [name for name, _ in _COLUMNS]
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+    for partition in partition_all(EXPORT_BATCH_SIZE, rows):
+        batch = []
+        for values in partition:
+            row = dict(zip(names, values))
+            row["share"] = (
+                row["amount"]
+                - row["reimbursement_amount"]
+                - row["other_reimbursement"]
+            )
+            row["category_parent"] = CATEGORY_PARENT_V2.get(row["category"])
+            batch.append(row)
+        yield batch
+
+
+def write_csv(batches: t.Iterable[t.List[Row]]) -> t.Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    # The header, when there are no rows at all
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _json_value(value: t.Any) -> t.Any:
+    if isinstance(value, Money):
+        # Amounts have three decimal places at most, which a float's repr
+        # always writes back out exactly.
+        return float(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def write_jsonl(batches: t.Iterable[t.List[Row]]) -> t.Iterator[bytes]:
+    for batch in batches:
+        lines = (
+            json.dumps({k: _json_value(v) for k, v in row.items()})
+            for row in batch
+        )
+        yield "".join(line + "\n" for line in lines).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    A write-only file which just collects what is written to it, so that the
+    Parquet writer's output can be handed out a row group at a time
+    """
+
+    def __init__(self) -> None:
+        self.chunks: t.List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: t.Any) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _parquet_schema() -> "pyarrow.Schema":
+    amount = pyarrow.decimal128(16, 3)
+    return pyarrow.schema(
+        [
+            ("id", pyarrow.int64()),
+            ("account_id", pyarrow.int64()),
+            ("account", pyarrow.string()),
+            ("original_date", pyarrow.date32()),
+            ("date", pyarrow.date32()),
+            ("posted", pyarrow.bool_()),
+            ("name", pyarrow.string()),
+            ("merchant", pyarrow.string()),
+            ("plaid_category_id", pyarrow.string()),
+            ("subscription_id", pyarrow.int64()),
+            ("amount", amount),
+            ("reimbursement_amount", amount),
+            ("other_reimbursement", amount),
+            ("category", pyarrow.string()),
+            ("group_id", pyarrow.int64()),
+            ("notes", pyarrow.string()),
+            ("share", amount),
+            ("category_parent", pyarrow.string()),
+        ]
+    )
+
+
+def write_parquet(batches: t.Iterable[t.List[Row]]) -> t.Iterator[bytes]:
+    assert pyarrow is not None, "Parquet export requires pyarrow"
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            rows = [
+                {
+                    k: v.to_decimal() if isinstance(v, Money) else v
+                    for k, v in row.items()
+                }
+                for row in batch
+            ]
+            writer.write_batch(
+                pyarrow.RecordBatch.from_pylist(rows, schema=schema)
+            )
+            yield sink.take()
+    yield sink.take()
+
+
+class ExportFormat(t.NamedTuple):
+    write: t.Callable[[t.Iterable[t.List[Row]]], t.Iterator[bytes]]
+    mimetype: str
+
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat(write_csv, "text/csv"),
+    "jsonl": ExportFormat(write_jsonl, "application/jsonl"),
+    "parquet": ExportFormat(write_parquet, "application/vnd.apache.parquet"),
+}
+
+
+def available_formats() -> t.List[str]:
+    """
+    Return the export formats which can be used with what's installed
+    """
+    if pyarrow is None:
+        return ["csv", "jsonl"]
+    return list(EXPORT_FORMATS)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Public forms."""
+import re
 import typing as t
 from datetime import date
 from datetime import timedelta
@@ -10,7 +11,10 @@ from wtforms.fields import BooleanField
 from wtforms.fields import DateField
 from wtforms.fields import DecimalField
 from wtforms.fields import Field
+from wtforms.fields import FieldList
+from wtforms.fields import FormField
 from wtforms.fields import HiddenField
+from wtforms.fields import IntegerField
 from wtforms.fields import RadioField
 from wtforms.fields import SelectField
 from wtforms.fields import SelectMultipleField
@@ -18,13 +22,19 @@ from wtforms.fields import StringField
 from wtforms.fields import SubmitField
 from wtforms.form import Form
 from wtforms.validators import DataRequired
+from wtforms.validators import NumberRange
 from wtforms.validators import Optional
 from wtforms.validators import ValidationError
 from wtforms.widgets import HiddenInput
 
+from medb.model_util import Money
+
 from .models import CATEGORIES_V2
 from .models import LEAF_CATEGORIES_V2
+from .models import CategoryRule
+from .models import PaymentChannel
 from .models import Transaction
+from .rules import compile_pattern
 
 
 def category_choices(with_pick: bool = False, include_inner: bool = False):
@@ -117,8 +127,10 @@ class TransactionReviewForm(FlaskForm):
     )
     notes = StringField()
 
-    def validate_reimbursement_amount(self, field: Field):
-        if self.reimbursement_type.data == "Custom" and field.data is None:
+    def validate_reimbursement_type(self, field: Field):
+        # Checked here, since the Optional() validator of an empty amount
+        # field stops its validation before any inline validator runs.
+        if field.data == "Custom" and self.reimbursement_amount.data is None:
             raise ValidationError(
                 "You must provide a custom reimbursement amount"
             )
@@ -134,13 +146,15 @@ class TransactionReviewForm(FlaskForm):
         if txn.review:
             if txn.review.reimbursement_amount == txn.amount:
                 data["reimbursement_type"] = "Full"
-            elif txn.review.reimbursement_amount == Decimal(0):
+            elif not txn.review.reimbursement_amount:
                 data["reimbursement_type"] = "None"
-            elif txn.review.reimbursement_amount == txn.amount / 2:
+            elif txn.review.reimbursement_amount == txn.amount.halve():
                 data["reimbursement_type"] = "Half"
             else:
                 data["reimbursement_type"] = "Custom"
-            data["reimbursement_amount"] = txn.review.reimbursement_amount
+            data["reimbursement_amount"] = (
+                txn.review.reimbursement_amount.to_decimal()
+            )
             data["notes"] = txn.review.notes
             data["category"] = txn.review.category
         elif category_guess:
@@ -149,6 +163,69 @@ class TransactionReviewForm(FlaskForm):
         return form
 
 
+SKIP_CATEGORY = "<Pick a Category>"
+
+
+def validate_category_or_skip(form: Form, field: Field):
+    if field.data != SKIP_CATEGORY:
+        validate_category(form, field)
+
+
+class BatchReviewEntryForm(Form):
+    """One transaction of a BatchReviewForm. These have the same fields as a
+    TransactionReviewForm, except that leaving the category unpicked skips
+    the transaction."""
+
+    transaction_id = IntegerField(
+        widget=HiddenInput(), validators=[DataRequired()]
+    )
+    reimbursement_type = RadioField(
+        choices=["None", "Half", "Full", "Custom"],
+        default="None",
+        validators=[DataRequired()],
+    )
+    reimbursement_amount = DecimalField(places=2, validators=[Optional()])
+    other_reimbursement = DecimalField(
+        places=2, default=0, validators=[Optional()]
+    )
+    category = SelectField(
+        choices=category_choices(True),
+        validators=[DataRequired(), validate_category_or_skip],
+        default=SKIP_CATEGORY,
+    )
+    notes = StringField()
+
+    def validate_reimbursement_type(self, field: Field):
+        if field.data == "Custom" and self.reimbursement_amount.data is None:
+            raise ValidationError(
+                "You must provide a custom reimbursement amount"
+            )
+
+    @property
+    def skipped(self) -> bool:
+        return self.category.data == SKIP_CATEGORY
+
+
+class BatchReviewForm(FlaskForm):
+    """Reviews many transactions at once"""
+
+    transactions = FieldList(FormField(BatchReviewEntryForm))
+
+    @classmethod
+    def create(
+        cls,
+        txns: t.Iterable[Transaction],
+        category_guesses: t.Mapping[int, str],
+    ) -> "BatchReviewForm":
+        entries = []
+        for txn in txns:
+            entry: t.Dict[str, t.Any] = {"transaction_id": txn.id}
+            if txn.id in category_guesses:
+                entry["category"] = category_guesses[txn.id]
+            entries.append(entry)
+        return cls(data={"transactions": entries})
+
+
 class SubscriptionReviewForm(FlaskForm):
     """Used to update subscriptions"""
 
@@ -172,6 +249,54 @@ class AccountReportForm(Form):
             raise ValidationError("Start date must come before end date")
 
 
+class TrendReportForm(Form):
+
+    start_date = DateField("Start Month", validators=[DataRequired()])
+    end_date = DateField("End Month", validators=[DataRequired()])
+    period = SelectField(
+        "Period",
+        choices=[
+            ("month", "Month"),
+            ("quarter", "Quarter"),
+            ("year", "Year"),
+        ],
+        default="month",
+    )
+    measure = SelectField(
+        "Amount",
+        choices=[
+            ("share", "My Share"),
+            ("reimbursed", "Paige"),
+            ("all", "Total"),
+        ],
+        default="share",
+    )
+    view = SelectField(
+        "Show",
+        choices=[
+            ("values", "Amounts"),
+            ("deltas", "Change from previous period"),
+            ("rolling", "Rolling average"),
+        ],
+        default="values",
+    )
+    window = IntegerField(
+        "Rolling Window (periods)",
+        default=3,
+        validators=[NumberRange(min=1, max=36)],
+    )
+    by_parent = BooleanField("Group by Parent Category")
+    include_transfer = BooleanField("Include Transfers")
+
+    def validate_end_date(self, field: Field):
+        if (
+            self.end_date.data
+            and self.start_date.data
+            and self.end_date.data < self.start_date.data
+        ):
+            raise ValidationError("Start date must come before end date")
+
+
 # NOTE: not FlaskForm since submitted via GET, no need for CSRF
 class TransactionListForm(Form):
 
@@ -185,6 +310,7 @@ class TransactionListForm(Form):
     )
     merchant = HiddenField("Merchant")
     name = HiddenField("Name")
+    search = StringField("Search", validators=[Optional()])
 
     def validate_end_date(self, field: Field):
         if (
@@ -217,13 +343,25 @@ class TransactionListField(Field):
 
 
 class TransactionBulkUpdateForm(FlaskForm):
+    """Changes the reviews of the selected transactions. Fields left at their
+    defaults are not changed. The group choices are set by the view."""
 
     category = SelectField(
         "Categories",
         choices=category_choices(True),
-        validators=[validate_category],
-        default="<Pick a Category>",
+        validators=[validate_category_or_skip],
+        default=SKIP_CATEGORY,
+    )
+    reimbursement_type = SelectField(
+        "Reimbursement",
+        choices=[("", "<Reimbursement>")]
+        + [(c, c) for c in ("None", "Half", "Full", "Custom")],
+        default="",
     )
+    reimbursement_amount = DecimalField(places=2, validators=[Optional()])
+    other_reimbursement = DecimalField(places=2, validators=[Optional()])
+    notes = StringField("Notes")
+    group = SelectField("Group", choices=[("", "<Group>")], default="")
     transactions = TransactionListField("Transactions")
     return_url = HiddenField()
 
@@ -231,6 +369,123 @@ class TransactionBulkUpdateForm(FlaskForm):
         if not field.data:
             raise ValidationError("No transactions selected.")
 
+    def validate_reimbursement_type(self, field: Field):
+        if field.data == "Custom" and self.reimbursement_amount.data is None:
+            raise ValidationError(
+                "You must provide a custom reimbursement amount"
+            )
+
+    def changes(self) -> t.Dict[str, t.Any]:
+        """
+        Return the changes as keyword arguments for bulk_update_transactions()
+        """
+        changes: t.Dict[str, t.Any] = {}
+        if self.category.data != SKIP_CATEGORY:
+            changes["category"] = self.category.data
+        if self.reimbursement_type.data:
+            changes["reimbursement_type"] = self.reimbursement_type.data
+        if self.reimbursement_type.data == "Custom":
+            changes["reimbursement_amount"] = Money.of(
+                self.reimbursement_amount.data
+            )
+            changes["other_reimbursement"] = Money.of(
+                self.other_reimbursement.data or 0
+            )
+        if self.notes.data:
+            changes["notes"] = self.notes.data
+        if self.group.data:
+            changes["group_id"] = int(self.group.data)
+        return changes
+
+
+class CategoryRuleForm(FlaskForm):
+    """Creates a CategoryRule. The account choices are set by the view."""
+
+    category = SelectField(
+        "Category",
+        choices=category_choices(True),
+        validators=[DataRequired(), validate_category],
+        default=SKIP_CATEGORY,
+    )
+    priority = IntegerField(
+        "Priority",
+        default=0,
+        validators=[Optional()],
+        description="Rules with a higher priority are tried first.",
+    )
+    name_contains = StringField("Name contains", validators=[Optional()])
+    merchant_contains = StringField(
+        "Merchant contains", validators=[Optional()]
+    )
+    pattern = StringField(
+        "Name or merchant matches",
+        validators=[Optional()],
+        description="A regular expression, ignoring case.",
+    )
+    min_amount = DecimalField(
+        "Minimum amount", places=2, validators=[Optional()]
+    )
+    max_amount = DecimalField(
+        "Maximum amount", places=2, validators=[Optional()]
+    )
+    account = SelectField("Account", choices=[("", "<Any>")], default="")
+    payment_channel = SelectField(
+        "Payment channel",
+        choices=[("", "<Any>")] + [(c.value, c.value) for c in PaymentChannel],
+        default="",
+    )
+    submit = SubmitField("Add Rule")
+
+    def validate_pattern(self, field: Field):
+        try:
+            compile_pattern(field.data)
+        except re.error as e:
+            raise ValidationError(f"Invalid regular expression: {e}")
+
+    def validate(self, extra_validators=None) -> bool:
+        if not super().validate(extra_validators):
+            return False
+        conditions = [
+            self.name_contains,
+            self.merchant_contains,
+            self.pattern,
+            self.min_amount,
+            self.max_amount,
+            self.account,
+            self.payment_channel,
+        ]
+        if not any(f.data not in (None, "") for f in conditions):
+            self.name_contains.errors.append("Give at least one condition")
+            return False
+        return True
+
+    def populate_rule(self, rule: CategoryRule) -> None:
+        rule.category = self.category.data
+        rule.priority = self.priority.data or 0
+        rule.name_contains = self.name_contains.data or None
+        rule.merchant_contains = self.merchant_contains.data or None
+        rule.pattern = self.pattern.data or None
+        rule.min_amount = _money_or_none(self.min_amount.data)
+        rule.max_amount = _money_or_none(self.max_amount.data)
+        rule.account_id = int(self.account.data) if self.account.data else None
+        rule.payment_channel = (
+            PaymentChannel(self.payment_channel.data)
+            if self.payment_channel.data
+            else None
+        )
+
+
+def _money_or_none(value: t.Optional[Decimal]) -> t.Optional[Money]:
+    return None if value is None else Money.of(value)
+
+
+class ApplyRulesForm(FlaskForm):
+
+    recategorize = BooleanField(
+        "Also change the category of matching transactions"
+    )
+    submit = SubmitField("Apply Rules")
+
 
 class GenericReturnForm(FlaskForm):
 
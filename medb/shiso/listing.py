@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only rows for transaction listings
+
+Listing pages only display a handful of fields from each transaction and its
+review. Loading them as ORM objects means identity map entries, attribute
+state and relationship bookkeeping for every row, all of it thrown away once
+the page is rendered. Instead, the listing queries select just those columns
+into small named tuples, which the templates use exactly like a Transaction.
+"""
+import datetime
+import typing as t
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Bundle
+from sqlalchemy.orm import Query
+
+from medb.model_util import Money
+
+from .models import Transaction
+from .models import TransactionReview
+
+
+class ReviewRow(t.NamedTuple):
+    category: str
+    reimbursement_amount: Money
+    other_reimbursement: Money
+    group_id: t.Optional[int]
+
+
+class TransactionRow(t.NamedTuple):
+    id: int
+    original_date: datetime.date
+    name: str
+    plaid_merchant_name: t.Optional[str]
+    amount: Money
+    posted: bool
+    subscription_id: t.Optional[int]
+    needs_review: bool
+    review: t.Optional[ReviewRow]
+
+
+class _TransactionRowBundle(Bundle[TransactionRow]):
+    """
+    Selects the columns of a TransactionRow, and builds one from each result
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            "transaction_row",
+            Transaction.id,
+            Transaction.original_date,
+            Transaction.name,
+            Transaction.plaid_merchant_name,
+            Transaction.amount,
+            Transaction.posted,
+            Transaction.subscription_id,
+            # Transaction.needs_review, computed by the database
+            or_(
+                TransactionReview.id.is_(None),
+                TransactionReview.updated < Transaction.updated,
+            ),
+            TransactionReview.id,
+            TransactionReview.category,
+            TransactionReview.reimbursement_amount,
+            TransactionReview.other_reimbursement,
+            TransactionReview.group_id,
+        )
+
+    def create_row_processor(
+        self,
+        query: t.Any,
+        procs: t.Sequence[t.Callable[[t.Any], t.Any]],
+        labels: t.Sequence[str],
+    ) -> t.Callable[[t.Any], TransactionRow]:
+        txn_procs = procs[:8]
+        review_id_proc = procs[8]
+        review_procs = procs[9:]
+
+        def proc(row: t.Any) -> TransactionRow:
+            review = None
+            if review_id_proc(row) is not None:
+                review = ReviewRow(*(p(row) for p in review_procs))
+            return TransactionRow._make([*(p(row) for p in txn_procs), review])
+
+        return proc
+
+
+def transaction_rows(query: Query[Transaction]) -> Query[TransactionRow]:
+    """
+    Select TransactionRows instead of Transactions from a listing query
+
+    The query must already be joined to TransactionReview, as the listing
+    queries in logic are. Iterating the Query itself gives one-element rows:
+    paginate_transactions() and ranked_search_results() unwrap them.
+    """
+    return t.cast(
+        Query[TransactionRow], query.with_entities(_TransactionRowBundle())
+    )
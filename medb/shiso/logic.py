@@ -12,6 +12,7 @@ from collections import Counter
 from dataclasses import dataclass
 from dataclasses import field
 from decimal import Decimal
+from functools import cached_property
 from functools import lru_cache
 from typing import Dict
 from typing import List
@@ -32,20 +33,28 @@ from plaid.models import TransactionsGetRequest
 from plaid.models import TransactionsGetRequestOptions
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy.orm import Query
 from sqlalchemy.orm import joinedload
 from toolz import keyfilter
+from toolz import partition_all
 
 from medb.extensions import db
+from medb.model_util import Money
+from medb.model_util import utcnow
 from medb.settings import PLAID_CLIENT_ID
 from medb.settings import PLAID_ENV
 from medb.settings import PLAID_SECRET
 from medb.user.models import User
 from medb.utils import send_email
 
+from .deletion import accounts_being_deleted
+from .forms import BatchReviewEntryForm
 from .forms import LinkItemForm
 from .forms import TransactionReviewForm
+from .listing import TransactionRow
 from .models import CATEGORIES_V2
 from .models import CATEGORY_PARENT_V2
+from .models import CategorySummary
 from .models import PaymentChannel
 from .models import Subscription
 from .models import Transaction
@@ -54,6 +63,20 @@ from .models import TransactionReview
 from .models import UserPlaidAccount
 from .models import UserPlaidItem
 from .models import UserSettings
+from .rules import APPLY_BATCH_SIZE
+from .rules import apply_rules
+from .rules import load_matcher
+from .search import filter_search
+from .search import match_expression
+from .search import search_rank
+from .summary import full_months
+from .summary import refresh_group_totals
+from .summary import refresh_selected_summaries
+from .summary import refresh_summaries
+from .summary import refresh_transaction_groups
+from .summary import refresh_transaction_summaries
+from .summary import summary_sums
+from .summary import transaction_sums
 
 SUPPORTED_TYPES = {
     ("credit", "credit card"),
@@ -105,7 +128,7 @@ class PlaidTransaction:
             account_id=acct_id,
             plaid_txn_id=self.transaction_id,
             active=True,
-            amount=Decimal(str(self.amount)),
+            amount=Money.of(str(self.amount)),
             posted=not self.pending,
             name=self.name,
             date=self.date,
@@ -502,12 +525,16 @@ def initial_sync(
         else:
             raise
     report = SyncReport(account=acct)
+    rules = load_matcher(acct.item.user_id)
     for pt in plaid_txns.transactions:
-        db.session.add(pt.to_plaid_transaction(acct.id))
+        plaid_txn = pt.to_plaid_transaction(acct.id)
+        plaid_txn.rule_id = rules.match_transaction(plaid_txn)
+        db.session.add(plaid_txn)
         report.new += 1
     acct.sync_start = start_date
     acct.sync_end = today
     db.session.add(acct)
+    refresh_summaries(acct.id)
     db.session.commit()
     return report
 
@@ -524,6 +551,7 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
     local_txns_by_plaid_id = {t.plaid_txn_id: t for t in local_txns}
 
     subs = get_subscriptions(acct.id)
+    rules = load_matcher(acct.item.user_id)
 
     try:
         plaid_txns = get_plaid_transactions(
@@ -539,6 +567,7 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
             raise
 
     report = SyncReport(account=acct)
+    changed = []
     fields = [
         "name",
         "date",
@@ -580,6 +609,7 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
                 report.updated += 1
                 for fn in fields:
                     setattr(stored_txn, fn, getattr(plaid_txn, fn))
+                stored_txn.rule_id = rules.match_transaction(stored_txn)
                 # Situations to require re-review:
                 # 1: amount changed
                 # 2: somehow a "deleted" transaction becomes active again
@@ -587,12 +617,15 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
                     stored_txn.mark_updated()
                     report.rereview += 1
                 db.session.add(stored_txn)
+                changed.append(stored_txn)
             else:
                 report.unchanged += 1
         else:
             report.new += 1
             plaid_txn.subscription = subscription
+            plaid_txn.rule_id = rules.match_transaction(plaid_txn)
             db.session.add(plaid_txn)
+            changed.append(plaid_txn)
     acct.sync_end = today
     db.session.add(acct)
 
@@ -607,6 +640,11 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
         txn.mark_updated()
         db.session.add(txn)
         report.missing_list.append(txn)
+    refresh_transaction_summaries(changed + report.missing_list)
+    # New transactions have no ID yet, but they can't be in a group either
+    refresh_transaction_groups(
+        [txn.id for txn in changed + report.missing_list if txn.id]
+    )
     db.session.commit()
 
     subs = subscription_search(acct)
@@ -614,17 +652,23 @@ def sync_account(acct: UserPlaidAccount) -> SyncReport:
     return report
 
 
-def get_transactions(
+def transactions_query(
     acct: UserPlaidAccount,
     start_date: t.Optional[datetime.date] = None,
     end_date: t.Optional[datetime.date] = None,
     subscription_id: t.Optional[int] = None,
-) -> t.List[Transaction]:
-    query = Transaction.query.options(
-        db.joinedload(Transaction.review),
-    ).filter(
-        Transaction.account_id == acct.id,
-        Transaction.active,
+) -> Query[Transaction]:
+    query = (
+        Transaction.query.outerjoin(
+            Transaction.review,
+        )
+        .options(
+            db.contains_eager(Transaction.review),
+        )
+        .filter(
+            Transaction.account_id == acct.id,
+            Transaction.active,
+        )
     )
     if start_date:
         query = query.filter(Transaction.original_date >= start_date)
@@ -632,43 +676,194 @@ def get_transactions(
         query = query.filter(Transaction.original_date <= end_date)
     if subscription_id is not None:
         query = query.filter(Transaction.subscription_id == subscription_id)
+    return query
+
+
+def get_transactions(
+    acct: UserPlaidAccount,
+    start_date: t.Optional[datetime.date] = None,
+    end_date: t.Optional[datetime.date] = None,
+    subscription_id: t.Optional[int] = None,
+) -> t.List[Transaction]:
+    query = transactions_query(acct, start_date, end_date, subscription_id)
     return query.order_by(
         Transaction.original_date.desc(),
         Transaction.id.desc(),
     ).all()
 
 
-def get_transaction(txn_id) -> t.Optional[Transaction]:
-    return Transaction.query.options(
-        db.joinedload(Transaction.review),
-    ).get(txn_id)
+class TransactionCursor(t.NamedTuple):
+    """
+    A position in a transaction listing, which is ordered by (original_date,
+    id). It appears in URLs as "<date>.<id>".
+    """
 
+    original_date: datetime.date
+    id: int
 
-def get_transactions_bulk(txn_ids: t.List[int]) -> t.List[Transaction]:
-    return (
-        Transaction.query.options(
-            db.joinedload(Transaction.review),
-        )
-        .filter(Transaction.id.in_(txn_ids))
-        .all()
+    @classmethod
+    def of(
+        cls, txn: t.Union[Transaction, TransactionRow]
+    ) -> "TransactionCursor":
+        return cls(txn.original_date, txn.id)
+
+    @classmethod
+    def decode(cls, value: str) -> "TransactionCursor":
+        """
+        Parse a cursor from a URL, raising ValueError if it's malformed
+        """
+        date_str, _, id_str = value.partition(".")
+        return cls(datetime.date.fromisoformat(date_str), int(id_str))
+
+    def encode(self) -> str:
+        return f"{self.original_date.isoformat()}.{self.id}"
+
+
+# A listed transaction: either a Transaction or a TransactionRow
+ListedT = t.TypeVar("ListedT", Transaction, TransactionRow)
+
+
+def _stream(query: Query[ListedT]) -> t.Iterator[ListedT]:
+    """
+    Iterate over a listing query, fetching rows in batches
+
+    The statement is executed directly so that each result is the entity
+    itself, even for transaction_rows() queries, which the Query would
+    otherwise return inside one-element rows.
+    """
+    return iter(
+        db.session.execute(
+            query.statement,
+            execution_options={"yield_per": STREAM_BATCH_SIZE},
+        ).scalars()
     )
 
 
-def get_next_unreviewed_transaction(
-    acct: t.Optional[UserPlaidAccount] = None,
-    after: t.Optional[Transaction] = None,
-    user: t.Optional[User] = None,
-) -> Transaction:
+class TransactionPage(t.Generic[ListedT]):
     """
-    Return the next unreviewed transaction.
+    One page of a transaction listing, newest first
 
-    You must either provide acct or user. So you'll either get the next
-    transaction to review in this account, or across all accounts for a user.
-    The "after" argument specifies where to start.
+    The transactions are loaded in batches while "transactions" is iterated,
+    so a page can be rendered as it streams out without holding every row in
+    memory. It can only be iterated once, and "older" (and "newer", when
+    paging forward) is only known once iteration has finished.
+    """
 
-    Unlike other functions, this one could return a inactive transaction
-    (because users need to review those).
+    def __init__(
+        self,
+        query: Query[ListedT],
+        per_page: int,
+        newer: t.Optional[TransactionCursor],
+        first_is_newer: bool,
+    ):
+        # Cursors for the pages of newer and older transactions, if any
+        self.newer = newer
+        self.older: t.Optional[TransactionCursor] = None
+        self.transactions: t.Iterator[ListedT] = self._iterate(
+            query, per_page, first_is_newer
+        )
+
+    def _iterate(
+        self,
+        query: Query[ListedT],
+        per_page: int,
+        first_is_newer: bool,
+    ) -> t.Iterator[ListedT]:
+        rows = _stream(query.limit(per_page + 1))
+        cursor = None
+        for i, txn in enumerate(rows):
+            if i == per_page:
+                # The extra row only tells us that there's an older page.
+                self.older = cursor
+                break
+            cursor = TransactionCursor.of(txn)
+            if i == 0 and first_is_newer:
+                self.newer = cursor
+            yield txn
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from the database cursor at a time while streaming a page
+STREAM_BATCH_SIZE = 100
+
+# Transactions shown at once on the batch review page
+BATCH_REVIEW_SIZE = 50
+
+
+def paginate_transactions(
+    query: Query[ListedT],
+    per_page: int = DEFAULT_PAGE_SIZE,
+    after: t.Optional[TransactionCursor] = None,
+    before: t.Optional[TransactionCursor] = None,
+) -> TransactionPage[ListedT]:
     """
+    Return one page of a transaction query, newest first
+
+    Pages are found by seeking to the cursor in the (original_date, id) index,
+    rather than with an OFFSET, so every page costs the same no matter how
+    deep into the history it is. Pass "after" to get the page of older
+    transactions following a cursor, or "before" to get the newer page that
+    precedes it.
+
+    Only the lookup for a "before" cursor runs here. The page itself is
+    queried as it is iterated.
+    """
+    key = sqlalchemy.tuple_(Transaction.original_date, Transaction.id)
+    newer = None
+    if before is not None:
+        # Find where the newer page starts by walking up from the cursor over
+        # the index alone, then list the page from there like any other.
+        keys: t.Sequence[t.Tuple[datetime.date, int]] = (
+            query.with_entities(Transaction.original_date, Transaction.id)
+            .filter(key > sqlalchemy.tuple_(*before))
+            .order_by(Transaction.original_date, Transaction.id)
+            .limit(per_page + 1)
+            .all()
+        )
+        if keys:
+            start = TransactionCursor(*keys[:per_page][-1])
+            query = query.filter(key <= sqlalchemy.tuple_(*start))
+            if len(keys) > per_page:
+                newer = start
+    elif after is not None:
+        query = query.filter(key < sqlalchemy.tuple_(*after))
+    query = query.order_by(
+        Transaction.original_date.desc(),
+        Transaction.id.desc(),
+    )
+    return TransactionPage(query, per_page, newer, after is not None)
+
+
+def ranked_search_results(
+    query: Query[ListedT], limit: int = DEFAULT_PAGE_SIZE
+) -> t.Iterator[ListedT]:
+    """
+    Return the best matches of a query filtered by a search, best first
+
+    Relevance doesn't give a stable position to page from, so this is just
+    the top of the list. The rows are loaded as they're iterated, like
+    TransactionPage.
+    """
+    return _stream(
+        query.order_by(
+            search_rank(),
+            Transaction.original_date.desc(),
+            Transaction.id.desc(),
+        ).limit(limit)
+    )
+
+
+def get_transaction(txn_id) -> t.Optional[Transaction]:
+    return Transaction.query.options(
+        db.joinedload(Transaction.review),
+    ).get(txn_id)
+
+
+def _unreviewed_query(
+    acct: t.Optional[UserPlaidAccount], user: t.Optional[User]
+) -> Query[Transaction]:
     assert user or acct
     assert not (user and acct)
     query = Transaction.query.options(db.joinedload(Transaction.review))
@@ -688,6 +883,25 @@ def get_next_unreviewed_transaction(
         query = query.filter(Transaction.account_id == acct.id)
     else:
         assert False
+    return query
+
+
+def get_next_unreviewed_transaction(
+    acct: t.Optional[UserPlaidAccount] = None,
+    after: t.Optional[Transaction] = None,
+    user: t.Optional[User] = None,
+) -> t.Optional[Transaction]:
+    """
+    Return the next unreviewed transaction.
+
+    You must either provide acct or user. So you'll either get the next
+    transaction to review in this account, or across all accounts for a user.
+    The "after" argument specifies where to start.
+
+    Unlike other functions, this one could return a inactive transaction
+    (because users need to review those).
+    """
+    query = _unreviewed_query(acct, user)
     if after is not None:
         query = query.filter(
             and_(
@@ -700,6 +914,45 @@ def get_next_unreviewed_transaction(
     ).first()
 
 
+def get_unreviewed_transactions(
+    limit: int,
+    acct: t.Optional[UserPlaidAccount] = None,
+    user: t.Optional[User] = None,
+) -> t.List[Transaction]:
+    """
+    Return the oldest transactions which need review, for a batch review.
+
+    As with get_next_unreviewed_transaction(), provide acct or user. Inactive
+    transactions are left out: each of those needs to be acknowledged on its
+    own review page.
+    """
+    return (
+        _unreviewed_query(acct, user)
+        .filter(Transaction.active)
+        .order_by(Transaction.original_date, Transaction.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def get_user_transactions_bulk(
+    user: User, txn_ids: t.Collection[int]
+) -> t.List[Transaction]:
+    """
+    Return the transactions with these IDs which belong to the user
+    """
+    return (
+        Transaction.query.join(UserPlaidAccount)
+        .join(UserPlaidItem)
+        .options(db.joinedload(Transaction.review))
+        .filter(
+            UserPlaidItem.user_id == user.id,
+            Transaction.id.in_(txn_ids),
+        )
+        .all()
+    )
+
+
 def review_deleted_transaction(txn: Transaction):
     """
     Review a transaction which is no longer active.
@@ -711,7 +964,7 @@ def review_deleted_transaction(txn: Transaction):
         # insert dummy review values if it was never reviewed before
         rev = TransactionReview()
         rev.transaction_id = txn.id
-        rev.reimbursement_amount = Decimal(0)
+        rev.reimbursement_amount = Money(0)
         rev.category = ""
         rev.notes = ""
     rev.reviewed_amount = txn.amount
@@ -721,20 +974,24 @@ def review_deleted_transaction(txn: Transaction):
     rev.reviewed_posted = txn.posted
     rev.mark_updated()
     db.session.add(rev)
+    refresh_transaction_summaries([txn])
     db.session.commit()
 
 
-def review_transaction(txn: Transaction, review: TransactionReviewForm):
-    other = Decimal(0)
+ReviewFields = t.Union[TransactionReviewForm, BatchReviewEntryForm]
+
+
+def _apply_review(txn: Transaction, review: ReviewFields) -> None:
+    other = Money(0)
     if review.reimbursement_type.data == "None":
-        amt = Decimal(0)
+        amt = Money(0)
     elif review.reimbursement_type.data == "Half":
-        amt = txn.amount / 2
+        amt = txn.amount.halve()
     elif review.reimbursement_type.data == "Full":
         amt = txn.amount
     else:
-        amt = review.reimbursement_amount.data
-        other = review.other_reimbursement.data
+        amt = Money.of(review.reimbursement_amount.data)
+        other = Money.of(review.other_reimbursement.data or 0)
     if txn.review:
         rev = txn.review
     else:
@@ -751,19 +1008,221 @@ def review_transaction(txn: Transaction, review: TransactionReviewForm):
     rev.reviewed_posted = txn.posted
     rev.mark_updated()
     db.session.add(rev)
+
+
+def review_transaction(txn: Transaction, review: TransactionReviewForm):
+    _apply_review(txn, review)
+    refresh_transaction_summaries([txn])
+    # A new review isn't in txn.review yet, so look the group up by the id
+    refresh_transaction_groups([txn.id])
     db.session.commit()
 
 
-def do_bulk_transaction_update(txn_ids: t.List[int], category: str):
-    txns = get_transactions_bulk(txn_ids)
-    for txn in txns:
-        assert txn.review
-        txn.review.category = category
-        db.session.add(txn.review)
+def review_transactions(
+    reviews: t.Sequence[t.Tuple[Transaction, BatchReviewEntryForm]]
+) -> None:
+    """
+    Review many transactions at once. The reviews are written, and the
+    affected summaries refreshed, in a single database transaction.
+    """
+    for txn, review in reviews:
+        _apply_review(txn, review)
+    refresh_transaction_summaries(txn for txn, _ in reviews)
+    refresh_transaction_groups([txn.id for txn, _ in reviews])
     db.session.commit()
 
 
-def get_all_user_transactions(
+def _reimbursement_values(
+    reimbursement_type: t.Optional[str],
+    amount: t.Any,
+    reimbursement_amount: t.Optional[Money],
+    other_reimbursement: t.Optional[Money],
+) -> t.Dict[str, t.Any]:
+    """
+    Return the review column expressions for a reimbursement type, as in
+    review_transaction(), where amount is the transaction amount column
+    """
+    if reimbursement_type is None:
+        return {}
+    money: t.Any = TransactionReview.reimbursement_amount.type
+    zero: t.Any = sqlalchemy.literal(Money(0), money)
+    other = zero
+    if reimbursement_type == "None":
+        reimbursed = zero
+    elif reimbursement_type == "Half":
+        # Amounts are integer millis, and SQLite's integer division truncates
+        # toward zero, just like Money.halve().
+        reimbursed = sqlalchemy.type_coerce(
+            sqlalchemy.type_coerce(amount, sqlalchemy.Integer) // 2, money
+        )
+    elif reimbursement_type == "Full":
+        reimbursed = amount
+    else:
+        assert reimbursement_amount is not None
+        reimbursed = sqlalchemy.literal(reimbursement_amount, money)
+        other = sqlalchemy.literal(other_reimbursement or Money(0), money)
+    return {"reimbursement_amount": reimbursed, "other_reimbursement": other}
+
+
+def bulk_update_transactions(
+    user: User,
+    txn_ids: t.Collection[int],
+    category: t.Optional[str] = None,
+    reimbursement_type: t.Optional[str] = None,
+    reimbursement_amount: t.Optional[Money] = None,
+    other_reimbursement: t.Optional[Money] = None,
+    notes: t.Optional[str] = None,
+    group_id: t.Optional[int] = None,
+) -> int:
+    """
+    Update the reviews of many of the user's transactions at once, returning
+    how many were updated. Arguments which are None are left unchanged. The
+    reimbursement arguments work like a TransactionReviewForm's, and
+    group_id must be one of the user's groups. Reviews which lead a group
+    stay in it, like remove_from_group() requires.
+
+    Each change is a single statement, however many transactions there are:
+    one UPDATE for existing reviews, and when a category is given, one
+    INSERT ... SELECT which reviews the transactions that weren't reviewed
+    yet. Objects already loaded in the session are stale until the commit.
+    The totals of the groups involved are refreshed afterward, and groups
+    left without members are deleted.
+    """
+    selected: sqlalchemy.Select[t.Tuple[int]] = (
+        sqlalchemy.select(Transaction.id)
+        .join(UserPlaidAccount)
+        .join(UserPlaidItem)
+        .where(
+            UserPlaidItem.user_id == user.id,
+            Transaction.id.in_(txn_ids),
+        )
+    )
+    count = 0
+    # Groups which the reviews are in before the update, since they may be
+    # moved out of them
+    groups = set(
+        db.session.scalars(
+            sqlalchemy.select(TransactionReview.group_id)
+            .where(
+                TransactionReview.transaction_id.in_(selected),
+                TransactionReview.group_id.isnot(None),
+            )
+            .distinct()
+        )
+    )
+    if group_id is not None:
+        groups.add(group_id)
+
+    values: t.Dict[str, t.Any] = {}
+    if category is not None:
+        values["category"] = category
+    if notes is not None:
+        values["notes"] = notes
+    if group_id is not None:
+        leaders = sqlalchemy.select(TransactionGroup.leader_id)
+        values["group_id"] = sqlalchemy.case(
+            (TransactionReview.id.in_(leaders), TransactionReview.group_id),
+            else_=group_id,
+        )
+    txn_amount = (
+        sqlalchemy.select(Transaction.amount)
+        .where(Transaction.id == TransactionReview.transaction_id)
+        .scalar_subquery()
+    )
+    values.update(
+        _reimbursement_values(
+            reimbursement_type,
+            txn_amount,
+            reimbursement_amount,
+            other_reimbursement,
+        )
+    )
+    if values:
+        update = (
+            sqlalchemy.update(TransactionReview)
+            .where(TransactionReview.transaction_id.in_(selected))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+        count += db.session.execute(update).rowcount
+
+    if category is not None:
+        review = {
+            "transaction_id": Transaction.id,
+            "category": sqlalchemy.literal(category),
+            "notes": sqlalchemy.literal(notes or ""),
+            "group_id": sqlalchemy.literal(group_id, sqlalchemy.Integer),
+            "updated": sqlalchemy.literal(
+                utcnow(), TransactionReview.updated.type
+            ),
+            "reviewed_amount": Transaction.amount,
+            "reviewed_date": Transaction.date,
+            "reviewed_name": Transaction.name,
+            "reviewed_plaid_merchant_name": Transaction.plaid_merchant_name,
+            "reviewed_posted": Transaction.posted,
+        }
+        review.update(
+            _reimbursement_values(
+                reimbursement_type or "None",
+                Transaction.amount,
+                reimbursement_amount,
+                other_reimbursement,
+            )
+        )
+        unreviewed = (
+            sqlalchemy.select(*review.values())
+            .outerjoin(TransactionReview)
+            .where(
+                Transaction.id.in_(selected),
+                TransactionReview.id.is_(None),
+            )
+        )
+        insert = sqlalchemy.insert(TransactionReview).from_select(
+            list(review), unreviewed
+        )
+        count += db.session.execute(insert).rowcount
+
+    refresh_selected_summaries(selected)
+    if groups:
+        refresh_group_totals(groups)
+        db.session.execute(
+            sqlalchemy.delete(TransactionGroup)
+            .where(
+                TransactionGroup.id.in_(groups),
+                TransactionGroup.member_count == 0,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return count
+
+
+def apply_category_rules(
+    user: User, recategorize: bool = False
+) -> t.Tuple[int, int]:
+    """
+    Match the user's CategoryRules against all of their transactions, so that
+    their guesses reflect the current rules. With recategorize, also set the
+    category of every matching transaction to its rule's, reviewing those
+    which weren't reviewed yet.
+
+    Return how many transactions' rules changed, and how many were
+    recategorized.
+    """
+    changed, matched = apply_rules(user)
+    db.session.commit()
+    recategorized = 0
+    if recategorize:
+        for category, txn_ids in matched.items():
+            # In batches, to stay within SQLite's limit on bound parameters
+            for batch in partition_all(APPLY_BATCH_SIZE, txn_ids):
+                recategorized += bulk_update_transactions(
+                    user, batch, category=category
+                )
+    return changed, recategorized
+
+
+def user_transactions_query(
     user: User,
     start_date: t.Optional[datetime.date] = None,
     end_date: t.Optional[datetime.date] = None,
@@ -771,12 +1230,10 @@ def get_all_user_transactions(
     accounts: t.Optional[t.Container[int]] = None,
     merchant: t.Optional[str] = None,
     name: t.Optional[str] = None,
-) -> t.List[Transaction]:
+    search: t.Optional[str] = None,
+) -> Query[Transaction]:
     query = (
-        Transaction.query.options(
-            db.joinedload(Transaction.review),
-        )
-        .join(
+        Transaction.query.join(
             Transaction.account,
         )
         .join(
@@ -785,6 +1242,9 @@ def get_all_user_transactions(
         .join(
             Transaction.review,
         )
+        .options(
+            db.contains_eager(Transaction.review),
+        )
         .filter(
             UserPlaidItem.user_id == user.id,
             Transaction.active,
@@ -816,89 +1276,91 @@ def get_all_user_transactions(
         )
     if name is not None:
         query = query.filter(Transaction.name == name)
+    if search:
+        expression = match_expression(search)
+        if expression:
+            query = filter_search(query, expression)
+    return query
+
+
+def get_all_user_transactions(
+    user: User,
+    start_date: t.Optional[datetime.date] = None,
+    end_date: t.Optional[datetime.date] = None,
+    categories: t.Optional[t.Iterable[str]] = None,
+    accounts: t.Optional[t.Container[int]] = None,
+    merchant: t.Optional[str] = None,
+    name: t.Optional[str] = None,
+    search: t.Optional[str] = None,
+) -> t.List[Transaction]:
+    query = user_transactions_query(
+        user, start_date, end_date, categories, accounts, merchant, name, search
+    )
     return query.order_by(
         Transaction.original_date.desc(),
         Transaction.id.desc(),
     ).all()
 
 
+# Per-category sums: (all, share, reimbursed, other)
+CategorySums = t.Tuple[Money, Money, Money, Money]
+
+
 @dataclass
 class TransactionReport:
 
-    transactions: t.List[Transaction]
+    load_transactions: t.Callable[[], t.List[Transaction]]
 
-    all_net: Decimal
-    share_net: Decimal
-    reimbursed_net: Decimal
-    other_net: Decimal
-    unreviewed_net: Decimal
+    all_net: Money
+    share_net: Money
+    reimbursed_net: Money
+    other_net: Money
+    unreviewed_net: Money
     unreviewed_count: int
 
     categories: t.List[str]
-    all_categorized: t.Dict[str, Decimal]
-    share_categorized: t.Dict[str, Decimal]
-    reimbursed_categorized: t.Dict[str, Decimal]
-    other_categorized: t.Dict[str, Decimal]
+    all_categorized: t.Dict[str, Money]
+    share_categorized: t.Dict[str, Money]
+    reimbursed_categorized: t.Dict[str, Money]
+    other_categorized: t.Dict[str, Money]
 
     parent_categories: t.List[str]
-    all_parent: t.Dict[str, Decimal]
-    share_parent: t.Dict[str, Decimal]
-    reimbursed_parent: t.Dict[str, Decimal]
-    other_parent: t.Dict[str, Decimal]
+    all_parent: t.Dict[str, Money]
+    share_parent: t.Dict[str, Money]
+    reimbursed_parent: t.Dict[str, Money]
+    other_parent: t.Dict[str, Money]
 
+    @cached_property
+    def transactions(self) -> t.List[Transaction]:
+        """
+        The reviewed transactions in the report. These are only loaded if
+        somebody asks, since the sums are all computed without them.
+        """
+        return self.load_transactions()
 
-def compute_transaction_report(
-    txns: t.List[Transaction], include_transfer: bool
-) -> TransactionReport:
-    categories_set = set()
-    txns = txns[:]
-    unreviewed_net = Decimal(0)
-    unreviewed_count = 0
-    for i in reversed(range(len(txns))):
-        if not txns[i].review:
-            unreviewed_net += txns[i].amount
-            unreviewed_count += 1
-            del txns[i]
-        else:
-            categories_set.add(txns[i].review.category)
-
-    categories = sorted(categories_set)
-    all_net = Decimal(0)
-    share_net = Decimal(0)
-    reimbursed_net = Decimal(0)
-    other_net = Decimal(0)
-    all_categorized = {c: Decimal(0) for c in categories}
-    share_categorized = {c: Decimal(0) for c in categories}
-    reimbursed_categorized = {c: Decimal(0) for c in categories}
-    other_categorized = {c: Decimal(0) for c in categories}
 
-    for txn in txns:
-        if txn.review.category == "Transfer" and not include_transfer:
-            continue
-        all_net += txn.amount
-        share_net += (
-            txn.amount
-            - txn.review.reimbursement_amount
-            - txn.review.other_reimbursement
-        )
-        reimbursed_net += txn.review.reimbursement_amount
-        other_net += txn.review.other_reimbursement
-        all_categorized[txn.review.category] += txn.amount
-        share_categorized[txn.review.category] += (
-            txn.amount
-            - txn.review.reimbursement_amount
-            - txn.review.other_reimbursement
-        )
-        reimbursed_categorized[
-            txn.review.category
-        ] += txn.review.reimbursement_amount
-        other_categorized[txn.review.category] += txn.review.other_reimbursement
+def build_transaction_report(
+    load_transactions: t.Callable[[], t.List[Transaction]],
+    sums: t.Dict[str, CategorySums],
+    unreviewed_net: Money,
+    unreviewed_count: int,
+    include_transfer: bool,
+) -> TransactionReport:
+    zero = Money(0)
+    categories = sorted(sums)
+    if not include_transfer and "Transfer" in sums:
+        # Transfers are still listed, they just don't count.
+        sums = {**sums, "Transfer": (zero, zero, zero, zero)}
+    all_categorized = {c: sums[c][0] for c in categories}
+    share_categorized = {c: sums[c][1] for c in categories}
+    reimbursed_categorized = {c: sums[c][2] for c in categories}
+    other_categorized = {c: sums[c][3] for c in categories}
 
     parents = sorted({CATEGORY_PARENT_V2[cat] for cat in categories})
-    all_parent = {c: Decimal(0) for c in parents}
-    share_parent = {c: Decimal(0) for c in parents}
-    reimbursed_parent = {c: Decimal(0) for c in parents}
-    other_parent = {c: Decimal(0) for c in parents}
+    all_parent = {c: zero for c in parents}
+    share_parent = {c: zero for c in parents}
+    reimbursed_parent = {c: zero for c in parents}
+    other_parent = {c: zero for c in parents}
     for cat in categories:
         parent = CATEGORY_PARENT_V2[cat]
         all_parent[parent] += all_categorized[cat]
@@ -907,11 +1369,11 @@ def compute_transaction_report(
         other_parent[parent] += other_categorized[cat]
 
     return TransactionReport(
-        transactions=txns,
-        all_net=all_net,
-        share_net=share_net,
-        other_net=other_net,
-        reimbursed_net=reimbursed_net,
+        load_transactions=load_transactions,
+        all_net=Money.total(all_categorized.values()),
+        share_net=Money.total(share_categorized.values()),
+        other_net=Money.total(other_categorized.values()),
+        reimbursed_net=Money.total(reimbursed_categorized.values()),
         unreviewed_net=unreviewed_net,
         unreviewed_count=unreviewed_count,
         categories=categories,
@@ -927,6 +1389,198 @@ def compute_transaction_report(
     )
 
 
+def compute_transaction_report(
+    txns: t.List[Transaction], include_transfer: bool
+) -> TransactionReport:
+    """
+    Compute a report over transactions which are already loaded. For reports
+    over a date range, see account_transaction_report() and
+    user_transaction_report(), which let the database do the work.
+    """
+    # Sums are kept in integer millis, and only made into Money at the end
+    unreviewed_net = 0
+    unreviewed_count = 0
+    reviewed = []
+    millis: t.Dict[str, t.List[int]] = {}
+    for txn in txns:
+        amount = txn.amount.millis
+        if not txn.review:
+            unreviewed_net += amount
+            unreviewed_count += 1
+            continue
+        reviewed.append(txn)
+        rev = txn.review
+        reimbursed = rev.reimbursement_amount.millis
+        other = rev.other_reimbursement.millis
+        cat_sums = millis.setdefault(rev.category, [0, 0, 0, 0])
+        cat_sums[0] += amount
+        cat_sums[1] += amount - reimbursed - other
+        cat_sums[2] += reimbursed
+        cat_sums[3] += other
+    sums: t.Dict[str, CategorySums] = {
+        category: (Money(a), Money(s), Money(r), Money(o))
+        for category, (a, s, r, o) in millis.items()
+    }
+    return build_transaction_report(
+        lambda: reviewed,
+        sums,
+        Money(unreviewed_net),
+        unreviewed_count,
+        include_transfer,
+    )
+
+
+def query_transaction_report(
+    queries: t.Iterable[sqlalchemy.sql.Select[t.Any]],
+    load_transactions: t.Callable[[], t.List[Transaction]],
+    include_transfer: bool,
+) -> TransactionReport:
+    """
+    Compute a report from grouped queries. Each query returns rows of
+    (reviewed, category, count, amount, share, reimbursed, other), see
+    summary.transaction_sums(). Rows for the same category are added up, so
+    that full months can come from the summary table while the partial months
+    at either end come from the transactions.
+    """
+    zero = Money(0)
+    unreviewed_net = zero
+    unreviewed_count = 0
+    sums: t.Dict[str, CategorySums] = {}
+    for query in queries:
+        for reviewed, category, count, *row_sums in db.session.execute(query):
+            if not reviewed:
+                unreviewed_count += count
+                unreviewed_net += row_sums[0]
+                continue
+            prev = sums.get(category, (zero, zero, zero, zero))
+            all_, share, reimbursed, other = (
+                p + (v or zero) for p, v in zip(prev, row_sums)
+            )
+            sums[category] = (all_, share, reimbursed, other)
+    return build_transaction_report(
+        load_transactions,
+        sums,
+        unreviewed_net,
+        unreviewed_count,
+        include_transfer,
+    )
+
+
+def transaction_report_queries(
+    txn_query: sqlalchemy.sql.Select[t.Any],
+    summary_query: sqlalchemy.sql.Select[t.Any],
+    start_date: t.Optional[datetime.date],
+    end_date: t.Optional[datetime.date],
+) -> t.List[sqlalchemy.sql.Select[t.Any]]:
+    """
+    Given filtered queries over the transactions and over their summaries,
+    return the grouped queries covering the date range
+    """
+    reviewed = TransactionReview.id.isnot(None)
+    txn_query = txn_query.add_columns(
+        reviewed, TransactionReview.category, *transaction_sums()
+    ).group_by(reviewed, TransactionReview.category)
+    if start_date:
+        txn_query = txn_query.filter(Transaction.original_date >= start_date)
+    if end_date:
+        txn_query = txn_query.filter(Transaction.original_date <= end_date)
+    months = full_months(start_date, end_date)
+    if not months:
+        return [txn_query]
+    first, stop = months
+    txn_query = txn_query.filter(
+        or_(
+            Transaction.original_date < first,
+            Transaction.original_date >= stop,
+        )
+    )
+    summary_query = (
+        summary_query.add_columns(
+            CategorySummary.reviewed,
+            CategorySummary.category,
+            *summary_sums(),
+        )
+        .filter(CategorySummary.month >= first, CategorySummary.month < stop)
+        .group_by(CategorySummary.reviewed, CategorySummary.category)
+    )
+    return [summary_query, txn_query]
+
+
+def account_transaction_report(
+    acct: UserPlaidAccount,
+    start_date: t.Optional[datetime.date],
+    end_date: t.Optional[datetime.date],
+    include_transfer: bool,
+) -> TransactionReport:
+    txn_query = (
+        sqlalchemy.select()
+        .select_from(Transaction)
+        .outerjoin(Transaction.review)
+        .filter(
+            Transaction.account_id == acct.id,
+            Transaction.active,
+        )
+    )
+    summary_query = (
+        sqlalchemy.select()
+        .select_from(CategorySummary)
+        .filter(CategorySummary.account_id == acct.id)
+    )
+
+    def load() -> t.List[Transaction]:
+        txns = get_transactions(acct, start_date, end_date)
+        return [txn for txn in txns if txn.review]
+
+    return query_transaction_report(
+        transaction_report_queries(
+            txn_query, summary_query, start_date, end_date
+        ),
+        load,
+        include_transfer,
+    )
+
+
+def user_transaction_report(
+    user: User,
+    start_date: t.Optional[datetime.date],
+    end_date: t.Optional[datetime.date],
+    include_transfer: bool,
+) -> TransactionReport:
+    # Like get_all_user_transactions(), this only includes reviewed
+    # transactions.
+    txn_query = (
+        sqlalchemy.select()
+        .select_from(Transaction)
+        .join(Transaction.account)
+        .join(UserPlaidAccount.item)
+        .join(Transaction.review)
+        .filter(
+            UserPlaidItem.user_id == user.id,
+            Transaction.active,
+        )
+    )
+    summary_query = (
+        sqlalchemy.select()
+        .select_from(CategorySummary)
+        .join(
+            UserPlaidAccount,
+            CategorySummary.account_id == UserPlaidAccount.id,
+        )
+        .join(UserPlaidAccount.item)
+        .filter(
+            UserPlaidItem.user_id == user.id,
+            CategorySummary.reviewed,
+        )
+    )
+    return query_transaction_report(
+        transaction_report_queries(
+            txn_query, summary_query, start_date, end_date
+        ),
+        lambda: get_all_user_transactions(user, start_date, end_date),
+        include_transfer,
+    )
+
+
 class SubscriptionDetector:
     """
     Name based subscription detection
@@ -1150,11 +1804,18 @@ def get_subscriptions_transactions(user: User) -> Subscription:
     )
 
 
+# How many similar reviewed transactions a category guess is based on
+GUESS_SAMPLE_SIZE = 5
+
+
 def guess_category(txn: Transaction) -> t.Optional[str]:
     """
-    Based on the 5 most recent transactions matching the name or merchant,
-    guess the transaction category.
+    Guess the transaction category: that of the transaction's CategoryRule,
+    or else the most common among the 5 most recent transactions matching the
+    name or merchant.
     """
+    if txn.rule:
+        return txn.rule.category
     query = Transaction.query.options(db.joinedload(Transaction.review))
     query = query.join(TransactionReview)
     merchant = txn.plaid_merchant_name or "NO MATCH"
@@ -1178,8 +1839,8 @@ def guess_category(txn: Transaction) -> t.Optional[str]:
                 ),
             ),
         )
-        .order_by(Transaction.date.desc())
-        .limit(5)
+        .order_by(Transaction.date.desc(), Transaction.id.desc())
+        .limit(GUESS_SAMPLE_SIZE)
         .all()
     )
     if not similar:
@@ -1188,6 +1849,91 @@ def guess_category(txn: Transaction) -> t.Optional[str]:
     return category_counter.most_common(1)[0][0]
 
 
+def guess_categories(
+    user: User, txns: t.Sequence[Transaction]
+) -> t.Dict[int, str]:
+    """
+    Guess the categories of many transactions at once, returning them by
+    transaction ID. Transactions with no guess are left out.
+
+    Like guess_category(), a transaction's CategoryRule comes first, and
+    otherwise each guess is the most common category among the most recent
+    reviewed transactions matching the name, merchant or subscription. Only
+    the user's own transactions are considered. The most recent matches for
+    every name, merchant and subscription are fetched with one query each,
+    rather than one query per transaction.
+    """
+    guesses: t.Dict[int, str] = {
+        txn.id: txn.rule.category for txn in txns if txn.rule
+    }
+    txns = [txn for txn in txns if not txn.rule]
+    keys: t.List[t.Tuple[t.Any, t.Callable[[Transaction], t.Any]]] = [
+        (Transaction.plaid_merchant_name, lambda txn: txn.plaid_merchant_name),
+        (Transaction.name, lambda txn: txn.name),
+        (Transaction.subscription_id, lambda txn: txn.subscription_id),
+    ]
+    # For each key column: key value -> [(date, id, category)], newest first
+    matches: t.List[t.Dict[t.Any, t.List[t.Tuple[t.Any, ...]]]] = []
+    for column, get in keys:
+        values = {get(txn) for txn in txns} - {None}
+        by_value: t.Dict[t.Any, t.List[t.Tuple[t.Any, ...]]] = {}
+        matches.append(by_value)
+        if not values:
+            continue
+        recency = (
+            sqlalchemy.func.row_number()
+            .over(
+                partition_by=column,
+                order_by=(Transaction.date.desc(), Transaction.id.desc()),
+            )
+            .label("recency")
+        )
+        recent = (
+            sqlalchemy.select(
+                column.label("value"),
+                Transaction.date,
+                Transaction.id,
+                TransactionReview.category,
+                recency,
+            )
+            .join(TransactionReview)
+            .join(UserPlaidAccount)
+            .join(UserPlaidItem)
+            .filter(
+                UserPlaidItem.user_id == user.id,
+                Transaction.active,
+                column.in_(values),
+            )
+            .subquery()
+        )
+        rows = db.session.execute(
+            sqlalchemy.select(
+                recent.c.value,
+                recent.c.date,
+                recent.c.id,
+                recent.c.category,
+            )
+            .filter(recent.c.recency <= GUESS_SAMPLE_SIZE)
+            .order_by(recent.c.recency)
+        )
+        for value, *match in rows:
+            by_value.setdefault(value, []).append(tuple(match))
+
+    for txn in txns:
+        # The newest matches overall are among the newest for each key
+        similar = {
+            match
+            for (_, get), by_value in zip(keys, matches)
+            for match in by_value.get(get(txn), ())
+        }
+        if not similar:
+            continue
+        newest = sorted(similar, reverse=True)[:GUESS_SAMPLE_SIZE]
+        category_counter = Counter(category for _, _, category in newest)
+        guesses[txn.id] = category_counter.most_common(1)[0][0]
+    return guesses
+
+
 def convert_to_group(rev: TransactionReview):
     if rev.group_id:
         raise Exception("Already a part of a transaction group")
@@ -1197,7 +1943,7 @@ def convert_to_group(rev: TransactionReview):
     db.session.commit()
     rev.group_id = group.id
     db.session.add(group)
-    db.session.commit()
+    refresh_group_totals([group.id])
     db.session.commit()
     return group
 
@@ -1205,11 +1951,13 @@ def convert_to_group(rev: TransactionReview):
 def remove_from_group(rev: TransactionReview):
     if rev.group_id:
         group = rev.group
-        num_members = len(group.members)
+        num_members = group.member_count
         if group.leader_id == rev.id and num_members != 1:
             raise Exception("Please remove the other transactions first")
         rev.group_id = None
         db.session.add(rev)
+        if num_members != 1:
+            refresh_group_totals([group.id])
         db.session.commit()
         if num_members == 1:
             db.session.delete(group)
@@ -1225,99 +1973,57 @@ def get_transaction_groups(user):
         .join(Transaction)
         .join(UserPlaidAccount)
         .join(UserPlaidItem)
+        .options(
+            db.contains_eager(TransactionGroup.leader).contains_eager(
+                TransactionReview.transaction
+            )
+        )
         .filter(UserPlaidItem.user_id == user.id)
         .all()
     )
 
 
 def add_to_group(rev: TransactionReview, group: TransactionGroup):
+    groups = {group.id}
+    if rev.group_id:
+        groups.add(rev.group_id)
     rev.group_id = group.id
     db.session.add(rev)
+    refresh_group_totals(groups)
     db.session.commit()
 
 
-def dangerous_delete_account(account_id: int) -> None:
+class GroupTotals(t.NamedTuple):
     """
-    Delete all transactions from an account and remove it.
-
-    This is tricky because we have several tables which have foreign key
-    constraints. Transactions have reviews, and the review object may be a
-    member of a transaction group. Then, transactions may also be part of a
-    subscription. Graphically:
-
-    User <- Item <- Account <- Transaction <- Review <-> Group
-                     ^-- Subscription <-|
-
-    Since transaction reviews from multiple accounts can participate in a group,
-    and we don't know how many members a group has, we can't delete the group.
+    A transaction group's totals, named like those of a TransactionReport
     """
-    # Get groups led by transactions in this account
-    groups = {
-        g.id
-        for g in TransactionGroup.query.join(
-            TransactionReview,
-            TransactionGroup.leader_id == TransactionReview.id,
-        )
-        .join(Transaction)
-        .filter(Transaction.account_id == account_id)
-        .all()
-    }
 
-    reviews = {
-        r.id
-        for r in TransactionReview.query.join(Transaction).filter(
-            Transaction.account_id == account_id
-        )
-    }
+    all_net: Money
+    share_net: Money
+    reimbursed_net: Money
+    other_net: Money
 
-    # Update transactions to no longer refer to this group
-    print("Removing transaction group references...")
-    db.session.execute(
-        sqlalchemy.update(TransactionReview)
-        .where(TransactionReview.group_id.in_(groups))
-        .values(group_id=None)
-    )
-
-    print("Removing transaction groups...")
-    db.session.execute(
-        sqlalchemy.delete(TransactionGroup).where(
-            TransactionGroup.id.in_(groups)
-        )
-    )
 
-    print("Removing subscription references...")
-    db.session.execute(
-        sqlalchemy.update(Transaction)
-        .where(Transaction.account_id == account_id)
-        .values(subscription_id=None)
+def get_group_totals(group: TransactionGroup) -> GroupTotals:
+    return GroupTotals(
+        group.amount,
+        group.share,
+        group.reimbursement_amount,
+        group.other_reimbursement,
     )
 
-    print("Removing subscriptions...")
-    db.session.execute(
-        sqlalchemy.delete(Subscription).where(
-            Subscription.account_id == account_id
-        )
-    )
 
-    print("Removing transaction reviews...")
-    db.session.execute(
-        sqlalchemy.delete(TransactionReview).where(
-            TransactionReview.id.in_(reviews)
-        )
-    )
-    print("Removing transactions...")
-    db.session.execute(
-        sqlalchemy.delete(Transaction).where(
-            Transaction.account_id == account_id
-        )
-    )
-    print("Removing account...")
-    db.session.execute(
-        sqlalchemy.delete(UserPlaidAccount).where(
-            UserPlaidAccount.id == account_id
-        )
+def get_group_members(group: TransactionGroup) -> t.List[Transaction]:
+    """
+    Return the transactions in a group, with their reviews, in one query
+    """
+    return (
+        Transaction.query.join(TransactionReview)
+        .filter(TransactionReview.group_id == group.id)
+        .options(db.contains_eager(Transaction.review))
+        .order_by(Transaction.original_date, Transaction.id)
+        .all()
     )
-    db.session.commit()
 
 
 def get_user_settings(user: User) -> UserSettings:
@@ -1353,8 +2059,11 @@ def scheduled_sync(fake_error: t.Optional[str] = None):
 
         print(f"Scheduled sync for {user.username}")
 
+        deleting = accounts_being_deleted(user)
         for item in get_plaid_items(user):
             for account in item.accounts:
+                if account.id in deleting:
+                    continue
                 if account.sync_start:
                     try:
                         result = sync_account(account)
@@ -187,7 +187,7 @@ class Transaction(Model):
     """
 
     plaid_txn_id = Column(String(100), nullable=False)
-    amount = Column(SafeNumeric(16, 3), nullable=False)
+    amount = Column(SafeNumeric(16, 3, as_money=True), nullable=False)
     posted = Column(Boolean, nullable=False)
     name = Column(String, nullable=False)
     date = Column(Date, nullable=False)
@@ -233,6 +233,14 @@ class Transaction(Model):
         backref=db.backref("transactions", lazy="select"),
     )
 
+    rule_id = Column(Integer, ForeignKey("category_rule.id"), nullable=True)
+    """The first CategoryRule which matches this transaction, if any.
+
+    Rules are matched when a transaction is synced, and the rule's category is
+    the guess used when the transaction is reviewed.
+    """
+    rule = db.relationship("CategoryRule")
+
     account = db.relationship(
         "UserPlaidAccount",
         backref=db.backref("transactions", lazy="select"),
@@ -251,10 +259,30 @@ class Transaction(Model):
             ["subscription.id"],
             name="transaction__fk_subscription_id",
         ),
+        # Transaction listings are paged by (original_date, id)
+        db.Index(
+            "user_plaid_transaction__account_id__original_date",
+            "account_id",
+            "original_date",
+            "id",
+        ),
+        db.Index(
+            "user_plaid_transaction__original_date",
+            "original_date",
+            "id",
+        ),
     )
 
 
 class TransactionGroup(Model):
+    """
+    Reviewed transactions which are counted together, led by one of them
+
+    The member count and totals are kept up to date whenever members are added
+    or removed, or their transactions or reviews change (see summary.py), so a
+    group can be shown without loading its members.
+    """
+
     __tablename__ = "transaction_group"
 
     id = Column(Integer, primary_key=True)
@@ -270,6 +298,20 @@ class TransactionGroup(Model):
         foreign_keys=[leader_id],
     )
 
+    member_count = Column(Integer, nullable=False, server_default="0")
+    amount = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False, server_default="0"
+    )
+    share = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False, server_default="0"
+    )
+    reimbursement_amount = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False, server_default="0"
+    )
+    other_reimbursement = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False, server_default="0"
+    )
+
 
 class TransactionReview(Model):
     __tablename__ = "transaction_review"
@@ -287,9 +329,11 @@ class TransactionReview(Model):
         lazy="select",
     )
 
-    reimbursement_amount = Column(SafeNumeric(16, 3), nullable=False)
+    reimbursement_amount = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False
+    )
     other_reimbursement = Column(
-        SafeNumeric(16, 3), nullable=False, server_default="0"
+        SafeNumeric(16, 3, as_money=True), nullable=False, server_default="0"
     )
     category = Column(String(100), nullable=False)
     notes = Column(String, nullable=True)
@@ -313,7 +357,7 @@ class TransactionReview(Model):
         lazy=True,
     )
 
-    reviewed_amount = Column(SafeNumeric(16, 3), nullable=True)
+    reviewed_amount = Column(SafeNumeric(16, 3, as_money=True), nullable=True)
     reviewed_posted = Column(Boolean, nullable=True)
     reviewed_name = Column(String, nullable=True)
     reviewed_date = Column(Date, nullable=True)
@@ -376,6 +420,90 @@ class Subscription(Model):
     )
 
 
+class CategoryRule(Model):
+    """
+    A user-defined rule which guesses the category of matching transactions
+
+    A rule matches when every condition which is set holds: the name or
+    merchant contains some text (ignoring case), the name or merchant matches
+    a regular expression, the amount is within a range, or the transaction is
+    in a certain account or payment channel. Rules with a higher priority are
+    tried first, and the first matching rule wins. See medb.shiso.rules.
+    """
+
+    __tablename__ = "category_rule"
+
+    id = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    user = db.relationship("User")
+
+    category = Column(String(100), nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+
+    name_contains = Column(String, nullable=True)
+    merchant_contains = Column(String, nullable=True)
+    pattern = Column(String, nullable=True)
+    min_amount = Column(SafeNumeric(16, 3, as_money=True), nullable=True)
+    max_amount = Column(SafeNumeric(16, 3, as_money=True), nullable=True)
+    account_id = Column(
+        Integer, ForeignKey("user_plaid_account.id"), nullable=True
+    )
+    payment_channel = Column(
+        Enum(
+            PaymentChannel, values_callable=lambda obj: [e.value for e in obj]
+        ),
+        nullable=True,
+    )
+
+    account = db.relationship("UserPlaidAccount")
+
+
+class CategorySummary(Model):
+    """
+    Transaction sums per account, month and category
+
+    Reports over whole months read these rows instead of the transactions. They
+    are kept up to date whenever transactions or reviews change (see
+    summary.py), and can be rebuilt with "flask shiso rebuild-summaries".
+
+    Only active transactions are counted. Unreviewed transactions are summed
+    into a row with reviewed=False and an empty category, and only their
+    amount is meaningful.
+    """
+
+    __tablename__ = "category_summary"
+
+    id = Column(Integer, primary_key=True)
+    account_id = Column(
+        Integer, ForeignKey("user_plaid_account.id"), nullable=False
+    )
+    # First day of the month, based on Transaction.original_date
+    month = Column(Date, nullable=False)
+    reviewed = Column(Boolean, nullable=False)
+    category = Column(String(100), nullable=False)
+
+    count = Column(Integer, nullable=False)
+    amount = Column(SafeNumeric(16, 3, as_money=True), nullable=False)
+    share = Column(SafeNumeric(16, 3, as_money=True), nullable=False)
+    reimbursement_amount = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False
+    )
+    other_reimbursement = Column(
+        SafeNumeric(16, 3, as_money=True), nullable=False
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "account_id",
+            "month",
+            "reviewed",
+            "category",
+            name="category_summary__bucket__unique",
+        ),
+    )
+
+
 class UserSettings(Model):
     """
     Per-user settings
@@ -389,3 +517,31 @@ class UserSettings(Model):
     user = db.relationship("User")
 
     scheduled_sync = Column(Boolean, nullable=False, default=False)
+
+
+class DeletionJob(Model):
+    """
+    A background deletion of a linked account, or of all the user's linked
+    items and accounts (see deletion.py)
+
+    The deletion goes through its stages in order, a batch of rows at a time,
+    and the job records which stage it is in after every batch, so it can be
+    resumed after an interruption.
+    """
+
+    __tablename__ = "deletion_job"
+
+    id = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    user = db.relationship("User")
+
+    # The account to delete, or None for all of the user's items. This isn't a
+    # foreign key, since the account is deleted by the job.
+    account_id = Column(Integer, nullable=True)
+
+    stage = Column(String(32), nullable=False)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    created = Column(TZDateTime(), nullable=False, default=utcnow)
+    updated = Column(TZDateTime(), nullable=False, default=utcnow)
+    finished = Column(TZDateTime(), nullable=True)
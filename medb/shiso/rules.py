@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Guess transaction categories with the user's CategoryRules
+
+A user's rules are compiled into a RuleMatcher, which is built once per sync
+(or per retroactive application) and then matched against each transaction.
+Most rules look for some text in the name or merchant. Rather than trying
+each rule in turn, all of that text is put in one Aho-Corasick automaton per
+field, which finds every rule whose text occurs in a single pass over the
+transaction's name and merchant. Only those rules, plus any rules without
+text, have their remaining conditions (regular expression, amount, account,
+payment channel) checked, in priority order.
+"""
+import collections
+import re
+import typing as t
+
+import sqlalchemy
+from toolz import partition_all
+
+from medb.extensions import db
+from medb.model_util import Money
+from medb.user.models import User
+
+from .models import CategoryRule
+from .models import PaymentChannel
+from .models import Transaction
+from .models import UserPlaidAccount
+from .models import UserPlaidItem
+
+# Transactions matched and updated at a time by apply_rules()
+APPLY_BATCH_SIZE = 1000
+
+
+class _Automaton:
+    """
+    An Aho-Corasick automaton, which finds which of a set of keywords occur in
+    a text, in one pass over the text
+    """
+
+    def __init__(self, keywords: t.Iterable[t.Tuple[str, int]]) -> None:
+        # State 0 is the root. Each state has its transitions, its failure
+        # state, and the values of the keywords which end there.
+        self.goto: t.List[t.Dict[str, int]] = [{}]
+        out: t.List[t.Set[int]] = [set()]
+        for keyword, value in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    out.append(set())
+                state = self.goto[state][char]
+            out[state].add(value)
+
+        # Breadth first, so that the failure state of a state is done before
+        # it is used for the state's children
+        self.fail = [0] * len(self.goto)
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                out[child] |= out[self.fail[child]]
+        self.out = [frozenset(values) for values in out]
+
+    def find(self, text: str) -> t.Set[int]:
+        found: t.Set[int] = set()
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class _Rule(t.NamedTuple):
+    """The parts of a CategoryRule needed for matching"""
+
+    id: int
+    category: str
+    name_contains: t.Optional[str]
+    merchant_contains: t.Optional[str]
+    pattern: t.Optional[t.Pattern[str]]
+    min_amount: t.Optional[int]
+    max_amount: t.Optional[int]
+    account_id: t.Optional[int]
+    payment_channel: t.Optional[PaymentChannel]
+
+    def check(
+        self,
+        name: str,
+        merchant: t.Optional[str],
+        amount: Money,
+        account_id: int,
+        payment_channel: PaymentChannel,
+    ) -> bool:
+        """Check everything except the contained text"""
+        if self.min_amount is not None and amount.millis < self.min_amount:
+            return False
+        if self.max_amount is not None and amount.millis > self.max_amount:
+            return False
+        if self.account_id is not None and account_id != self.account_id:
+            return False
+        if (
+            self.payment_channel is not None
+            and payment_channel != self.payment_channel
+        ):
+            return False
+        if self.pattern is not None and not (
+            self.pattern.search(name)
+            or (merchant and self.pattern.search(merchant))
+        ):
+            return False
+        return True
+
+
+def compile_pattern(pattern: str) -> t.Pattern[str]:
+    """
+    Compile a rule's pattern, raising re.error if it's invalid
+    """
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _millis(amount: t.Optional[Money]) -> t.Optional[int]:
+    return None if amount is None else amount.millis
+
+
+class RuleMatcher:
+    """
+    A compiled set of CategoryRules, see the module docstring
+    """
+
+    def __init__(self, rules: t.Iterable[CategoryRule]) -> None:
+        # In priority order, so a rule's index is its rank
+        self.rules: t.List[_Rule] = []
+        for rule in sorted(rules, key=lambda r: (-r.priority, r.id)):
+            self.rules.append(
+                _Rule(
+                    rule.id,
+                    rule.category,
+                    (rule.name_contains or "").lower() or None,
+                    (rule.merchant_contains or "").lower() or None,
+                    compile_pattern(rule.pattern) if rule.pattern else None,
+                    _millis(rule.min_amount),
+                    _millis(rule.max_amount),
+                    rule.account_id,
+                    rule.payment_channel,
+                )
+            )
+        self.names = _Automaton(
+            (rule.name_contains, i)
+            for i, rule in enumerate(self.rules)
+            if rule.name_contains
+        )
+        self.merchants = _Automaton(
+            (rule.merchant_contains, i)
+            for i, rule in enumerate(self.rules)
+            if rule.merchant_contains
+        )
+        # Rules which need text in both fields, and those which need none
+        self.both = {
+            i
+            for i, rule in enumerate(self.rules)
+            if rule.name_contains and rule.merchant_contains
+        }
+        self.textless = {
+            i
+            for i, rule in enumerate(self.rules)
+            if not rule.name_contains and not rule.merchant_contains
+        }
+
+    def match(
+        self,
+        name: str,
+        merchant: t.Optional[str],
+        amount: Money,
+        account_id: int,
+        payment_channel: PaymentChannel,
+    ) -> t.Optional[int]:
+        """
+        Return the ID of the first rule matching a transaction, if any
+        """
+        in_name = self.names.find(name.lower())
+        in_merchant = (
+            self.merchants.find(merchant.lower()) if merchant else set()
+        )
+        candidates = (in_name | in_merchant) - self.both
+        candidates |= in_name & in_merchant
+        candidates |= self.textless
+        for i in sorted(candidates):
+            rule = self.rules[i]
+            if rule.check(name, merchant, amount, account_id, payment_channel):
+                return rule.id
+        return None
+
+    def match_transaction(self, txn: Transaction) -> t.Optional[int]:
+        return self.match(
+            txn.name,
+            txn.plaid_merchant_name,
+            txn.amount,
+            txn.account_id,
+            txn.plaid_payment_channel,
+        )
+
+
+def get_rules(user_id: int) -> t.List[CategoryRule]:
+    return (
+        CategoryRule.query.filter(CategoryRule.user_id == user_id)
+        .order_by(CategoryRule.priority.desc(), CategoryRule.id)
+        .all()
+    )
+
+
+def load_matcher(user_id: int) -> RuleMatcher:
+    return RuleMatcher(get_rules(user_id))
+
+
+def apply_rules(user: User) -> t.Tuple[int, t.Dict[str, t.List[int]]]:
+    """
+    Match the user's rules against all of their transactions, updating each
+    transaction's rule_id. This doesn't commit.
+
+    Return the number of transactions whose rule changed, and the IDs of the
+    transactions matched by each category. Those can be passed on to
+    bulk_update_transactions() to recategorize history by the rules.
+    """
+    matcher = load_matcher(user.id)
+    categories = {rule.id: rule.category for rule in matcher.rules}
+    query = (
+        sqlalchemy.select(
+            Transaction.id,
+            Transaction.rule_id,
+            Transaction.name,
+            Transaction.plaid_merchant_name,
+            Transaction.amount,
+            Transaction.account_id,
+            Transaction.plaid_payment_channel,
+        )
+        .join(UserPlaidAccount)
+        .join(UserPlaidItem)
+        .where(UserPlaidItem.user_id == user.id)
+        .execution_options(yield_per=APPLY_BATCH_SIZE)
+    )
+    # The matches are collected first: updating the table while reading it
+    # through the same connection isn't allowed.
+    changed = []
+    matched: t.Dict[str, t.List[int]] = {}
+    for txn_id, old_rule, *fields in db.session.execute(query):
+        rule_id = matcher.match(*fields)
+        if rule_id != old_rule:
+            changed.append({"id": txn_id, "rule_id": rule_id})
+        if rule_id is not None:
+            matched.setdefault(categories[rule_id], []).append(txn_id)
+    for batch in partition_all(APPLY_BATCH_SIZE, changed):
+        db.session.execute(sqlalchemy.update(Transaction), list(batch))
+    return len(changed), matched
+
+
+def delete_rule(rule: CategoryRule) -> None:
+    db.session.execute(
+        sqlalchemy.update(Transaction)
+        .where(Transaction.rule_id == rule.id)
+        .values(rule_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.delete(rule)
+    db.session.commit()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search over transaction names, merchants and review notes
+
+The text is indexed in an SQLite FTS5 table, "transaction_search", whose rowid
+is the transaction ID. Triggers on the transaction and review tables keep it
+up to date, so none of the write paths need to know about it. Search text is
+turned into an FTS5 query where each word matches as a prefix, and "quoted
+text" matches as a phrase. Results are ranked with bm25.
+"""
+import re
+import typing as t
+
+import sqlalchemy
+from sqlalchemy import DDL
+from sqlalchemy import event
+from sqlalchemy.orm import Query
+
+from medb.extensions import db
+
+from .models import Transaction
+
+SEARCH_TABLE = sqlalchemy.table(
+    "transaction_search",
+    sqlalchemy.column("rowid", sqlalchemy.Integer),
+    sqlalchemy.column("name", sqlalchemy.String),
+    sqlalchemy.column("merchant", sqlalchemy.String),
+    sqlalchemy.column("notes", sqlalchemy.String),
+)
+
+# bm25 weights for the name, merchant and notes columns
+RANK_WEIGHTS = (2.0, 2.0, 1.0)
+
+SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE transaction_search USING fts5(
+        name, merchant, notes,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER transaction_search__txn_insert
+    AFTER INSERT ON user_plaid_transaction BEGIN
+        INSERT INTO transaction_search (rowid, name, merchant, notes)
+        VALUES (new.id, new.name, coalesce(new.plaid_merchant_name, ''), '');
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search__txn_update
+    AFTER UPDATE OF name, plaid_merchant_name ON user_plaid_transaction BEGIN
+        UPDATE transaction_search
+        SET name = new.name, merchant = coalesce(new.plaid_merchant_name, '')
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search__txn_delete
+    AFTER DELETE ON user_plaid_transaction BEGIN
+        DELETE FROM transaction_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search__review_insert
+    AFTER INSERT ON transaction_review BEGIN
+        UPDATE transaction_search SET notes = coalesce(new.notes, '')
+        WHERE rowid = new.transaction_id;
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search__review_update
+    AFTER UPDATE OF notes, transaction_id ON transaction_review BEGIN
+        UPDATE transaction_search SET notes = ''
+        WHERE rowid = old.transaction_id;
+        UPDATE transaction_search SET notes = coalesce(new.notes, '')
+        WHERE rowid = new.transaction_id;
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search__review_delete
+    AFTER DELETE ON transaction_review BEGIN
+        UPDATE transaction_search SET notes = ''
+        WHERE rowid = old.transaction_id;
+    END
+    """,
+]
+
+# Tables made by "flask shiso init" get the search index too. Existing
+# databases get it from a migration.
+for _statement in SEARCH_DDL:
+    event.listen(
+        db.metadata,
+        "after_create",
+        DDL(_statement).execute_if(dialect="sqlite"),
+    )
+
+_SEARCH_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def match_expression(text: str) -> t.Optional[str]:
+    """
+    Return the FTS5 query for some search text, or None if it has no terms
+
+    Every word must appear, either as a word or the start of one. Text in
+    double quotes must appear as a phrase. FTS5 operators and syntax in the
+    text are taken literally, so any input is a valid query.
+    """
+    terms = []
+    for phrase, word in _SEARCH_TERM.findall(text):
+        # Terms of only punctuation have no tokens, and FTS5 rejects those.
+        if phrase and any(c.isalnum() for c in phrase):
+            terms.append(_quote(phrase))
+        elif word and any(c.isalnum() for c in word):
+            terms.append(_quote(word) + "*")
+    return " ".join(terms) or None
+
+
+def filter_search(
+    query: Query[Transaction], expression: str
+) -> Query[Transaction]:
+    """
+    Limit a transaction query to those matching a match_expression()
+    """
+    return query.join(
+        SEARCH_TABLE, SEARCH_TABLE.c.rowid == Transaction.id
+    ).filter(sqlalchemy.literal_column("transaction_search").match(expression))
+
+
+def search_rank() -> sqlalchemy.ColumnElement[float]:
+    """
+    Ordering for a filter_search() query, best match first
+    """
+    return sqlalchemy.func.bm25(
+        sqlalchemy.literal_column("transaction_search"), *RANK_WEIGHTS
+    )
+
+
+def rebuild_search_index() -> None:
+    db.session.execute(sqlalchemy.text("DELETE FROM transaction_search"))
+    db.session.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO transaction_search (rowid, name, merchant, notes)
+            SELECT
+                t.id,
+                t.name,
+                coalesce(t.plaid_merchant_name, ''),
+                coalesce(r.notes, '')
+            FROM user_plaid_transaction t
+            LEFT JOIN transaction_review r ON r.transaction_id = t.id
+            """
+        )
+    )
+    db.session.commit()
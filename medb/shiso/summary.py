@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Maintain the monthly category summaries (see CategorySummary), and the totals
+of transaction groups
+
+Whenever transactions or reviews change, the affected (account, month) buckets
+are recomputed from scratch with a GROUP BY. A bucket holds at most a few
+hundred transactions, so this is cheap, and it can't drift the way adding and
+subtracting deltas could. Group totals are recomputed from their members in the
+same way.
+"""
+import datetime
+import typing as t
+
+import sqlalchemy
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import or_
+
+from medb.extensions import db
+from medb.model_util import Money
+
+from .models import CategorySummary
+from .models import Transaction
+from .models import TransactionGroup
+from .models import TransactionReview
+from .models import UserPlaidAccount
+
+# Aggregate columns, in the order they are stored and reported: count, amount,
+# share, reimbursement and other reimbursement.
+SumColumns = t.List[sqlalchemy.ColumnElement[t.Any]]
+
+# IDs given either as values, or as a query selecting them
+Ids = t.Union[t.Collection[int], sqlalchemy.Select[t.Tuple[int]]]
+
+
+def month_of(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def full_months(
+    start_date: t.Optional[datetime.date],
+    end_date: t.Optional[datetime.date],
+) -> t.Optional[t.Tuple[datetime.date, datetime.date]]:
+    """
+    Return the [first, stop) range of months entirely within the inclusive
+    date range, or None if there aren't any.
+    """
+    if not start_date or not end_date:
+        return None
+    first = (
+        start_date if start_date.day == 1 else next_month(month_of(start_date))
+    )
+    stop = month_of(end_date + datetime.timedelta(days=1))
+    if first >= stop:
+        return None
+    return first, stop
+
+
+def transaction_sums() -> SumColumns:
+    """
+    Aggregates over Transaction outer joined to TransactionReview
+    """
+    return [
+        func.count(Transaction.id),
+        func.sum(Transaction.amount),
+        func.sum(
+            Transaction.amount
+            - TransactionReview.reimbursement_amount
+            - TransactionReview.other_reimbursement
+        ),
+        func.sum(TransactionReview.reimbursement_amount),
+        func.sum(TransactionReview.other_reimbursement),
+    ]
+
+
+def summary_sums() -> SumColumns:
+    """
+    The same aggregates as transaction_sums(), over CategorySummary rows
+    """
+    return [
+        func.sum(CategorySummary.count),
+        func.sum(CategorySummary.amount),
+        func.sum(CategorySummary.share),
+        func.sum(CategorySummary.reimbursement_amount),
+        func.sum(CategorySummary.other_reimbursement),
+    ]
+
+
+def refresh_summaries(
+    account_id: int,
+    months: t.Optional[t.Iterable[datetime.date]] = None,
+) -> None:
+    """
+    Recompute the summaries of an account for some months, or all of them.
+    This doesn't commit, so that it's part of the caller's transaction.
+    """
+    reviewed: sqlalchemy.ColumnElement[bool] = TransactionReview.id.isnot(None)
+    delete = sqlalchemy.delete(CategorySummary).where(
+        CategorySummary.account_id == account_id
+    )
+    # Grouping by day keeps this portable, the days are folded into months
+    # below.
+    query = (
+        sqlalchemy.select(
+            Transaction.original_date,
+            reviewed,
+            TransactionReview.category,
+            *transaction_sums(),
+        )
+        .outerjoin(Transaction.review)
+        .where(Transaction.account_id == account_id, Transaction.active)
+        .group_by(
+            Transaction.original_date, reviewed, TransactionReview.category
+        )
+    )
+    if months is not None:
+        months = sorted(set(months))
+        if not months:
+            return
+        delete = delete.where(CategorySummary.month.in_(months))
+        query = query.where(
+            or_(
+                *(
+                    and_(
+                        Transaction.original_date >= month,
+                        Transaction.original_date < next_month(month),
+                    )
+                    for month in months
+                )
+            )
+        )
+    db.session.execute(delete)
+
+    # Count, then sums in integer millis
+    buckets: t.Dict[t.Tuple[datetime.date, bool, str], t.List[int]] = {}
+    for day, is_reviewed, category, count, *sums in db.session.execute(query):
+        key = (month_of(day), bool(is_reviewed), category or "")
+        bucket = buckets.setdefault(key, [0, 0, 0, 0, 0])
+        bucket[0] += count
+        for i, value in enumerate(sums, start=1):
+            if value is not None:
+                bucket[i] += value.millis
+    if not buckets:
+        return
+    db.session.execute(
+        sqlalchemy.insert(CategorySummary),
+        [
+            {
+                "account_id": account_id,
+                "month": month,
+                "reviewed": is_reviewed,
+                "category": category,
+                "count": count,
+                "amount": Money(amount),
+                "share": Money(share),
+                "reimbursement_amount": Money(reimbursed),
+                "other_reimbursement": Money(other),
+            }
+            for (month, is_reviewed, category), (
+                count,
+                amount,
+                share,
+                reimbursed,
+                other,
+            ) in buckets.items()
+        ],
+    )
+
+
+def _refresh_days(days: t.Iterable[t.Tuple[int, datetime.date]]) -> None:
+    months: t.Dict[int, t.Set[datetime.date]] = {}
+    for account_id, day in days:
+        months.setdefault(account_id, set()).add(month_of(day))
+    for account_id, account_months in months.items():
+        refresh_summaries(account_id, account_months)
+
+
+def refresh_transaction_summaries(txns: t.Iterable[Transaction]) -> None:
+    """
+    Recompute the summaries for the months which contain these transactions
+    """
+    _refresh_days((txn.account_id, txn.original_date) for txn in txns)
+
+
+def refresh_selected_summaries(
+    txn_ids: sqlalchemy.Select[t.Tuple[int]],
+) -> None:
+    """
+    Recompute the summaries for the months which contain the transactions
+    whose IDs are selected, without loading the transactions
+    """
+    days: sqlalchemy.Result[t.Tuple[int, datetime.date]] = db.session.execute(
+        sqlalchemy.select(Transaction.account_id, Transaction.original_date)
+        .where(Transaction.id.in_(txn_ids))
+        .distinct()
+    )
+    _refresh_days(days.tuples())
+
+
+def refresh_group_totals(
+    group_ids: t.Optional[Ids] = None,
+) -> None:
+    """
+    Recompute the member count and totals of some transaction groups, or all
+    of them, with a single UPDATE. This doesn't commit.
+    """
+    members = (
+        sqlalchemy.select()
+        .select_from(Transaction)
+        .join(TransactionReview)
+        .where(TransactionReview.group_id == TransactionGroup.id)
+    )
+    columns: t.List[sqlalchemy.Column[t.Any]] = [
+        TransactionGroup.member_count,
+        TransactionGroup.amount,
+        TransactionGroup.share,
+        TransactionGroup.reimbursement_amount,
+        TransactionGroup.other_reimbursement,
+    ]
+    update = sqlalchemy.update(TransactionGroup).values(
+        {
+            column: func.coalesce(
+                members.add_columns(total).scalar_subquery(),
+                sqlalchemy.literal_column("0"),
+            )
+            for column, total in zip(columns, transaction_sums())
+        }
+    )
+    if group_ids is not None:
+        update = update.where(TransactionGroup.id.in_(group_ids))
+    db.session.execute(update)
+
+
+def refresh_transaction_groups(txn_ids: Ids) -> None:
+    """
+    Recompute the totals of the groups containing these transactions
+    """
+    refresh_group_totals(
+        sqlalchemy.select(TransactionReview.group_id).where(
+            TransactionReview.transaction_id.in_(txn_ids),
+            TransactionReview.group_id.isnot(None),
+        )
+    )
+
+
+def rebuild_summaries() -> None:
+    account_ids: t.Sequence[int] = db.session.scalars(
+        sqlalchemy.select(UserPlaidAccount.id)
+    ).all()
+    for account_id in account_ids:
+        refresh_summaries(account_id)
+    refresh_group_totals()
+    db.session.commit()
@@ -3,8 +3,12 @@
 Celery tasks
 """
 from medb.extensions import celery
+from medb.extensions import db
 
+from .deletion import resume_stalled_jobs
+from .deletion import run_job
 from .logic import scheduled_sync
+from .models import DeletionJob
 
 
 @celery.task
@@ -15,3 +19,15 @@ def hello():
 @celery.task
 def run_scheduled_sync():
     scheduled_sync()
+
+
+@celery.task
+def run_deletion_job(job_id: int) -> None:
+    job = db.session.get(DeletionJob, job_id)
+    if job:
+        run_job(job)
+
+
+@celery.task
+def resume_deletion_jobs() -> None:
+    resume_stalled_jobs()
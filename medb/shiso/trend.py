@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Category trends over many periods
+
+The monthly category summaries are loaded once, as integer milli-dollars, and
+scattered into a (category x period) matrix per measure with NumPy. Deltas and
+rolling averages are computed on the whole matrix at once, so a report over
+years of history costs about the same as one over a single month.
+"""
+import datetime
+import enum
+import typing as t
+from dataclasses import dataclass
+
+import numpy as np
+import sqlalchemy
+
+from medb.extensions import db
+from medb.model_util import Money
+from medb.user.models import User
+
+from .models import CATEGORY_PARENT_V2
+from .models import CategorySummary
+from .models import UserPlaidAccount
+from .models import UserPlaidItem
+
+MEASURES = ("all", "share", "reimbursed")
+
+# Amounts are stored with three decimal places
+SCALE = 1000
+
+
+class TrendPeriod(enum.Enum):
+    month = 1
+    quarter = 3
+    year = 12
+
+
+def period_start(month: datetime.date, period: TrendPeriod) -> datetime.date:
+    index = (month.month - 1) // period.value * period.value
+    return datetime.date(month.year, index + 1, 1)
+
+
+def month_number(day: datetime.date) -> int:
+    return day.year * 12 + day.month - 1
+
+
+def month_from_number(number: int) -> datetime.date:
+    return datetime.date(number // 12, number % 12 + 1, 1)
+
+
+@dataclass
+class TrendReport:
+
+    period: TrendPeriod
+    periods: t.List[datetime.date]
+    categories: t.List[str]
+    window: int
+
+    # Each is (categories x periods), in milli-dollars
+    values: t.Dict[str, np.ndarray]
+
+    @property
+    def labels(self) -> t.List[str]:
+        if self.period == TrendPeriod.year:
+            return [str(p.year) for p in self.periods]
+        if self.period == TrendPeriod.quarter:
+            return [f"{p.year} Q{(p.month + 2) // 3}" for p in self.periods]
+        return [p.strftime("%Y-%m") for p in self.periods]
+
+    def deltas(self, measure: str) -> np.ndarray:
+        """
+        Change from the previous period. The first period has no previous one,
+        so it's NaN.
+        """
+        values = self.values[measure]
+        deltas = np.full(values.shape, np.nan)
+        deltas[:, 1:] = np.diff(values, axis=1)
+        return deltas
+
+    def rolling(self, measure: str) -> np.ndarray:
+        """
+        Average over the trailing window of periods. Periods without a full
+        window behind them are NaN.
+        """
+        values = self.values[measure]
+        rolling = np.full(values.shape, np.nan)
+        if values.shape[1] >= self.window:
+            csum = np.cumsum(values, axis=1, dtype=np.float64)
+            csum = np.concatenate(
+                [np.zeros((values.shape[0], 1)), csum], axis=1
+            )
+            window_sums = csum[:, self.window :] - csum[:, : -self.window]
+            rolling[:, self.window - 1 :] = window_sums / self.window
+        return rolling
+
+    def view(self, measure: str, view: str) -> np.ndarray:
+        if view == "deltas":
+            return self.deltas(measure)
+        if view == "rolling":
+            return self.rolling(measure)
+        return self.values[measure]
+
+    def rows(
+        self, measure: str, view: str
+    ) -> t.List[t.Tuple[str, t.List[t.Optional[Money]]]]:
+        """
+        Return (category, amounts) rows for display, with a final row for the
+        total over all categories.
+        """
+        matrix = self.view(measure, view)
+        totals = np.nansum(matrix, axis=0)
+        if view != "values":
+            # Keep the NaN columns blank in the total, too
+            totals[np.isnan(matrix).all(axis=0)] = np.nan
+        labels = self.categories + ["All Categories"]
+        return [
+            (label, [to_money(v) for v in row])
+            for label, row in zip(labels, np.vstack([matrix, totals]))
+        ]
+
+    def to_json(self) -> t.Dict[str, t.Any]:
+        def dollars(matrix: np.ndarray) -> t.List[t.List[t.Optional[float]]]:
+            return [
+                [
+                    None if np.isnan(v) else round(float(v) / SCALE, 3)
+                    for v in row
+                ]
+                for row in matrix.astype(np.float64)
+            ]
+
+        return {
+            "period": self.period.name,
+            "periods": [p.isoformat() for p in self.periods],
+            "categories": self.categories,
+            "window": self.window,
+            "measures": {
+                measure: {
+                    "values": dollars(self.values[measure]),
+                    "deltas": dollars(self.deltas(measure)),
+                    "rolling": dollars(self.rolling(measure)),
+                }
+                for measure in MEASURES
+            },
+        }
+
+
+def to_money(value: float) -> t.Optional[Money]:
+    if np.isnan(value):
+        return None
+    return Money(int(round(value)))
+
+
+def compute_trend_report(
+    user: User,
+    start_month: datetime.date,
+    end_month: datetime.date,
+    period: TrendPeriod = TrendPeriod.month,
+    by_parent: bool = False,
+    include_transfer: bool = False,
+    accounts: t.Optional[t.Container[int]] = None,
+    window: int = 3,
+) -> TrendReport:
+    """
+    Compute reviewed amounts per category for each period overlapping the
+    months from start_month to end_month (inclusive). Periods are always
+    whole, so a quarterly report starting in February starts in January.
+    """
+    first = month_number(period_start(start_month, period))
+    last = month_number(period_start(end_month, period))
+    periods = [
+        month_from_number(number)
+        for number in range(first, last + 1, period.value)
+    ]
+
+    query = (
+        sqlalchemy.select(
+            CategorySummary.month,
+            CategorySummary.category,
+            sqlalchemy.func.sum(CategorySummary.amount),
+            sqlalchemy.func.sum(CategorySummary.share),
+            sqlalchemy.func.sum(CategorySummary.reimbursement_amount),
+        )
+        .join(
+            UserPlaidAccount,
+            CategorySummary.account_id == UserPlaidAccount.id,
+        )
+        .join(UserPlaidAccount.item)
+        .filter(
+            UserPlaidItem.user_id == user.id,
+            CategorySummary.reviewed,
+            CategorySummary.month >= periods[0],
+            CategorySummary.month < month_from_number(last + period.value),
+        )
+        .group_by(CategorySummary.month, CategorySummary.category)
+    )
+    if accounts:
+        query = query.filter(CategorySummary.account_id.in_(accounts))
+    if not include_transfer:
+        query = query.filter(CategorySummary.category != "Transfer")
+    rows = db.session.execute(query).all()
+
+    labels = [
+        (
+            CATEGORY_PARENT_V2.get(row.category, row.category)
+            if by_parent
+            else row.category
+        )
+        for row in rows
+    ]
+    categories = sorted(set(labels))
+    cat_index = {c: i for i, c in enumerate(categories)}
+    rows_cat = np.array([cat_index[label] for label in labels], dtype=np.intp)
+    months = np.array([month_number(row.month) for row in rows], dtype=np.intp)
+    rows_period = (months - first) // period.value
+    values = {}
+    for i, measure in enumerate(MEASURES, start=2):
+        amounts = np.array([row[i].millis for row in rows], dtype=np.int64)
+        matrix = np.zeros((len(categories), len(periods)), dtype=np.int64)
+        np.add.at(matrix, (rows_cat, rows_period), amounts)
+        values[measure] = matrix
+    return TrendReport(
+        period=period,
+        periods=periods,
+        categories=categories,
+        window=window,
+        values=values,
+    )
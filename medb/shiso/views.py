@@ -2,28 +2,45 @@
 """Public section, including homepage and signup."""
 import typing as t
 from datetime import date
+from datetime import datetime
+from datetime import timedelta
 from decimal import Decimal
 
 import click
 from flask import Blueprint
+from flask import Response
 from flask import abort
 from flask import flash
 from flask import redirect
 from flask import render_template
 from flask import request
 from flask import session
+from flask import stream_with_context
 from flask import url_for
 from flask_login import current_user
 from flask_login import login_required
 from markupsafe import Markup
+from sqlalchemy.orm import Query
 
+from medb.extensions import celery
 from medb.extensions import db
+from medb.model_util import Money
 from medb.user.models import User
 from medb.utils import flash_errors
-
+from medb.utils import stream_page
+
+from .deletion import get_unfinished_jobs
+from .deletion import run_job
+from .deletion import start_deletion
+from .export import EXPORT_FORMATS
+from .export import available_formats
+from .export import export_rows
 from .forms import AccountRenameForm
 from .forms import AccountReportForm
 from .forms import AddToGroupForm
+from .forms import ApplyRulesForm
+from .forms import BatchReviewForm
+from .forms import CategoryRuleForm
 from .forms import GenericReturnForm
 from .forms import LinkAccountForm
 from .forms import LinkItemForm
@@ -32,16 +49,25 @@ from .forms import SyncAccountForm
 from .forms import TransactionBulkUpdateForm
 from .forms import TransactionListForm
 from .forms import TransactionReviewForm
+from .forms import TrendReportForm
 from .forms import UserSettingsForm
+from .listing import transaction_rows
+from .logic import BATCH_REVIEW_SIZE
+from .logic import DEFAULT_PAGE_SIZE
+from .logic import MAX_PAGE_SIZE
 from .logic import ItemSummary
+from .logic import ListedT
+from .logic import TransactionCursor
+from .logic import TransactionPage
 from .logic import UpdateLink
+from .logic import account_transaction_report
 from .logic import add_to_group
-from .logic import compute_transaction_report
+from .logic import apply_category_rules
+from .logic import bulk_update_transactions
 from .logic import convert_to_group
 from .logic import create_item
-from .logic import dangerous_delete_account
-from .logic import do_bulk_transaction_update
-from .logic import get_all_user_transactions
+from .logic import get_group_members
+from .logic import get_group_totals
 from .logic import get_item_summary
 from .logic import get_linked_accounts
 from .logic import get_next_unreviewed_subscription
@@ -50,25 +76,43 @@ from .logic import get_plaid_items
 from .logic import get_subscriptions_transactions
 from .logic import get_transaction
 from .logic import get_transaction_groups
-from .logic import get_transactions
+from .logic import get_unreviewed_transactions
 from .logic import get_upa_by_id
 from .logic import get_upi_by_id
 from .logic import get_user_settings
+from .logic import get_user_transactions_bulk
+from .logic import guess_categories
 from .logic import guess_category
 from .logic import initial_sync
 from .logic import link_account
+from .logic import paginate_transactions
 from .logic import plaid_new_item_link_token
 from .logic import plaid_sandbox_reset_login
 from .logic import plaid_update_item_link_token
+from .logic import ranked_search_results
 from .logic import remove_from_group
 from .logic import review_deleted_transaction
 from .logic import review_transaction as do_review_transaction
+from .logic import review_transactions
 from .logic import scheduled_sync
 from .logic import sync_account
+from .logic import transactions_query
+from .logic import user_transaction_report
+from .logic import user_transactions_query
 from .models import CATEGORIES_V2
+from .models import CategoryRule
+from .models import DeletionJob
 from .models import Subscription
 from .models import Transaction
 from .models import UserPlaidAccount
+from .rules import delete_rule
+from .rules import get_rules
+from .search import match_expression
+from .search import rebuild_search_index
+from .summary import rebuild_summaries
+from .trend import TrendPeriod
+from .trend import TrendReport
+from .trend import compute_trend_report
 
 blueprint = Blueprint(
     "shiso", __name__, url_prefix="/shiso", static_folder="../static"
@@ -110,6 +154,37 @@ def _view_fetch_subscription(sub_id: int) -> Subscription:
     return sub
 
 
+def _view_per_page() -> int:
+    per_page = request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def _view_paginate(query: Query[ListedT]) -> TransactionPage[ListedT]:
+    """
+    Return the page of a transaction listing selected by the request's
+    "after", "before" and "per_page" arguments
+    """
+    per_page = _view_per_page()
+    # Malformed cursors are ignored, which leads back to the first page.
+    after = request.args.get("after", type=TransactionCursor.decode)
+    before = request.args.get("before", type=TransactionCursor.decode)
+    return paginate_transactions(query, per_page, after, before)
+
+
+@blueprint.app_template_global("page_url")
+def page_url(**cursor: t.Optional[TransactionCursor]) -> str:
+    """
+    Return the URL of the current listing, with the cursor arguments replaced
+    """
+    args = request.args.to_dict(flat=False)
+    args.pop("after", None)
+    args.pop("before", None)
+    for name, value in cursor.items():
+        if value is not None:
+            args[name] = [value.encode()]
+    return url_for(request.endpoint, **request.view_args, **args)
+
+
 def all_accounts() -> t.Iterator[UserPlaidAccount]:
     for item in get_plaid_items(current_user):
         for account in item.accounts:
@@ -261,14 +336,15 @@ def home():
 @login_required
 def account_transactions(account_id: int):
     account = _view_fetch_account(account_id)
-    txr = get_transactions(account)
+    page = _view_paginate(transaction_rows(transactions_query(account)))
     next_unreviewed = get_next_unreviewed_transaction(account)
-    return render_template(
+    return stream_page(
         "shiso/account_transactions.html",
-        txns=txr,
+        txns=page.transactions,
+        page=page,
         account=account,
         form=SyncAccountForm(),
-        upd_form=TransactionBulkUpdateForm(),
+        upd_form=_bulk_update_form(),
         next_unreviewed=next_unreviewed,
         review_dest=".account_review_transaction",
     )
@@ -327,11 +403,8 @@ def review_transaction(txn_id: int, acct: bool):
         # When this is the leader of a transaction group, fetch the others to
         # display
         if group.leader_id == txn.review.id:
-            group_members = group.members
-            group_report = compute_transaction_report(
-                [r.transaction for r in group_members],
-                include_transfer=True,
-            )
+            group_members = get_group_members(group)
+            group_report = get_group_totals(group)
             is_group_leader = True
         else:
             group_txn = group.leader.transaction
@@ -344,7 +417,7 @@ def review_transaction(txn_id: int, acct: bool):
             txn=txn,
             dest=dest,
             retform=retform,
-            group_members=[m.transaction for m in group_members],
+            group_members=group_members,
             group_report=group_report,
             group_txn=group_txn,
             is_group_leader=is_group_leader,
@@ -384,6 +457,40 @@ def review_transaction(txn_id: int, acct: bool):
         )
 
 
+@blueprint.route("/review/batch/", methods=["GET", "POST"])
+@login_required
+def batch_review():
+    if request.method == "GET":
+        txns = get_unreviewed_transactions(BATCH_REVIEW_SIZE, user=current_user)
+        if not txns:
+            # Any left over are inactive, and are reviewed one at a time
+            return redirect(url_for(".global_review"))
+        form = BatchReviewForm.create(
+            txns, guess_categories(current_user, txns)
+        )
+        return render_template("shiso/batch_review.html", form=form, txns=txns)
+    form = BatchReviewForm(request.form)
+    txn_ids = [entry.transaction_id.data for entry in form.transactions]
+    by_id = {
+        txn.id: txn for txn in get_user_transactions_bulk(current_user, txn_ids)
+    }
+    if None in txn_ids or len(by_id) != len(set(txn_ids)):
+        abort(404)
+    if not form.validate_on_submit():
+        # Errors are shown next to each transaction
+        flash("Nothing was reviewed, please fix the errors below", "warning")
+        txns = [by_id[txn_id] for txn_id in txn_ids]
+        return render_template("shiso/batch_review.html", form=form, txns=txns)
+    reviews = [
+        (by_id[entry.transaction_id.data], entry.form)
+        for entry in form.transactions
+        if not entry.form.skipped
+    ]
+    review_transactions(reviews)
+    flash(f"Success, reviewed {len(reviews)} transactions", "info")
+    return redirect(url_for(".batch_review"))
+
+
 @blueprint.route(
     "/transaction/<int:txn_id>/account-review/", methods=["GET", "POST"]
 )
@@ -445,7 +552,7 @@ def remove_from_group_view(txn_id: int):
     if rev.group_id is None:
         flash("The transaction is not part of a group.", "danger")
         return redirect(return_url)
-    if rev.group.leader_id == rev.id and len(rev.group.members) != 1:
+    if rev.group.leader_id == rev.id and rev.group.member_count != 1:
         flash("Please remove other transactions before the leader.", "danger")
         return redirect(return_url)
     remove_from_group(rev)
@@ -480,16 +587,28 @@ def group_add(txn_id: int):
     )
 
 
+def _bulk_update_form(formdata: t.Any = None) -> TransactionBulkUpdateForm:
+    form = TransactionBulkUpdateForm(formdata)
+    form.group.choices = [("", "<Group>")] + [
+        (str(g.id), g.leader.transaction.name)
+        for g in get_transaction_groups(current_user)
+    ]
+    return form
+
+
 @blueprint.route("/transaction/bulk-update/", methods=["POST"])
 @login_required
 def bulk_update():
-    print("bulk update, returning to URL:")
-    print(request.form["return_url"])
-    form = TransactionBulkUpdateForm(request.form)
+    form = _bulk_update_form(request.form)
     if not form.validate_on_submit():
         flash_errors(form, "danger")
+    elif not form.changes():
+        flash("Nothing to update.", "warning")
     else:
-        do_bulk_transaction_update(form.transactions.data, form.category.data)
+        count = bulk_update_transactions(
+            current_user, form.transactions.data, **form.changes()
+        )
+        flash(f"Updated {count} transactions.", "info")
     return_url = form.return_url.data
     if not return_url:
         return_url = url_for(".home")
@@ -564,11 +683,11 @@ def account_report(account_id: int):
         return render_template(
             "shiso/report.html", account=account, form=form, report=None
         )
-    transactions = get_transactions(
-        account, form.start_date.data, form.end_date.data
-    )
-    report = compute_transaction_report(
-        transactions, form.include_transfer.data
+    report = account_transaction_report(
+        account,
+        form.start_date.data,
+        form.end_date.data,
+        form.include_transfer.data,
     )
     return render_template(
         "shiso/report.html",
@@ -587,37 +706,77 @@ def account_report(account_id: int):
     )
 
 
-@blueprint.route("/transactions/", methods=["GET"])
-@login_required
-def all_account_transactions():
+def _transaction_list_form() -> TransactionListForm:
     accounts = get_linked_accounts(current_user.id)
     form = TransactionListForm()
     form.accounts.choices = [(str(a.id), a.name) for a in accounts]
     form.process(request.args)
+    return form
+
+
+def _transaction_list_filters(form: TransactionListForm) -> t.Dict[str, t.Any]:
+    return {
+        "start_date": form.start_date.data,
+        "end_date": form.end_date.data,
+        "categories": form.category.data,
+        "accounts": list(map(int, form.accounts.data)),
+        "merchant": form.merchant.data,
+        "name": form.name.data,
+        "search": form.search.data,
+    }
+
+
+@blueprint.route("/transactions/", methods=["GET"])
+@login_required
+def all_account_transactions():
+    form = _transaction_list_form()
     if not form.validate():
         flash_errors(form)
         return render_template(
             "shiso/all_transactions.html",
             form=form,
-            upd_form=TransactionBulkUpdateForm(),
+            upd_form=_bulk_update_form(),
             txns=[],
+            export_formats=available_formats(),
         )
-    accounts = list(map(int, form.accounts.data))
-    transactions = get_all_user_transactions(
-        current_user,
-        form.start_date.data,
-        form.end_date.data,
-        categories=form.category.data,
-        accounts=accounts,
-        merchant=form.merchant.data,
-        name=form.name.data,
+    query = transaction_rows(
+        user_transactions_query(current_user, **_transaction_list_filters(form))
     )
-    return render_template(
+    if form.search.data and match_expression(form.search.data):
+        # Search results are ranked rather than paged, see
+        # ranked_search_results().
+        txns = ranked_search_results(query, _view_per_page())
+        page = None
+    else:
+        page = _view_paginate(query)
+        txns = page.transactions
+    return stream_page(
         "shiso/all_transactions.html",
         form=form,
-        upd_form=TransactionBulkUpdateForm(),
-        txns=transactions,
+        upd_form=_bulk_update_form(),
+        txns=txns,
+        page=page,
         review_dest=".global_review_transaction",
+        export_formats=available_formats(),
+    )
+
+
+@blueprint.route("/transactions/export.<fmt>", methods=["GET"])
+@login_required
+def export_transactions(fmt: str):
+    if fmt not in available_formats():
+        abort(404)
+    form = _transaction_list_form()
+    if not form.validate():
+        return {"errors": form.errors}, 400
+    batches = export_rows(current_user, **_transaction_list_filters(form))
+    export = EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(export.write(batches)),
+        mimetype=export.mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=transactions.{fmt}"
+        },
     )
 
 
@@ -640,13 +799,11 @@ def all_account_report():
             form=form,
             report=None,
         )
-    transactions = get_all_user_transactions(
+    report = user_transaction_report(
         current_user,
         form.start_date.data,
         form.end_date.data,
-    )
-    report = compute_transaction_report(
-        transactions, form.include_transfer.data
+        form.include_transfer.data,
     )
     return render_template(
         "shiso/report.html",
@@ -664,6 +821,51 @@ def all_account_report():
     )
 
 
+def _trend_report_form() -> TrendReportForm:
+    today = date.today()
+    start = (today - timedelta(days=730)).replace(day=1)
+    return TrendReportForm(
+        request.args, data={"start_date": start, "end_date": today}
+    )
+
+
+def _compute_trend_report(form: TrendReportForm) -> TrendReport:
+    return compute_trend_report(
+        current_user,
+        form.start_date.data,
+        form.end_date.data,
+        period=TrendPeriod[form.period.data],
+        by_parent=form.by_parent.data,
+        include_transfer=form.include_transfer.data,
+        window=form.window.data,
+    )
+
+
+@blueprint.route("/trend/", methods=["GET"])
+@login_required
+def trend_report():
+    form = _trend_report_form()
+    if not form.validate():
+        flash_errors(form)
+        return render_template("shiso/trend.html", form=form, report=None)
+    return render_template(
+        "shiso/trend.html",
+        form=form,
+        report=_compute_trend_report(form),
+        measure=form.measure.data,
+        view=form.view.data,
+    )
+
+
+@blueprint.route("/trend.json", methods=["GET"])
+@login_required
+def trend_report_json():
+    form = _trend_report_form()
+    if not form.validate():
+        return {"errors": form.errors}, 400
+    return _compute_trend_report(form).to_json()
+
+
 @blueprint.route("/privacy/toggle/", methods=["GET"])
 @login_required
 def privacy_toggle():
@@ -675,7 +877,11 @@ def privacy_toggle():
 @login_required
 def subscription_show(sub_id):
     sub = _view_fetch_subscription(sub_id)
-    sub_txns = get_transactions(sub.account, subscription_id=sub_id)
+    page = _view_paginate(
+        transaction_rows(
+            transactions_query(sub.account, subscription_id=sub_id)
+        )
+    )
     if request.method == "POST":
         action = request.form["action"]
         form = SubscriptionReviewForm(request.form)
@@ -695,12 +901,13 @@ def subscription_show(sub_id):
             flash_errors(form)
     else:
         form = SubscriptionReviewForm(obj=sub)
-    return render_template(
+    return stream_page(
         "shiso/subscription_show.html",
         sub=sub,
-        txns=sub_txns,
+        txns=page.transactions,
+        page=page,
         form=form,
-        upd_form=TransactionBulkUpdateForm(),
+        upd_form=_bulk_update_form(),
     )
 
 
@@ -726,6 +933,67 @@ def subscription_list():
     )
 
 
+def _category_rule_form(formdata: t.Any = None) -> CategoryRuleForm:
+    form = CategoryRuleForm(formdata)
+    form.account.choices = [("", "<Any>")] + [
+        (str(acct.id), acct.name) for acct in all_accounts()
+    ]
+    return form
+
+
+@blueprint.route("/rules/", methods=["GET", "POST"])
+@login_required
+def rule_list():
+    form = _category_rule_form(request.form)
+    if form.validate_on_submit():
+        rule = CategoryRule(user_id=current_user.id)
+        form.populate_rule(rule)
+        db.session.add(rule)
+        db.session.commit()
+        flash(
+            "Rule added. Apply the rules to use it for old transactions.",
+            "success",
+        )
+        return redirect(url_for(".rule_list"))
+    flash_errors(form)
+    return render_template(
+        "shiso/rules.html",
+        rules=get_rules(current_user.id),
+        form=form,
+        apply_form=ApplyRulesForm(),
+        delete_form=GenericReturnForm(),
+    )
+
+
+@blueprint.route("/rules/<int:rule_id>/delete/", methods=["POST"])
+@login_required
+def rule_delete(rule_id: int):
+    rule = db.session.get(CategoryRule, rule_id)
+    if not rule or rule.user_id != current_user.id:
+        abort(404)
+    form = GenericReturnForm(request.form)
+    if form.validate_on_submit():
+        delete_rule(rule)
+        flash("Rule deleted.", "info")
+    return redirect(url_for(".rule_list"))
+
+
+@blueprint.route("/rules/apply/", methods=["POST"])
+@login_required
+def rules_apply():
+    form = ApplyRulesForm(request.form)
+    if form.validate_on_submit():
+        changed, recategorized = apply_category_rules(
+            current_user, form.recategorize.data
+        )
+        flash(
+            f"Rules applied: {changed} transactions changed rule,"
+            f" {recategorized} recategorized.",
+            "info",
+        )
+    return redirect(url_for(".rule_list"))
+
+
 @blueprint.route("/settings/", methods=["GET", "POST"])
 @login_required
 def settings():
@@ -741,24 +1009,56 @@ def settings():
     )
 
 
+def _run_deletion(job: DeletionJob, foreground: bool) -> None:
+    if foreground:
+        run_job(job)
+        print(f"Deletion job {job.id} finished, {job.rows_processed} rows")
+    else:
+        celery.send_task("medb.shiso.tasks.run_deletion_job", args=(job.id,))
+        print(f"Deletion job {job.id} queued")
+
+
 @blueprint.cli.command("delete-account")
 @click.argument("account_id", type=int)
-def clear_data(account_id):
-    dangerous_delete_account(account_id)
+@click.option(
+    "--foreground", is_flag=True, help="Run here instead of in the worker"
+)
+def clear_data(account_id: int, foreground: bool) -> None:
+    account = get_upa_by_id(account_id)
+    assert account
+    _run_deletion(start_deletion(account.item.user, account), foreground)
 
 
 @blueprint.cli.command("delete-all-data")
 @click.argument("user", type=str)
-def clear_user_data(user: str) -> None:
+@click.option(
+    "--foreground", is_flag=True, help="Run here instead of in the worker"
+)
+def clear_user_data(user: str, foreground: bool) -> None:
     u = User.query.filter(User.username == user).one()
-    items = get_plaid_items(u)
-    for item in items:
-        print(f"Deleting item: {item.institution_name}")
-        accounts = list(item.accounts)
-        for account in accounts:
-            dangerous_delete_account(account.id)
-        db.session.delete(item)
-        db.session.commit()
+    _run_deletion(start_deletion(u), foreground)
+
+
+@blueprint.cli.command("deletion-jobs")
+def list_deletion_jobs() -> None:
+    for job in get_unfinished_jobs():
+        target = (
+            f"account {job.account_id}"
+            if job.account_id is not None
+            else "all data"
+        )
+        print(
+            f"{job.id}: {job.user.username}, {target}, stage {job.stage}, "
+            f"{job.rows_processed} rows, updated {job.updated}"
+        )
+
+
+@blueprint.cli.command("resume-deletion")
+@click.argument("job_id", type=int)
+def resume_deletion(job_id: int) -> None:
+    job = db.session.get(DeletionJob, job_id)
+    assert job
+    _run_deletion(job, True)
 
 
 @blueprint.cli.command("reset-item-login")
@@ -774,11 +1074,82 @@ def do_scheduled_sync() -> None:
     scheduled_sync()
 
 
+@blueprint.cli.command("rebuild-summaries")
+def do_rebuild_summaries() -> None:
+    rebuild_summaries()
+
+
+@blueprint.cli.command("rebuild-search")
+def do_rebuild_search() -> None:
+    rebuild_search_index()
+
+
+@blueprint.cli.command("apply-rules")
+@click.argument("user", type=str)
+@click.option(
+    "--recategorize",
+    is_flag=True,
+    help="Also change the category of matching transactions",
+)
+def do_apply_rules(user: str, recategorize: bool) -> None:
+    """Match a user's category rules against all their transactions"""
+    u = User.query.filter(User.username == user).one()
+    changed, recategorized = apply_category_rules(u, recategorize)
+    print(f"{changed} transactions changed rule, {recategorized} recategorized")
+
+
+@blueprint.cli.command("export")
+@click.argument("user", type=str)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(list(EXPORT_FORMATS)),
+    default="csv",
+    show_default=True,
+)
+@click.option("--output", "-o", type=click.File("wb"), default="-")
+@click.option("--start-date", type=click.DateTime(["%Y-%m-%d"]))
+@click.option("--end-date", type=click.DateTime(["%Y-%m-%d"]))
+@click.option("--category", "categories", multiple=True)
+@click.option("--account", "accounts", type=int, multiple=True)
+@click.option("--merchant")
+@click.option("--name")
+@click.option("--search")
+def do_export(
+    user: str,
+    fmt: str,
+    output: t.BinaryIO,
+    start_date: t.Optional[datetime],
+    end_date: t.Optional[datetime],
+    categories: t.Tuple[str, ...],
+    accounts: t.Tuple[int, ...],
+    merchant: t.Optional[str],
+    name: t.Optional[str],
+    search: t.Optional[str],
+) -> None:
+    """Export a user's reviewed transactions"""
+    if fmt not in available_formats():
+        raise click.UsageError(f"The {fmt} format needs pyarrow installed")
+    u = User.query.filter(User.username == user).one()
+    batches = export_rows(
+        u,
+        start_date.date() if start_date else None,
+        end_date.date() if end_date else None,
+        categories=categories,
+        accounts=accounts,
+        merchant=merchant,
+        name=name,
+        search=search,
+    )
+    for chunk in EXPORT_FORMATS[fmt].write(batches):
+        output.write(chunk)
+
+
 @blueprint.app_template_filter("usd")
 def usd(text):
     if session.get("privacy"):
         return Markup("$&mdash;.&mdash;")
-    value = Decimal(text)
+    value = text if isinstance(text, Money) else Decimal(text)
     return f"${value:.2f}"
 
 
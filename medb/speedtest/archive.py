@@ -0,0 +1,199 @@
+"""
+Columnar cold storage for aged-out speedtest data
+
+Rows purged by the retention engine are written as NumPy .npz files, one set of
+column arrays per table and month:
+
+    <dir>/<table>/<YYYY-MM>.npz             compacted month
+    <dir>/<table>/<YYYY-MM>/part-*.npz      batches not yet compacted
+
+Every file has an int64 "id" column and an int64 "time" column (microseconds
+since the epoch, UTC), plus the numeric columns listed in ARCHIVE_COLUMNS and
+the string columns listed in ARCHIVE_STRING_COLUMNS. NULLs are stored as NaN,
+which is why nullable columns are floats.
+
+The purge boundary moves forward a day at a time, so the month it falls in
+gets new parts on every run. Only months entirely before the boundary are
+compacted, so each month file is written once rather than rewritten daily.
+
+At a few bytes per value after compression, years of pings fit in megabytes.
+"""
+
+import datetime
+import typing as t
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy.engine import Row
+
+from .retention import Archiver
+
+ARCHIVE_COLUMNS: t.Dict[str, t.Dict[str, t.Type[np.generic]]] = {
+    "ping_result": {"ping_ms": np.float32, "v6_ping_ms": np.float32},
+    "ping_sample": {"target_id": np.int32, "rtt_us": np.float32},
+    "speedtest_result": {
+        "download_bps": np.int64,
+        "upload_bps": np.int64,
+        "ping_ms": np.float32,
+    },
+    "fast_result": {"download_mbps": np.float32},
+}
+# Stored as fixed-width unicode arrays, which np.load() reads without pickle
+ARCHIVE_STRING_COLUMNS: t.Dict[str, t.List[str]] = {
+    "speedtest_result": ["server_name", "server_id"],
+}
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+Columns = t.Dict[str, np.ndarray]
+
+
+def to_epoch_us(time: datetime.datetime) -> int:
+    return (time - EPOCH) // MICROSECOND
+
+
+def month_key(time: datetime.datetime) -> str:
+    return f"{time.year:04d}-{time.month:02d}"
+
+
+def months_between(
+    start: datetime.datetime, end: datetime.datetime
+) -> t.Iterator[str]:
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def rows_to_columns(table: str, rows: t.Sequence[Row]) -> Columns:
+    columns = {
+        "id": np.array([row.id for row in rows], dtype=np.int64),
+        "time": np.array([to_epoch_us(row.time) for row in rows], np.int64),
+    }
+    for name, dtype in ARCHIVE_COLUMNS[table].items():
+        values = [getattr(row, name) for row in rows]
+        if np.issubdtype(dtype, np.floating):
+            values = [np.nan if v is None else v for v in values]
+        columns[name] = np.array(values, dtype=dtype)
+    for name in ARCHIVE_STRING_COLUMNS.get(table, []):
+        columns[name] = np.array([getattr(row, name) for row in rows], np.str_)
+    return columns
+
+
+def write_npz(path: Path, columns: Columns) -> None:
+    # np.savez appends ".npz" to names without it, so give the temporary
+    # file that suffix too.
+    tmp = path.with_name(f".{path.stem}.tmp.npz")
+    np.savez_compressed(tmp, **columns)
+    tmp.rename(path)
+
+
+def read_npz(path: Path) -> Columns:
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def column_dtypes(table: str) -> t.Dict[str, t.Type[np.generic]]:
+    strings = {name: np.str_ for name in ARCHIVE_STRING_COLUMNS.get(table, [])}
+    return {
+        "id": np.int64,
+        "time": np.int64,
+        **ARCHIVE_COLUMNS[table],
+        **strings,
+    }
+
+
+def get_column(columns: Columns, name: str) -> np.ndarray:
+    if name not in columns:
+        # Files written before string columns were archived don't have them
+        return np.full(len(columns["id"]), "", dtype=np.str_)
+    return columns[name]
+
+
+def concat_columns(table: str, parts: t.List[Columns]) -> Columns:
+    dtypes = column_dtypes(table)
+    if not parts:
+        return {name: np.empty(0, dtype=d) for name, d in dtypes.items()}
+    merged = {
+        name: np.concatenate([get_column(p, name) for p in parts])
+        for name in dtypes
+    }
+    # The same row may be archived twice if a purge was interrupted between
+    # archiving and deleting a batch.
+    _, keep = np.unique(merged["id"], return_index=True)
+    order = keep[np.argsort(merged["time"][keep], kind="stable")]
+    return {name: values[order] for name, values in merged.items()}
+
+
+def columnar_archiver(directory: Path) -> Archiver:
+    """
+    Return an archiver which writes each batch into per-month part files.
+    Call compact_archive() after the purge to merge the closed months.
+    """
+
+    def archive(table: str, rows: t.Sequence[Row]) -> None:
+        if table not in ARCHIVE_COLUMNS:
+            raise ValueError(f"No archive format for table {table}")
+        by_month: t.Dict[str, t.List[Row]] = {}
+        for row in rows:
+            by_month.setdefault(month_key(row.time), []).append(row)
+        for month, month_rows in by_month.items():
+            part_dir = directory / table / month
+            part_dir.mkdir(parents=True, exist_ok=True)
+            name = f"part-{month_rows[0].id}-{month_rows[-1].id}.npz"
+            write_npz(part_dir / name, rows_to_columns(table, month_rows))
+
+    return archive
+
+
+def compact_archive(
+    directory: Path, table: str, boundary: datetime.datetime
+) -> None:
+    """
+    Merge the part files for a table into their compacted month files, for
+    the months before the one containing the purge boundary
+    """
+    table_dir = directory / table
+    if not table_dir.exists():
+        return
+    open_month = month_key(boundary)
+    for part_dir in sorted(p for p in table_dir.iterdir() if p.is_dir()):
+        if part_dir.name >= open_month:
+            continue
+        parts = sorted(part_dir.glob("part-*.npz"))
+        if not parts:
+            continue
+        month_file = table_dir / f"{part_dir.name}.npz"
+        columns = [read_npz(p) for p in parts]
+        if month_file.exists():
+            columns.append(read_npz(month_file))
+        write_npz(month_file, concat_columns(table, columns))
+        for part in parts:
+            part.unlink()
+        if not any(part_dir.iterdir()):
+            part_dir.rmdir()
+
+
+def read_archive(
+    directory: Path,
+    table: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> Columns:
+    """
+    Read all archived rows of a table with start <= time < end
+    """
+    table_dir = directory / table
+    columns = []
+    for month in months_between(start, end):
+        month_file = table_dir / f"{month}.npz"
+        if month_file.exists():
+            columns.append(read_npz(month_file))
+        for part in sorted((table_dir / month).glob("part-*.npz")):
+            columns.append(read_npz(part))
+    merged = concat_columns(table, columns)
+    mask = (merged["time"] >= to_epoch_us(start)) & (
+        merged["time"] < to_epoch_us(end)
+    )
+    return {name: values[mask] for name, values in merged.items()}
@@ -0,0 +1,88 @@
+"""
+Client for looking up our external IPv4 and IPv6 addresses
+"""
+
+import enum
+import ipaddress
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IP6CHECK = "https://ip6only.me/api/"
+IP4CHECK = "https://ip4only.me/api/"
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 5)
+
+
+class IpCheckFailure(enum.Enum):
+    connection = "connection"
+    timeout = "timeout"
+    http = "http"
+    parse = "parse"
+
+
+@dataclass
+class IpCheckOutcome:
+
+    family: str
+    address: t.Optional[str] = None
+    failure: t.Optional[IpCheckFailure] = None
+    detail: str = ""
+
+
+class IpChecker:
+    """
+    Looks up both addresses concurrently, reusing connections between checks
+
+    Each family is checked on its own thread from a shared, keep-alive session,
+    so the whole check takes about one round trip. A failure of one family is
+    classified and reported in its outcome, but never prevents the other
+    family's result from being returned.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def check_one(
+        self,
+        family: str,
+        url: str,
+        kind: str,
+        parse: t.Callable[
+            [str], t.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+        ],
+    ) -> IpCheckOutcome:
+        try:
+            resp = self.session.get(url, timeout=TIMEOUT)
+            resp.raise_for_status()
+        except requests.Timeout as e:
+            return IpCheckOutcome(family, None, IpCheckFailure.timeout, str(e))
+        except requests.ConnectionError as e:
+            return IpCheckOutcome(
+                family, None, IpCheckFailure.connection, str(e)
+            )
+        except requests.RequestException as e:
+            return IpCheckOutcome(family, None, IpCheckFailure.http, str(e))
+        try:
+            got_kind, addr, _ = resp.text.strip().split(",", 2)
+            if got_kind != kind:
+                raise ValueError(f"expected {kind}, got {got_kind}")
+            return IpCheckOutcome(family, parse(addr).exploded)
+        except ValueError as e:
+            return IpCheckOutcome(family, None, IpCheckFailure.parse, str(e))
+
+    def check(self) -> t.Tuple[IpCheckOutcome, IpCheckOutcome]:
+        v4 = self.executor.submit(
+            self.check_one, "v4", IP4CHECK, "IPv4", ipaddress.IPv4Address
+        )
+        v6 = self.executor.submit(
+            self.check_one, "v6", IP6CHECK, "IPv6", ipaddress.IPv6Address
+        )
+        return v4.result(), v6.result()
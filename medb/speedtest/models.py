@@ -2,7 +2,12 @@
 """
 Database models for speedtest
 """
+from datetime import timedelta
+
+from sqlalchemy import Boolean
+from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import Numeric
 from sqlalchemy import String
 
@@ -46,6 +51,26 @@ class IpCheckResult(Model):
     ipv6 = db.Column(String(39), nullable=True)
 
 
+class IpInterval(Model):
+    """
+    A period during which our external addresses stayed the same
+
+    The hourly IP check only inserts a row here when an address changes,
+    otherwise it just bumps last_seen. This replaces IpCheckResult, which got a
+    row every hour regardless.
+    """
+
+    __tablename__ = "ip_interval"
+
+    id = db.Column(Integer, primary_key=True)
+    first_seen = db.Column(TZDateTime(), nullable=False, default=utcnow)
+    last_seen = db.Column(TZDateTime(), nullable=False, default=utcnow)
+    ipv4 = db.Column(String(15), nullable=True)
+    ipv6 = db.Column(String(39), nullable=True)
+
+    __table_args__ = (db.Index("ip_interval__first_seen", "first_seen"),)
+
+
 class PingResult(Model):
     __tablename__ = "ping_result"
 
@@ -57,3 +82,107 @@ class PingResult(Model):
     v6_ping_ms = db.Column(
         Numeric(precision=7, scale=3, asdecimal=False), nullable=True
     )
+
+
+class PingRollup(Model):
+    """
+    Hourly summary of PingResult for one address family
+
+    Rows are updated as each ping arrives, so that stats over long windows
+    never need to read the raw rows. The sketch is an encoded DDSketch of the
+    RTTs in milliseconds, which can be merged across rows to estimate
+    percentiles for any window. Jitter is the mean absolute difference between
+    consecutive replies.
+    """
+
+    __tablename__ = "ping_rollup"
+
+    id = db.Column(Integer, primary_key=True)
+    bucket = db.Column(TZDateTime(), nullable=False)
+    family = db.Column(String(2), nullable=False)
+
+    count = db.Column(Integer, nullable=False, default=0)
+    lost = db.Column(Integer, nullable=False, default=0)
+    sum_us = db.Column(Integer, nullable=False, default=0)
+    last_us = db.Column(Integer, nullable=True)
+    jitter_sum_us = db.Column(Integer, nullable=False, default=0)
+    jitter_count = db.Column(Integer, nullable=False, default=0)
+    sketch = db.Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "family", "bucket", name="ping_rollup__family_bucket__unique"
+        ),
+    )
+
+
+class PingOutage(Model):
+    """
+    A run of consecutive lost pings for one address family
+
+    Loss is recorded here as it happens, one row per run rather than one row
+    per lost ping, so outage history is cheap to query and outlives the raw
+    PingResult rows. While the outage is "ongoing", "end" is the time of the
+    latest lost probe. The first successful ping afterward clears "ongoing" and
+    sets "end" to its own time.
+    """
+
+    __tablename__ = "ping_outage"
+
+    id = db.Column(Integer, primary_key=True)
+    family = db.Column(String(2), nullable=False)
+    start = db.Column(TZDateTime(), nullable=False)
+    end = db.Column(TZDateTime(), nullable=False)
+    probes = db.Column(Integer, nullable=False)
+    ongoing = db.Column(Boolean, nullable=False)
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end - self.start
+
+    __table_args__ = (
+        db.Index("ping_outage__family__start", "family", "start"),
+        db.Index("ping_outage__start", "start"),
+    )
+
+
+class PingTarget(Model):
+    """
+    A host which the ping task monitors
+
+    Targets are rows rather than constants so that new ones (the gateway, an ISP
+    hop, other resolvers) can be added without a schema change. The "primary"
+    targets, at most one per address family, also fill in the PingResult row
+    which backs the overview stats and loss plots.
+    """
+
+    __tablename__ = "ping_target"
+
+    id = db.Column(Integer, primary_key=True)
+    name = db.Column(String, nullable=False)
+    host = db.Column(String(39), nullable=False, unique=True)
+    enabled = db.Column(Boolean, nullable=False, default=True)
+    primary = db.Column(Boolean, nullable=False, default=False)
+
+
+class PingSample(Model):
+    """
+    One ping to one target
+
+    This table gets a row per target every couple of seconds, so it's kept
+    narrow: the RTT is stored as integer microseconds, and NULL means the probe
+    was lost.
+    """
+
+    __tablename__ = "ping_sample"
+
+    id = db.Column(Integer, primary_key=True)
+    time = db.Column(TZDateTime(), nullable=False, default=utcnow)
+    target_id = db.Column(Integer, ForeignKey("ping_target.id"), nullable=False)
+    rtt_us = db.Column(Integer, nullable=True)
+
+    target = db.relationship("PingTarget")
+
+    __table_args__ = (
+        db.Index("ping_sample__target_id__time", "target_id", "time"),
+    )
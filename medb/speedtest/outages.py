@@ -0,0 +1,129 @@
+"""
+Detection and queries for ping outages
+"""
+
+import datetime
+import typing as t
+from dataclasses import dataclass
+
+from medb.extensions import db
+
+from .models import PingOutage
+from .models import PingResult
+
+
+def latest_outage(family: str) -> t.Optional[PingOutage]:
+    return (
+        PingOutage.query.filter(PingOutage.family == family)
+        .order_by(PingOutage.start.desc())
+        .limit(1)
+        .one_or_none()
+    )
+
+
+def update_outage(
+    family: str,
+    time: datetime.datetime,
+    time_ms: t.Optional[float],
+    current: t.Optional[PingOutage],
+) -> t.Optional[PingOutage]:
+    """
+    Apply one probe result to the family's current outage, if any
+
+    Returns the ongoing outage after the probe, or None if there isn't one.
+    """
+    if time_ms is not None:
+        if current is not None:
+            # The outage lasted until this reply, not just until the last lost
+            # probe, or a single lost probe would have no duration at all.
+            current.end = time
+            current.ongoing = False
+        return None
+    if current is not None:
+        current.end = time
+        current.probes += 1
+        return current
+    outage = PingOutage(
+        family=family, start=time, end=time, probes=1, ongoing=True
+    )
+    db.session.add(outage)
+    return outage
+
+
+def record_ping_outages(
+    result: PingResult, families: t.Collection[str] = ("v4", "v6")
+) -> None:
+    """
+    Extend, start or finish outages based on a new PingResult, for the
+    families which were probed. The caller commits.
+    """
+    for family, time_ms in (("v4", result.ping_ms), ("v6", result.v6_ping_ms)):
+        if family not in families:
+            continue
+        current = latest_outage(family)
+        if current is not None and not current.ongoing:
+            current = None
+        update_outage(family, result.time, time_ms, current)
+
+
+def rebuild_outages() -> None:
+    """
+    Recompute outages from the raw PingResult rows which still exist
+
+    Outages which started before the oldest raw row are kept, since there's
+    nothing left to recompute them from. A kept outage which is still ongoing
+    is continued (or finished) by the raw rows.
+    """
+    oldest = db.session.query(db.func.min(PingResult.time)).scalar()
+    if oldest is None:
+        return
+    PingOutage.query.filter(PingOutage.start >= oldest).delete()
+    current: t.Dict[str, t.Optional[PingOutage]] = {}
+    for family in ("v4", "v6"):
+        kept = latest_outage(family)
+        current[family] = kept if kept is not None and kept.ongoing else None
+    query = (
+        db.session.query(
+            PingResult.time, PingResult.ping_ms, PingResult.v6_ping_ms
+        )
+        .order_by(PingResult.time)
+        .yield_per(10000)
+    )
+    for time, ping_ms, v6_ping_ms in query:
+        for family, time_ms in (("v4", ping_ms), ("v6", v6_ping_ms)):
+            current[family] = update_outage(
+                family, time, time_ms, current[family]
+            )
+    db.session.commit()
+
+
+@dataclass
+class OutageStats:
+
+    count: int
+    probes: int
+    total: datetime.timedelta
+    longest: datetime.timedelta
+
+
+def outage_stats(family: str, since: datetime.datetime) -> OutageStats:
+    outages = PingOutage.query.filter(
+        PingOutage.family == family,
+        PingOutage.start >= since,
+    ).all()
+    durations = [o.duration for o in outages]
+    return OutageStats(
+        count=len(outages),
+        probes=sum(o.probes for o in outages),
+        total=sum(durations, datetime.timedelta()),
+        longest=max(durations, default=datetime.timedelta()),
+    )
+
+
+def recent_outages(limit: int = 10, min_probes: int = 2) -> t.List[PingOutage]:
+    return (
+        PingOutage.query.filter(PingOutage.probes >= min_probes)
+        .order_by(PingOutage.start.desc())
+        .limit(limit)
+        .all()
+    )
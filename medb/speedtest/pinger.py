@@ -1,3 +1,4 @@
+import asyncio
 import dataclasses
 import errno
 import ipaddress
@@ -11,10 +12,25 @@ import typing as t
 ICMP_ECHO_HDR = "!BBHHH"
 ECHO_V4 = 8
 ECHO_V6 = 128
+ECHO_REPLY_V4 = 0
+ECHO_REPLY_V6 = 129
 ECHO_DATA = b"Stephen was here.\nhttps://brennan.io\npinging since 2022!"
 assert len(ECHO_DATA) == 56
 
 
+IPAddress = t.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+# Linux values for receive timestamps, which the socket module doesn't export.
+# SCM_TIMESTAMPNS ancillary data is a struct timespec in CLOCK_REALTIME.
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+TIMESPEC = struct.Struct("@ll")
+
+# Errors from sendto() which mean "this target can't be reached right now",
+# rather than a problem with our socket. These count as a lost probe.
+UNREACHABLE_ERRNOS = {errno.ENETUNREACH, errno.EHOSTUNREACH}
+
+
 def make_echo_request(
     ident: int, seqno: int, v6: bool = False, data: t.Optional[bytes] = None
 ) -> bytes:
@@ -28,10 +44,78 @@ def make_echo_request(
     return struct.pack(ICMP_ECHO_HDR, type_, 0, 0, ident, seqno) + data
 
 
+def make_icmp_socket(v6: bool) -> socket.socket:
+    sock = socket.socket(
+        socket.AF_INET6 if v6 else socket.AF_INET,
+        socket.SOCK_DGRAM,
+        socket.IPPROTO_ICMPV6 if v6 else socket.IPPROTO_ICMP,
+    )
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        # No kernel timestamps here, we'll fall back to time.monotonic_ns()
+        pass
+    return sock
+
+
+@dataclasses.dataclass
+class SendTime:
+    """
+    When a probe was sent, on both clocks we may compare against
+
+    Kernel receive timestamps are CLOCK_REALTIME, so we need the realtime send
+    time to compare with them. The monotonic one is for the fallback, and for
+    sanity-checking the kernel's answer in case the wall clock was stepped while
+    the probe was in flight.
+    """
+
+    realtime_ns: int
+    monotonic_ns: int
+
+    @classmethod
+    def now(cls) -> "SendTime":
+        return cls(time.time_ns(), time.monotonic_ns())
+
+    def rtt_ms(
+        self, rx_realtime_ns: t.Optional[int], rx_monotonic_ns: int
+    ) -> float:
+        fallback_ns = rx_monotonic_ns - self.monotonic_ns
+        if rx_realtime_ns is not None:
+            kernel_ns = rx_realtime_ns - self.realtime_ns
+            # The kernel saw the reply before we did, so a legitimate kernel
+            # RTT is never larger than the one we measured ourselves.
+            if 0 <= kernel_ns <= fallback_ns:
+                return kernel_ns / 1_000_000
+        return fallback_ns / 1_000_000
+
+
+def recv_with_timestamp(
+    sock: socket.socket, bufsize: int = 4096
+) -> t.Tuple[bytes, t.Any, t.Optional[int]]:
+    """
+    Receive a datagram along with its kernel receive timestamp, if any
+
+    The timestamp is returned in nanoseconds since the epoch, or None when the
+    kernel didn't attach one.
+    """
+    data, ancdata, _, addr = sock.recvmsg(
+        bufsize, socket.CMSG_SPACE(TIMESPEC.size)
+    )
+    for level, type_, cdata in ancdata:
+        if (
+            level == socket.SOL_SOCKET
+            and type_ == SCM_TIMESTAMPNS
+            and len(cdata) >= TIMESPEC.size
+        ):
+            sec, nsec = TIMESPEC.unpack_from(cdata)
+            return data, addr, sec * 1_000_000_000 + nsec
+    return data, addr, None
+
+
 @dataclasses.dataclass
 class PingResult:
 
-    addr: t.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+    addr: IPAddress
     replied: bool
     time_ms: t.Optional[float]
 
@@ -40,11 +124,7 @@ class Pinger:
     def __init__(self, addr: str):
         self.addr = ipaddress.ip_address(addr)
         self.v6 = self.addr.version == 6
-        self.sock = socket.socket(
-            socket.AF_INET6 if self.v6 else socket.AF_INET,
-            socket.SOCK_DGRAM,
-            socket.IPPROTO_ICMPV6 if self.v6 else socket.IPPROTO_ICMP,
-        )
+        self.sock = make_icmp_socket(self.v6)
         self.ident = random.randrange(0, 0xFFFF)
         self.seqno = 1
 
@@ -52,12 +132,10 @@ class Pinger:
         this_seq = self.seqno
         self.seqno = (self.seqno + 1) % 0x10000
         data = make_echo_request(self.ident, this_seq, self.v6, data)
-        start = time.time()
+        start = SendTime.now()
         try:
-            ret = self.sock.sendto(data, (str(self.addr), 0))
-            print(ret)
+            self.sock.sendto(data, (str(self.addr), 0))
         except OSError as exc:
-            print("ERR")
             if exc.errno == errno.ENETUNREACH:
                 return PingResult(self.addr, False, None)
             raise
@@ -67,10 +145,209 @@ class Pinger:
             raise Exception("error!")
         if not r:
             return PingResult(self.addr, False, None)
-        duration = time.time() - start
-        data, addr = self.sock.recvfrom(4096)
+        data, addr, rx_ns = recv_with_timestamp(self.sock)
+        time_ms = start.rtt_ms(rx_ns, time.monotonic_ns())
         parsed_addr = ipaddress.ip_address(addr[0])
         assert parsed_addr == self.addr
         rtup = struct.unpack(ICMP_ECHO_HDR, data[:8])
         assert rtup[4] == this_seq
-        return PingResult(self.addr, True, duration * 1000)
+        return PingResult(self.addr, True, time_ms)
+
+
+@dataclasses.dataclass
+class TargetStats:
+    """
+    Results of pinging one target some number of times
+    """
+
+    addr: IPAddress
+    sent: int = 0
+    received: int = 0
+    rtts_ms: t.List[float] = dataclasses.field(default_factory=list)
+
+    @property
+    def lost(self) -> int:
+        return self.sent - self.received
+
+    @property
+    def loss(self) -> float:
+        return self.lost / self.sent if self.sent else 0.0
+
+    @property
+    def min_ms(self) -> t.Optional[float]:
+        return min(self.rtts_ms) if self.rtts_ms else None
+
+    @property
+    def avg_ms(self) -> t.Optional[float]:
+        if not self.rtts_ms:
+            return None
+        return sum(self.rtts_ms) / len(self.rtts_ms)
+
+
+class AsyncPinger:
+    """
+    Ping many targets concurrently from a single asyncio event loop.
+
+    Unlike Pinger, which sends one echo and then blocks waiting for its reply,
+    this keeps one socket per address family and can have many probes in flight
+    at once, to any number of targets. Replies are matched back to their probe
+    by (ident, seqno), so a lost packet to one target never delays the others:
+    the whole batch takes roughly one timeout in the worst case.
+
+    For unprivileged ICMP sockets (SOCK_DGRAM), Linux replaces the ident we put
+    in the header with the socket's "port", so we learn the real ident from
+    getsockname() after the first send.
+    """
+
+    def __init__(self):
+        self.seqno = random.randrange(0, 0xFFFF)
+        self.socks: t.Dict[int, socket.socket] = {}
+        self.idents: t.Dict[int, int] = {}
+        self.pending: t.Dict[
+            t.Tuple[int, int, int],
+            t.Tuple[IPAddress, SendTime, asyncio.Future],
+        ] = {}
+        self.readers: t.Set[int] = set()
+        self.active = 0
+
+    def _socket(self, version: int) -> socket.socket:
+        if version not in self.socks:
+            sock = make_icmp_socket(version == 6)
+            sock.setblocking(False)
+            self.socks[version] = sock
+            self.idents[version] = random.randrange(0, 0xFFFF)
+        return self.socks[version]
+
+    def _next_seqno(self) -> int:
+        this_seq = self.seqno
+        self.seqno = (self.seqno + 1) % 0x10000
+        return this_seq
+
+    def _on_readable(self, version: int) -> None:
+        sock = self.socks[version]
+        reply_type = ECHO_REPLY_V6 if version == 6 else ECHO_REPLY_V4
+        while True:
+            try:
+                data, addr, rx_ns = recv_with_timestamp(sock)
+            except (BlockingIOError, InterruptedError):
+                return
+            now = time.monotonic_ns()
+            if len(data) < 8:
+                continue
+            type_, _, _, ident, seqno = struct.unpack(ICMP_ECHO_HDR, data[:8])
+            if type_ != reply_type:
+                continue
+            key = (version, ident, seqno)
+            entry = self.pending.get(key)
+            if entry is None:
+                # A reply that arrived after its timeout, or a duplicate.
+                continue
+            target, start, fut = entry
+            if ipaddress.ip_address(addr[0]) != target:
+                continue
+            del self.pending[key]
+            if not fut.done():
+                fut.set_result(start.rtt_ms(rx_ns, now))
+
+    def _attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        for version, sock in self.socks.items():
+            if version not in self.readers:
+                loop.add_reader(sock.fileno(), self._on_readable, version)
+                self.readers.add(version)
+        self.active += 1
+
+    def _detach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.active -= 1
+        if self.active == 0:
+            for version in self.readers:
+                loop.remove_reader(self.socks[version].fileno())
+            self.readers.clear()
+
+    async def _probe(
+        self, addr: IPAddress, timeout: float, data: t.Optional[bytes]
+    ) -> t.Optional[float]:
+        loop = asyncio.get_running_loop()
+        sock = self.socks[addr.version]
+        seqno = self._next_seqno()
+        packet = make_echo_request(
+            self.idents[addr.version], seqno, addr.version == 6, data
+        )
+        start = SendTime.now()
+        try:
+            await loop.sock_sendto(sock, packet, (str(addr), 0))
+        except OSError as exc:
+            if exc.errno in UNREACHABLE_ERRNOS:
+                return None
+            raise
+        if sock.type == socket.SOCK_DGRAM:
+            self.idents[addr.version] = sock.getsockname()[1]
+        key = (addr.version, self.idents[addr.version], seqno)
+        fut = loop.create_future()
+        self.pending[key] = (addr, start, fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending.pop(key, None)
+
+    async def _ping_target(
+        self,
+        stats: TargetStats,
+        count: int,
+        interval: float,
+        timeout: float,
+        data: t.Optional[bytes],
+    ) -> None:
+        probes = []
+        for i in range(count):
+            if i:
+                await asyncio.sleep(interval)
+            stats.sent += 1
+            probes.append(
+                asyncio.ensure_future(self._probe(stats.addr, timeout, data))
+            )
+        for time_ms in await asyncio.gather(*probes):
+            if time_ms is not None:
+                stats.received += 1
+                stats.rtts_ms.append(time_ms)
+
+    async def ping(
+        self,
+        targets: t.Iterable[str],
+        count: int = 1,
+        interval: float = 0.0,
+        timeout: float = 1.0,
+        data: t.Optional[bytes] = None,
+    ) -> t.Dict[str, TargetStats]:
+        """
+        Ping each target "count" times, returning stats keyed by target
+
+        Probes to a single target are spaced by "interval" seconds, but all
+        targets are pinged concurrently, and each probe waits at most "timeout"
+        seconds for its reply, independently of every other probe.
+        """
+        results = {
+            target: TargetStats(ipaddress.ip_address(target))
+            for target in targets
+        }
+        for stats in results.values():
+            self._socket(stats.addr.version)
+        loop = asyncio.get_running_loop()
+        self._attach(loop)
+        try:
+            await asyncio.gather(
+                *(
+                    self._ping_target(stats, count, interval, timeout, data)
+                    for stats in results.values()
+                )
+            )
+        finally:
+            self._detach(loop)
+        return results
+
+    def ping_sync(
+        self, targets: t.Iterable[str], **kwargs: t.Any
+    ) -> t.Dict[str, TargetStats]:
+        """Run ping() on a fresh event loop, for use outside of asyncio"""
+        return asyncio.run(self.ping(targets, **kwargs))
@@ -0,0 +1,78 @@
+"""
+Read speedtest time series regardless of where the rows live
+
+Recent rows are in the database, while anything older than the retention
+period may have been moved to the columnar archive. load_series() reads both
+for the requested window and returns a single DataFrame, so plots and stats
+over long ranges don't need to care where the boundary is.
+"""
+
+import datetime
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from medb.database import Model
+from medb.model_util import utcnow
+from medb.settings import SPEEDTEST_ARCHIVE_DIR
+
+from .archive import ARCHIVE_COLUMNS
+from .archive import read_archive
+from .loader import Columns
+from .loader import load_columns
+from .loader import to_frame
+
+
+def load_hot(
+    model: t.Type[Model],
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> Columns:
+    table = model.__table__
+    dtypes = {"id": np.int64, **ARCHIVE_COLUMNS[table.name]}
+    return load_columns(table, "time", dtypes, start, end)
+
+
+def load_cold(
+    model: t.Type[Model],
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> Columns:
+    columns = read_archive(
+        SPEEDTEST_ARCHIVE_DIR, model.__tablename__, start, end
+    )
+    # The archive keeps microseconds
+    columns["time"] = columns["time"] // 1000
+    return columns
+
+
+def merge(cold: Columns, hot: Columns) -> Columns:
+    merged = {name: np.concatenate([cold[name], hot[name]]) for name in hot}
+    # Rows are archived before they're deleted, so a purge that was
+    # interrupted can leave a row in both places.
+    _, keep = np.unique(merged["id"], return_index=True)
+    order = keep[np.argsort(merged["time"][keep], kind="stable")]
+    return {name: values[order] for name, values in merged.items()}
+
+
+def load_series(
+    model: t.Type[Model],
+    start: datetime.datetime,
+    end: t.Optional[datetime.datetime] = None,
+    local: bool = False,
+) -> pd.DataFrame:
+    """
+    Return rows of model with start <= time < end, ordered by time
+
+    The frame has the id, the time and the numeric columns that are kept in
+    the archive. Times are UTC, or naive local times if local is set. Missing
+    values are NaN.
+    """
+    end = end or utcnow()
+    columns = load_hot(model, start, end)
+    if SPEEDTEST_ARCHIVE_DIR:
+        cold = load_cold(model, start, end)
+        if len(cold["id"]):
+            columns = merge(cold, columns)
+    return to_frame(columns, local)
@@ -0,0 +1,144 @@
+"""
+Retention engine for the high-volume speedtest tables
+
+Purging old pings with one big DELETE holds the SQLite write lock for the whole
+purge, which blocks the ping task (which writes every two seconds). Instead, we
+delete in bounded batches, each in its own short transaction, with a pause in
+between so other writers get a turn. Purged rows can optionally be archived first
+(see the archive module). Afterward, freed pages are returned to the filesystem
+and the planner statistics are refreshed.
+"""
+
+import datetime
+import logging
+import time
+import typing as t
+
+import sqlalchemy
+from sqlalchemy.engine import Row
+
+from medb.database import Model
+from medb.extensions import db
+
+BATCH_SIZE = 5000
+BATCH_PAUSE = 0.1
+
+# Free pages to release per transaction. Each batch holds the write lock only
+# briefly, like a batch of the purge.
+VACUUM_PAGES = 2000
+# Rows of each index which ANALYZE samples, so refreshing the statistics of a
+# big table doesn't hold the write lock for a scan of the whole thing
+ANALYSIS_LIMIT = 1000
+
+Archiver = t.Callable[[str, t.Sequence[Row]], None]
+
+
+def purge_before(
+    model: t.Type[Model],
+    boundary: datetime.datetime,
+    archive: t.Optional[Archiver] = None,
+    batch_size: int = BATCH_SIZE,
+    pause: float = BATCH_PAUSE,
+) -> int:
+    """
+    Delete rows of model with time <= boundary, a batch at a time
+
+    Each batch is archived (if an archiver is given) before it is deleted, and
+    committed before the next batch starts. Returns the number of rows deleted.
+    """
+    table = model.__table__
+    total = 0
+    while True:
+        rows = db.session.execute(
+            sqlalchemy.select(table)
+            .where(table.c.time <= boundary)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        if archive is not None:
+            archive(table.name, rows)
+        db.session.execute(
+            sqlalchemy.delete(table).where(
+                table.c.id.in_([row.id for row in rows])
+            )
+        )
+        db.session.commit()
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+    logging.info("Purged %d rows from %s", total, table.name)
+    return total
+
+
+def is_sqlite() -> bool:
+    return db.engine.dialect.name == "sqlite"
+
+
+def reclaim_space(
+    models: t.Iterable[t.Type[Model]],
+    pages: int = VACUUM_PAGES,
+    pause: float = BATCH_PAUSE,
+) -> None:
+    """
+    Release free pages to the filesystem and refresh planner statistics
+
+    Freed pages can only be released incrementally when the database uses
+    auto_vacuum=INCREMENTAL. Switching to that mode needs a one-time full
+    VACUUM, see enable_incremental_vacuum(). Pages are released a batch at a
+    time, each in its own transaction, with a pause in between.
+
+    Statistics are refreshed afterward, one table per transaction, from a
+    sample of ANALYSIS_LIMIT rows per index rather than a full scan.
+    """
+    if not is_sqlite():
+        return
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode != 2:
+            logging.warning(
+                "auto_vacuum is not INCREMENTAL, %d free pages not released",
+                free,
+            )
+            free = 0
+        released = 0
+        while free:
+            batch = min(free, pages)
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                # The sqlite3 module only steps a statement which returns no
+                # rows once, and incremental_vacuum releases one page per
+                # step, whatever its argument. So it's run once per page.
+                for _ in range(batch):
+                    conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+                conn.exec_driver_sql("COMMIT")
+            except Exception:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            released += batch
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if free:
+                time.sleep(pause)
+        if released:
+            logging.info("Released %d free pages", released)
+
+        conn.exec_driver_sql(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        for model in models:
+            conn.exec_driver_sql(f'ANALYZE "{model.__tablename__}"')
+
+
+def enable_incremental_vacuum() -> None:
+    """
+    Switch the database to auto_vacuum=INCREMENTAL. This runs a full VACUUM,
+    which locks the database for a while, so it's only done on request.
+    """
+    if not is_sqlite():
+        return
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
@@ -0,0 +1,148 @@
+"""
+Maintenance and queries for the hourly ping rollup tier
+"""
+
+import datetime
+import typing as t
+from dataclasses import dataclass
+
+from medb.extensions import db
+
+from .models import PingResult
+from .models import PingRollup
+from .sketch import DDSketch
+
+
+def bucket_for(time: datetime.datetime) -> datetime.datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+def get_rollup(family: str, bucket: datetime.datetime) -> PingRollup:
+    row = PingRollup.query.filter(
+        PingRollup.family == family,
+        PingRollup.bucket == bucket,
+    ).one_or_none()
+    if row is None:
+        row = PingRollup(
+            family=family,
+            bucket=bucket,
+            count=0,
+            lost=0,
+            sum_us=0,
+            jitter_sum_us=0,
+            jitter_count=0,
+            sketch=DDSketch().encode(),
+        )
+        db.session.add(row)
+    return row
+
+
+def add_to_rollup(
+    row: PingRollup,
+    times_ms: t.Iterable[t.Optional[float]],
+) -> None:
+    """
+    Add a sequence of consecutive samples (None for a lost ping) to a rollup
+    """
+    sketch = DDSketch.decode(row.sketch)
+    for time_ms in times_ms:
+        row.count += 1
+        if time_ms is None:
+            row.lost += 1
+            continue
+        rtt_us = round(time_ms * 1000)
+        sketch.add(time_ms)
+        row.sum_us += rtt_us
+        if row.last_us is not None:
+            row.jitter_sum_us += abs(rtt_us - row.last_us)
+            row.jitter_count += 1
+        row.last_us = rtt_us
+    row.sketch = sketch.encode()
+
+
+def record_ping_rollup(
+    result: PingResult, families: t.Collection[str] = ("v4", "v6")
+) -> None:
+    """
+    Fold a new PingResult into the rollups of the families which were probed.
+    The caller commits.
+    """
+    bucket = bucket_for(result.time)
+    if "v4" in families:
+        add_to_rollup(get_rollup("v4", bucket), [result.ping_ms])
+    if "v6" in families:
+        add_to_rollup(get_rollup("v6", bucket), [result.v6_ping_ms])
+
+
+def rebuild_rollups() -> None:
+    """
+    Recompute rollups from the raw PingResult rows which still exist
+
+    Rollups for the hours before the oldest raw row are kept, since they're all
+    that's left of the purged pings.
+    """
+    oldest = db.session.query(db.func.min(PingResult.time)).scalar()
+    if oldest is None:
+        return
+    PingRollup.query.filter(PingRollup.bucket >= bucket_for(oldest)).delete()
+    query = (
+        db.session.query(
+            PingResult.time, PingResult.ping_ms, PingResult.v6_ping_ms
+        )
+        .order_by(PingResult.time)
+        .yield_per(10000)
+    )
+    # Rows come back in time order, so gather one bucket's worth of samples
+    # at a time and fold them in all at once.
+    bucket = None
+    samples: t.Dict[str, t.List[t.Optional[float]]] = {}
+    for time, ping_ms, v6_ping_ms in query:
+        if bucket_for(time) != bucket:
+            for family, times_ms in samples.items():
+                add_to_rollup(get_rollup(family, bucket), times_ms)
+            bucket = bucket_for(time)
+            samples = {"v4": [], "v6": []}
+        samples["v4"].append(ping_ms)
+        samples["v6"].append(v6_ping_ms)
+    for family, times_ms in samples.items():
+        add_to_rollup(get_rollup(family, bucket), times_ms)
+    db.session.commit()
+
+
+@dataclass
+class LatencyPercentiles:
+
+    p50: t.Optional[float]
+    p95: t.Optional[float]
+    p99: t.Optional[float]
+    jitter: t.Optional[float]
+
+
+def latency_percentiles(
+    family: str,
+    since: datetime.datetime,
+    until: t.Optional[datetime.datetime] = None,
+) -> LatencyPercentiles:
+    """
+    Merge the rollups for a window into percentiles and jitter (all in ms)
+
+    The window is widened to whole hours, since that's what the rollups hold.
+    """
+    query = PingRollup.query.filter(
+        PingRollup.family == family,
+        PingRollup.bucket >= bucket_for(since),
+    )
+    if until is not None:
+        query = query.filter(PingRollup.bucket < until)
+    sketch = DDSketch()
+    jitter_sum_us = jitter_count = 0
+    for row in query:
+        sketch.merge(DDSketch.decode(row.sketch))
+        jitter_sum_us += row.jitter_sum_us
+        jitter_count += row.jitter_count
+    return LatencyPercentiles(
+        p50=sketch.quantile(0.50),
+        p95=sketch.quantile(0.95),
+        p99=sketch.quantile(0.99),
+        jitter=jitter_sum_us / jitter_count / 1000 if jitter_count else None,
+    )
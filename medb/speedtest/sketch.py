@@ -0,0 +1,98 @@
+"""
+A small, mergeable quantile sketch for latency data
+
+This is a DDSketch (Masson, Rim & Lee, "DDSketch: A Fast and Fully-Mergeable
+Quantile Sketch with Relative-Error Guarantees", VLDB 2019). Values are counted
+into logarithmically sized buckets, so any quantile it returns is within a fixed
+relative error of the true one. Two sketches merge by adding their bucket
+counts, which means an hourly sketch can be stored once and combined with others
+to answer questions about any window.
+
+Latency values here are milliseconds. With the default 1% accuracy, everything
+from a microsecond to a minute fits in about 450 buckets, though in practice a
+link only ever fills a few dozen of them.
+"""
+
+import math
+import struct
+import typing as t
+
+DEFAULT_ACCURACY = 0.01
+
+# Values this small (in ms) are counted as zero.
+MIN_VALUE = 1e-3
+
+# Encoding: a header of (relative accuracy, zero count, number of buckets),
+# followed by (bucket index, count) pairs.
+HEADER = struct.Struct("!fII")
+BUCKET = struct.Struct("!hI")
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.zero_count = 0
+        self.buckets: t.Dict[int, int] = {}
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> t.Optional[float]:
+        """
+        Return the approximate q-quantile (0 <= q <= 1), or None when empty
+        """
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # The midpoint of the bucket (in the relative sense), which is
+                # where the accuracy guarantee comes from.
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return None  # unreachable
+
+    def encode(self) -> bytes:
+        parts = [
+            HEADER.pack(
+                self.relative_accuracy, self.zero_count, len(self.buckets)
+            )
+        ]
+        for index in sorted(self.buckets):
+            parts.append(BUCKET.pack(index, self.buckets[index]))
+        return b"".join(parts)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "DDSketch":
+        accuracy, zero_count, num_buckets = HEADER.unpack_from(data)
+        # The accuracy was stored as a 32-bit float, round it back to what we
+        # were created with so that gamma matches exactly when merging.
+        sketch = cls(round(accuracy, 6))
+        sketch.zero_count = zero_count
+        for i in range(num_buckets):
+            index, count = BUCKET.unpack_from(
+                data, HEADER.size + i * BUCKET.size
+            )
+            sketch.buckets[index] = count
+        return sketch
@@ -8,28 +8,34 @@ import json
 import logging
 import subprocess
 import time
+import typing as t
 from datetime import timedelta
 from pathlib import Path
 
-import requests
-
 from medb.extensions import celery
 from medb.extensions import db
 from medb.model_util import utcnow
+from medb.settings import SPEEDTEST_ARCHIVE_DIR
 
+from .archive import columnar_archiver
+from .archive import compact_archive
+from .ipcheck import IpChecker
 from .models import FastResult
-from .models import IpCheckResult
+from .models import IpInterval
 from .models import PingResult
+from .models import PingSample
+from .models import PingTarget
 from .models import SpeedTestResult
-from .pinger import Pinger
-
-IP6CHECK = "https://ip6only.me/api/"
-IP4CHECK = "https://ip4only.me/api/"
+from .outages import record_ping_outages
+from .pinger import AsyncPinger
+from .retention import purge_before
+from .retention import reclaim_space
+from .rollup import record_ping_rollup
 
-# Both are cloudflare DNS servers, I don't feel bad about the traffic.
-PING_HOST = "1.1.1.1"
-PING_V6_HOST = "2606:4700:4700::64"
 PING_RETENTION_DAYS = 60
+# Speed tests are few, so they stay in the database much longer, and are only
+# ever purged when there's an archive to move them to.
+SPEEDTEST_RETENTION_DAYS = 365
 
 
 def perform_speedtest_net():
@@ -139,61 +145,111 @@ def perform_speedtest():
     perform_fast_com()
 
 
+@functools.lru_cache(maxsize=1)
+def get_ip_checker():
+    return IpChecker()
+
+
 @celery.task
 def ipcheck():
     logging.info("Starting ip check")
-    try:
-        resp4 = requests.get(IP4CHECK, timeout=10)
-        kind, addr, rest = resp4.text.strip().split(",", 2)
-        assert kind == "IPv4"
-        ipv4_addr = ipaddress.IPv4Address(addr).exploded
-    except TimeoutError:
-        logging.warn("IPv4 check timed out!")
-        ipv4_addr = None
-
-    try:
-        resp6 = requests.get(IP6CHECK, timeout=10)
-        kind, addr, rest = resp6.text.strip().split(",", 2)
-        assert kind == "IPv6"
-        ipv6_addr = ipaddress.IPv6Address(addr).exploded
-    except TimeoutError:
-        logging.warn("IPv6 check timed out!")
-        ipv6_addr = None
-
-    row = IpCheckResult(
-        ipv4=ipv4_addr,
-        ipv6=ipv6_addr,
-    )
-    logging.info(
-        "IP Check: v4=%s, v6=%s",
-        ipv4_addr,
-        ipv6_addr,
+    v4, v6 = get_ip_checker().check()
+    for outcome in (v4, v6):
+        if outcome.failure:
+            logging.warning(
+                "IP%s check failed (%s): %s",
+                outcome.family,
+                outcome.failure.value,
+                outcome.detail,
+            )
+    logging.info("IP Check: v4=%s, v6=%s", v4.address, v6.address)
+    if v4.failure and v6.failure:
+        return
+    record_ip_addresses(v4.address, v6.address)
+
+
+def record_ip_addresses(ipv4: t.Optional[str], ipv6: t.Optional[str]) -> None:
+    """
+    Extend the current IP interval, or start a new one if an address changed
+
+    None means the check for that family failed. The address from the current
+    interval is carried forward, so a transient failure doesn't look like two
+    address changes.
+    """
+    now = utcnow()
+    current = (
+        IpInterval.query.order_by(IpInterval.first_seen.desc())
+        .limit(1)
+        .one_or_none()
     )
-    db.session.add(row)
+    if current:
+        ipv4 = ipv4 or current.ipv4
+        ipv6 = ipv6 or current.ipv6
+    if current and current.ipv4 == ipv4 and current.ipv6 == ipv6:
+        current.last_seen = now
+    else:
+        db.session.add(
+            IpInterval(first_seen=now, last_seen=now, ipv4=ipv4, ipv6=ipv6)
+        )
     db.session.commit()
 
 
 @functools.lru_cache(maxsize=1)
 def get_pinger():
-    return Pinger(PING_HOST)
+    return AsyncPinger()
 
 
-@functools.lru_cache(maxsize=1)
-def get_v6_pinger():
-    return Pinger(PING_V6_HOST)
+def get_ping_targets() -> list[PingTarget]:
+    return PingTarget.query.filter(PingTarget.enabled).all()
 
 
 @celery.task
 def ping():
-    result = get_pinger().ping()
-    result_v6 = get_v6_pinger().ping()
-    row = PingResult(ping_ms=result.time_ms, v6_ping_ms=result_v6.time_ms)
+    targets = get_ping_targets()
+    # All targets are pinged concurrently, so a lost packet to one of them
+    # doesn't delay the others by the full timeout.
+    results = get_pinger().ping_sync([target.host for target in targets])
+    now = utcnow()
+    row = PingResult(time=now)
+    # Families without an enabled primary target weren't probed, so their
+    # NULL in the PingResult row mustn't be counted as a lost ping.
+    families = set()
+    for target in targets:
+        time_ms = results[target.host].min_ms
+        rtt_us = round(time_ms * 1000) if time_ms is not None else None
+        db.session.add(PingSample(time=now, target_id=target.id, rtt_us=rtt_us))
+        if target.primary:
+            if ipaddress.ip_address(target.host).version == 6:
+                row.v6_ping_ms = time_ms
+                families.add("v6")
+            else:
+                row.ping_ms = time_ms
+                families.add("v4")
     db.session.add(row)
+    record_ping_rollup(row, families)
+    record_ping_outages(row, families)
     db.session.commit()
 
 
 @celery.task
 def cleanup_ping_history():
-    boundary = utcnow() - timedelta(days=PING_RETENTION_DAYS)
-    PingResult.query.where(PingResult.time <= boundary).delete()
-    db.session.commit()
+    now = utcnow()
+    purges = [
+        (PingResult, now - timedelta(days=PING_RETENTION_DAYS)),
+        (PingSample, now - timedelta(days=PING_RETENTION_DAYS)),
+    ]
+    archive = None
+    if SPEEDTEST_ARCHIVE_DIR:
+        archive = columnar_archiver(SPEEDTEST_ARCHIVE_DIR)
+        speedtest_boundary = now - timedelta(days=SPEEDTEST_RETENTION_DAYS)
+        purges += [
+            (SpeedTestResult, speedtest_boundary),
+            (FastResult, speedtest_boundary),
+        ]
+    for model, boundary in purges:
+        purge_before(model, boundary, archive=archive)
+        if archive:
+            compact_archive(
+                SPEEDTEST_ARCHIVE_DIR, model.__tablename__, boundary
+            )
+    reclaim_space([model for model, _ in purges])
@@ -2,28 +2,42 @@
 """Views for speed testing"""
 import datetime
 import io
+import ipaddress
+import typing as t
 from dataclasses import dataclass
 from datetime import timedelta
 
+import click
 import matplotlib.pyplot
 import matplotlib.style
-import pandas as pd
+import numpy as np
 from flask import Blueprint
 from flask import make_response
 from flask import render_template
+from flask import request
 from flask_login import login_required
-from sqlalchemy.orm import Query
-from sqlalchemy.orm import aliased
-from sqlalchemy.sql import or_
-from sqlalchemy.sql import select
 
 from medb.extensions import db
 from medb.model_util import utcnow
 
+from .loader import load_columns
+from .loader import to_frame
 from .models import FastResult
-from .models import IpCheckResult
+from .models import IpInterval
 from .models import PingResult
+from .models import PingRollup
+from .models import PingSample
+from .models import PingTarget
 from .models import SpeedTestResult
+from .outages import OutageStats
+from .outages import outage_stats
+from .outages import rebuild_outages
+from .outages import recent_outages
+from .query import load_series
+from .retention import enable_incremental_vacuum
+from .rollup import LatencyPercentiles
+from .rollup import latency_percentiles
+from .rollup import rebuild_rollups
 
 matplotlib.use("agg")
 matplotlib.style.use("ggplot")
@@ -37,10 +51,6 @@ blueprint = Blueprint(
 )
 
 
-def sql_to_df(query: Query) -> pd.DataFrame:
-    return pd.read_sql(query.statement, db.session.connection())
-
-
 @dataclass
 class SpeedtestSummary:
 
@@ -122,27 +132,8 @@ def fast_stats() -> FastSummary:
     return FastSummary(**kwargs)
 
 
-def ip_history() -> list[IpCheckResult]:
-    c1 = aliased(IpCheckResult)
-    c2 = aliased(IpCheckResult)
-    first = (
-        db.session.query(IpCheckResult)
-        .order_by(IpCheckResult.id)
-        .limit(1)
-        .one()
-    )
-    query = (
-        select(c2)
-        .where(
-            or_(
-                c2.ipv4 != c1.ipv4,
-                c2.ipv6 != c1.ipv6,
-            )
-        )
-        .join_from(c2, c1, c1.id + 1 == c2.id)
-    )
-    rows = db.session.execute(query)
-    return [first] + [r[0] for r in rows]
+def ip_history() -> list[IpInterval]:
+    return IpInterval.query.order_by(IpInterval.first_seen).all()
 
 
 @dataclass
@@ -152,20 +143,32 @@ class PingSummary:
 
     avg_v4_1day: float
     lost_v4_1day: int
+    pct_v4_1day: LatencyPercentiles
     avg_v6_1day: float
     lost_v6_1day: int
+    pct_v6_1day: LatencyPercentiles
+    outages_v4_1day: OutageStats
+    outages_v6_1day: OutageStats
     count_1day: int
 
     avg_v4_7day: float
     lost_v4_7day: int
+    pct_v4_7day: LatencyPercentiles
     avg_v6_7day: float
     lost_v6_7day: int
+    pct_v6_7day: LatencyPercentiles
+    outages_v4_7day: OutageStats
+    outages_v6_7day: OutageStats
     count_7day: int
 
     avg_v4_30day: float
     lost_v4_30day: int
+    pct_v4_30day: LatencyPercentiles
     avg_v6_30day: float
     lost_v6_30day: int
+    pct_v6_30day: LatencyPercentiles
+    outages_v4_30day: OutageStats
+    outages_v6_30day: OutageStats
     count_30day: int
 
 
@@ -211,6 +214,10 @@ def ping_results():
             .one()
         )
         kwargs[f"lost_v6_{days}day"] = res.num
+        kwargs[f"pct_v4_{days}day"] = latency_percentiles("v4", since)
+        kwargs[f"pct_v6_{days}day"] = latency_percentiles("v6", since)
+        kwargs[f"outages_v4_{days}day"] = outage_stats("v4", since)
+        kwargs[f"outages_v6_{days}day"] = outage_stats("v6", since)
 
     agg_days(1)
     agg_days(7)
@@ -218,6 +225,57 @@ def ping_results():
     return PingSummary(**kwargs)
 
 
+@dataclass
+class PingTargetSummary:
+
+    target: PingTarget
+
+    avg_ms_1day: t.Optional[float] = None
+    lost_1day: int = 0
+    count_1day: int = 0
+
+    avg_ms_7day: t.Optional[float] = None
+    lost_7day: int = 0
+    count_7day: int = 0
+
+    avg_ms_30day: t.Optional[float] = None
+    lost_30day: int = 0
+    count_30day: int = 0
+
+
+def ping_target_results() -> list[PingTargetSummary]:
+    targets = PingTarget.query.order_by(PingTarget.id).all()
+    summaries = {target.id: PingTargetSummary(target) for target in targets}
+
+    def agg_days(days):
+        start = utcnow()
+        since = start - timedelta(days)
+        rows = (
+            db.session.query(
+                PingSample.target_id,
+                db.func.avg(PingSample.rtt_us).label("avg_rtt_us"),
+                db.func.count(PingSample.rtt_us).label("num_replies"),
+                db.func.count("*").label("num_pings"),
+            )
+            .filter(
+                PingSample.time >= since,
+                PingSample.time < start,
+            )
+            .group_by(PingSample.target_id)
+        )
+        for row in rows:
+            summary = summaries[row.target_id]
+            if row.avg_rtt_us is not None:
+                setattr(summary, f"avg_ms_{days}day", row.avg_rtt_us / 1000)
+            setattr(summary, f"lost_{days}day", row.num_pings - row.num_replies)
+            setattr(summary, f"count_{days}day", row.num_pings)
+
+    agg_days(1)
+    agg_days(7)
+    agg_days(30)
+    return list(summaries.values())
+
+
 def figure_response(figure):
     bio = io.BytesIO()
     figure.savefig(bio, format="png")
@@ -226,24 +284,12 @@ def figure_response(figure):
     return resp
 
 
-def fix_tz(df, col="time"):
-    local_tz = datetime.datetime.now().astimezone().tzinfo
-    # This bizarre line is due to the following:
-    # 1. We store times in the database as UTC, but want to present them in the
-    #    local timezone.
-    # 2. Pandas somehow doesn't support timezone aware datetimes
-    # So, we convert from UTC to the local time, and then strip the timezone off
-    # of it. This results in the timezone "looking" correct in the plot.
-    df[col] = df[col].dt.tz_convert(local_tz).dt.tz_localize(None)
-
-
 @blueprint.route("/plot/speedtest.png", methods=["GET"])
 @login_required
 def plot_speedtest_png():
-    oldest = utcnow() - datetime.timedelta(days=60)
-    query = SpeedTestResult.query.filter(SpeedTestResult.time >= oldest)
-    df = sql_to_df(query)
-    fix_tz(df)
+    days = request.args.get("days", 60, type=int)
+    start = utcnow() - timedelta(days=days)
+    df = load_series(SpeedTestResult, start, local=True)
     df = df.set_index("time")
     df["Upload (Mbps)"] = df["upload_bps"] / 1000000.0
     df["Download (Mbps)"] = df["download_bps"] / 1000000.0
@@ -256,10 +302,9 @@ def plot_speedtest_png():
 @blueprint.route("/plot/fast.png", methods=["GET"])
 @login_required
 def plot_fast_png():
-    oldest = utcnow() - datetime.timedelta(days=60)
-    query = FastResult.query.filter(FastResult.time >= oldest)
-    df = sql_to_df(query)
-    fix_tz(df)
+    days = request.args.get("days", 60, type=int)
+    start = utcnow() - timedelta(days=days)
+    df = load_series(FastResult, start, local=True)
     df = df.set_index("time")
     df = df.rename(columns={"download_mbps": "Download (Mbps)"})
     ax = df[["Download (Mbps)"]].plot(style="o")
@@ -268,30 +313,34 @@ def plot_fast_png():
     return figure_response(ax.figure)
 
 
-def dropped_pings_plot(field, sample="1H"):
+def dropped_pings_plot(family):
+    # The hourly rollups already hold probe and loss counts, so there's no
+    # need to resample the raw rows.
     oldest = utcnow() - datetime.timedelta(days=2)
-    query = PingResult.query.filter(PingResult.time >= oldest)
-    df = sql_to_df(query)
-    fix_tz(df)
-    df = df.set_index("time")
+    columns = load_columns(
+        PingRollup.__table__,
+        "bucket",
+        {"count": np.int64, "lost": np.int64},
+        oldest,
+        utcnow(),
+        PingRollup.family == family,
+    )
+    df = to_frame(columns, local=True).set_index("time")
     fig, ax = matplotlib.pyplot.subplots()
-    series = df[field]
-    lost = series.isna().resample(sample).sum()
-    not_lost = series.resample("1H").count()
-    (100 * lost / (lost + not_lost)).plot(ax=ax)
+    (100 * df["lost"] / df["count"]).plot(ax=ax)
     return figure_response(ax.figure)
 
 
 @blueprint.route("/plot/ping4.png", methods=["GET"])
 @login_required
 def plot_ping4():
-    return dropped_pings_plot("ping_ms")
+    return dropped_pings_plot("v4")
 
 
 @blueprint.route("/plot/ping6.png", methods=["GET"])
 @login_required
 def plot_ping6():
-    return dropped_pings_plot("v6_ping_ms")
+    return dropped_pings_plot("v6")
 
 
 @blueprint.route("/results/", methods=["GET"])
@@ -303,6 +352,8 @@ def speedtest_results():
         ping=ping_results(),
         fast=fast_stats(),
         iphist=ip_history(),
+        targets=ping_target_results(),
+        outages=recent_outages(),
     )
 
 
@@ -312,3 +363,65 @@ def maybe_format(fmt, arg):
         return fmt % arg
     else:
         return "None"
+
+
+@blueprint.cli.command("add-ping-target")
+@click.argument("name", type=str)
+@click.argument("host", type=str)
+@click.option(
+    "--primary", is_flag=True, help="Use for the PingResult overview stats"
+)
+def add_ping_target(name: str, host: str, primary: bool) -> None:
+    addr = ipaddress.ip_address(host)
+    if primary:
+        # Only one primary target per address family
+        for target in PingTarget.query.filter(PingTarget.primary):
+            if ipaddress.ip_address(target.host).version == addr.version:
+                target.primary = False
+    db.session.add(PingTarget(name=name, host=str(addr), primary=primary))
+    db.session.commit()
+
+
+@blueprint.cli.command("list-ping-targets")
+def list_ping_targets() -> None:
+    for target in PingTarget.query.order_by(PingTarget.id):
+        flags = []
+        if target.primary:
+            flags.append("primary")
+        if not target.enabled:
+            flags.append("disabled")
+        print(f"{target.id}: {target.name} ({target.host}) {' '.join(flags)}")
+
+
+def get_ping_target(target_id: int) -> PingTarget:
+    target = db.session.get(PingTarget, target_id)
+    if target is None:
+        raise click.BadParameter(f"No ping target with id {target_id}")
+    return target
+
+
+@blueprint.cli.command("enable-ping-target")
+@click.argument("target_id", type=int)
+def enable_ping_target(target_id: int) -> None:
+    get_ping_target(target_id).update(enabled=True)
+
+
+@blueprint.cli.command("disable-ping-target")
+@click.argument("target_id", type=int)
+def disable_ping_target(target_id: int) -> None:
+    get_ping_target(target_id).update(enabled=False)
+
+
+@blueprint.cli.command("rebuild-ping-rollups")
+def rebuild_ping_rollups() -> None:
+    rebuild_rollups()
+
+
+@blueprint.cli.command("rebuild-ping-outages")
+def rebuild_ping_outages() -> None:
+    rebuild_outages()
+
+
+@blueprint.cli.command("enable-incremental-vacuum")
+def do_enable_incremental_vacuum() -> None:
+    enable_incremental_vacuum()
@@ -1,25 +1,24 @@
 # -*- coding: utf-8 -*-
 """Helper utilities and decorators."""
 import typing as t
-from email.message import EmailMessage
-from smtplib import SMTP_SSL
 
+from flask import Response
 from flask import flash
+from flask import get_flashed_messages
 from flask import render_template
+from flask import stream_template
+from flask_wtf.csrf import generate_csrf
 
-from medb.settings import SMTP_PASS
-from medb.settings import SMTP_PORT
-from medb.settings import SMTP_SENDER
-from medb.settings import SMTP_SERVER
+from medb.mail.outbox import queue_email
 
 
 def send_email(subject: str, to: str, tmpl: str, **data: t.Any) -> None:
     """
-    Send an email using the configured SMTP server
+    Queue an email to be sent by the delivery task (see medb/mail/outbox.py)
 
     Be a good email sender and send a MIME multipart/alternative message with
     both text and HTML. The body of the message is provided by templates, one
-    for text and one for HTML.
+    for text and one for HTML, which are rendered right away.
 
     :param subject: subject line of message
     :param to: recipient of message
@@ -29,17 +28,7 @@ def send_email(subject: str, to: str, tmpl: str, **data: t.Any) -> None:
     """
     html = render_template(f"{tmpl}.html", **data)
     text = render_template(f"{tmpl}.txt", **data)
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = SMTP_SENDER
-    msg["To"] = to
-    msg.set_content(text)
-    msg.add_alternative(html, subtype="html")
-
-    with SMTP_SSL(host=SMTP_SERVER, port=SMTP_PORT) as smtp:
-        smtp.login(SMTP_SENDER, SMTP_PASS)
-        smtp.send_message(msg)
+    queue_email(subject, to, text, html)
 
 
 def flash_errors(form, category="warning"):
@@ -47,3 +36,40 @@ def flash_errors(form, category="warning"):
     for field, errors in form.errors.items():
         for error in errors:
             flash(f"{getattr(form, field).label.text} - {error}", category)
+
+
+# Streamed pages are sent in chunks of roughly this many characters
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _buffered(chunks: t.Iterable[str], size: int) -> t.Iterator[str]:
+    buf: t.List[str] = []
+    length = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buf)
+            buf.clear()
+            length = 0
+    if buf:
+        yield "".join(buf)
+
+
+def stream_page(template: str, **context: t.Any) -> Response:
+    """
+    Render a template into a response as it is sent
+
+    The first bytes go out as soon as the top of the page is rendered, so
+    templates which loop over lazily loaded rows get a constant time to first
+    byte and never hold the whole page in memory.
+
+    The session is saved before the body is rendered, so anything a template
+    would store in it (popped flash messages, a new CSRF token) is done here,
+    up front. Jinja's output is joined into larger chunks, rather than
+    writing out every tiny fragment separately.
+    """
+    get_flashed_messages()
+    generate_csrf()
+    chunks = stream_template(template, **context)
+    return Response(_buffered(chunks, STREAM_CHUNK_SIZE))
@@ -0,0 +1,115 @@
+"""Add transaction search index
+
+Revision ID: 62738216143d
+Revises: 1b9f5c9b47bc
+Create Date: 2026-10-19 13:34:38.628508
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "62738216143d"
+down_revision = "1b9f5c9b47bc"
+branch_labels = None
+depends_on = None
+
+TRIGGERS = [
+    "transaction_search__txn_insert",
+    "transaction_search__txn_update",
+    "transaction_search__txn_delete",
+    "transaction_search__review_insert",
+    "transaction_search__review_update",
+    "transaction_search__review_delete",
+]
+
+
+def upgrade():
+    # The same statements as medb.shiso.search.SEARCH_DDL, copied so that this
+    # migration doesn't change along with it.
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE transaction_search USING fts5(
+            name, merchant, notes,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__txn_insert
+        AFTER INSERT ON user_plaid_transaction BEGIN
+            INSERT INTO transaction_search (rowid, name, merchant, notes)
+            VALUES (
+                new.id, new.name, coalesce(new.plaid_merchant_name, ''), ''
+            );
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__txn_update
+        AFTER UPDATE OF name, plaid_merchant_name ON user_plaid_transaction
+        BEGIN
+            UPDATE transaction_search
+            SET name = new.name, merchant = coalesce(new.plaid_merchant_name, '')
+            WHERE rowid = new.id;
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__txn_delete
+        AFTER DELETE ON user_plaid_transaction BEGIN
+            DELETE FROM transaction_search WHERE rowid = old.id;
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__review_insert
+        AFTER INSERT ON transaction_review BEGIN
+            UPDATE transaction_search SET notes = coalesce(new.notes, '')
+            WHERE rowid = new.transaction_id;
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__review_update
+        AFTER UPDATE OF notes, transaction_id ON transaction_review BEGIN
+            UPDATE transaction_search SET notes = ''
+            WHERE rowid = old.transaction_id;
+            UPDATE transaction_search SET notes = coalesce(new.notes, '')
+            WHERE rowid = new.transaction_id;
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER transaction_search__review_delete
+        AFTER DELETE ON transaction_review BEGIN
+            UPDATE transaction_search SET notes = ''
+            WHERE rowid = old.transaction_id;
+        END
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO transaction_search (rowid, name, merchant, notes)
+        SELECT
+            t.id,
+            t.name,
+            coalesce(t.plaid_merchant_name, ''),
+            coalesce(r.notes, '')
+        FROM user_plaid_transaction t
+        LEFT JOIN transaction_review r ON r.transaction_id = t.id
+        """
+    )
+
+
+def downgrade():
+    for trigger in TRIGGERS:
+        op.execute(f"DROP TRIGGER {trigger}")
+    op.execute("DROP TABLE transaction_search")
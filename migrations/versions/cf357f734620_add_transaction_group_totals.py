@@ -0,0 +1,72 @@
+"""Add transaction group totals
+
+Revision ID: cf357f734620
+Revises: b95199d2c27c
+Create Date: 2026-10-19 14:01:27.974995
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from medb.model_util import SafeNumeric
+
+# revision identifiers, used by Alembic.
+revision = "cf357f734620"
+down_revision = "b95199d2c27c"
+branch_labels = None
+depends_on = None
+
+TOTALS = ["amount", "share", "reimbursement_amount", "other_reimbursement"]
+
+
+def upgrade():
+    with op.batch_alter_table("transaction_group", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "member_count", sa.Integer(), server_default="0", nullable=False
+            )
+        )
+        for name in TOTALS:
+            batch_op.add_column(
+                sa.Column(
+                    name,
+                    SafeNumeric(16, 3),
+                    server_default="0",
+                    nullable=False,
+                )
+            )
+
+    # Fill in the totals of the existing groups. SafeNumeric columns are
+    # integers in SQLite, so they can be summed as they are.
+    op.execute(
+        """
+        UPDATE transaction_group SET (
+            member_count, amount, share, reimbursement_amount,
+            other_reimbursement
+        ) = (
+            SELECT
+                count(t.id),
+                coalesce(sum(t.amount), 0),
+                coalesce(
+                    sum(
+                        t.amount - r.reimbursement_amount
+                        - r.other_reimbursement
+                    ),
+                    0
+                ),
+                coalesce(sum(r.reimbursement_amount), 0),
+                coalesce(sum(r.other_reimbursement), 0)
+            FROM transaction_review r
+            JOIN user_plaid_transaction t ON t.id = r.transaction_id
+            WHERE r.group_id = transaction_group.id
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("transaction_group", schema=None) as batch_op:
+        for name in reversed(TOTALS):
+            batch_op.drop_column(name)
+        batch_op.drop_column("member_count")